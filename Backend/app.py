@@ -1,5 +1,5 @@
 
-from flask import Flask, jsonify, request, Response
+from flask import Flask, jsonify, request
 from flask_cors import CORS
 from flask_talisman import Talisman
 from dotenv import load_dotenv
@@ -27,6 +27,13 @@ sys.path.insert(0, str(Path(__file__).resolve().parent))
 
 from services.NotificationService.notification_service import get_demo_notifications
 from services.NotificationService.notification_engine import notification_engine
+from services.NotificationService.pipeline import notification_pipeline
+from services.NotificationService.notification_hub import notification_hub
+from services.Shared.async_runtime import run_async, on_shutdown
+from services.Shared.llm_registry import get_llm_stats
+from services.Shared.generation_cache import get_generation_cache
+from services.Shared.leader_lease import create_leader_lease
+from services.Shared.sse import sse_response, token_events, get_stream_stats, push_response
 from flask_apscheduler import APScheduler
 from werkzeug.utils import secure_filename
 import pandas as pd
@@ -45,26 +52,48 @@ init_firebase()
 scheduler = APScheduler()
 app.config['SCHEDULER_API_ENABLED'] = True
 scheduler.init_app(app)
+
+# Jobs over shared state run only in the worker holding the lease (see
+# services/Shared/leader_lease.py), so they run once per interval, not once per
+# worker. Per-worker housekeeping (e.g. purging this worker's advisor sessions)
+# is not listed here and runs in every worker.
+SHARED_JOBS = ('generate_notifications_job',)
+
+def _set_shared_jobs(running):
+    for job_id in SHARED_JOBS:
+        if running:
+            scheduler.resume_job(job_id)
+        else:
+            scheduler.pause_job(job_id)
+
+scheduler_lease = create_leader_lease(
+    "scheduler",
+    get_db=firebase_admin.firestore.client,
+    on_acquire=lambda: _set_shared_jobs(True),
+    on_lose=lambda: _set_shared_jobs(False),
+)
 scheduler.start()
 
 # Scheduled Job: Runs every 30 minutes to generate notifications for active users
 @scheduler.task('interval', id='generate_notifications_job', minutes=30)
 def scheduled_notification_generation():
     with app.app_context():
+        if not scheduler_lease.is_leader:
+            print("[SCHEDULER] Lease held by another worker, skipping notification generation")
+            return
         print("[SCHEDULER] Starting scheduled notification generation...")
         try:
-           db = firebase_admin.firestore.client()
-           users = db.collection('users').limit(20).stream() # Limit for verified performance
-           for user in users:
-               # asyncio.run(notification_engine.generate_notifications_for_user(user.id))
-               # Note: In synchronous Flask context without async loop, we might need a wrapper or run sync
-               # For now, we'll keep it simple or use a helper if needed. 
-               # Since `generate_notifications_for_user` is async, we need a runner.
-               import asyncio
-               asyncio.run(notification_engine.generate_notifications_for_user(user.id))
+            # Pages through all users, fetching shared weather/news once per group
+            # (see services/NotificationService/pipeline.py); runs on the shared event loop.
+            # Stops between pages if this worker loses the lease mid-run.
+            run_async(notification_pipeline.run(keep_running=lambda: scheduler_lease.is_leader))
         except Exception as e:
             print(f"[SCHEDULER] Error: {e}")
 
+# Shared jobs wait until this worker holds the lease
+_set_shared_jobs(False)
+scheduler_lease.start()
+
 
 @app.route('/ping')
 def ping():
@@ -80,7 +109,7 @@ if os.getenv('FLASK_ENV') == 'development':
     CORS(app, resources={r"/api/*": {
         "origins": "*",
         "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"],
-        "allow_headers": ["Content-Type", "Authorization"],
+        "allow_headers": ["Content-Type", "Authorization", "Last-Event-ID"],
         "supports_credentials": False  # Must be False when origins='*'
     }})
 else:
@@ -88,7 +117,7 @@ else:
     CORS(app, resources={r"/api/*": {
         "origins": allowed_origins,
         "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"],
-        "allow_headers": ["Content-Type", "Authorization"],
+        "allow_headers": ["Content-Type", "Authorization", "Last-Event-ID"],
         "supports_credentials": True
     }})
 
@@ -105,6 +134,7 @@ BASE_DIR = Path(__file__).resolve().parent
 UPLOAD_FOLDER = str(BASE_DIR / 'uploads')
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'bmp'}
 MAX_FILE_SIZE = 16 * 1024 * 1024  # 16MB
+MAX_BATCH_IMAGES = int(os.getenv('DISEASE_BATCH_UPLOAD_MAX', '32'))
 
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = MAX_FILE_SIZE
@@ -115,7 +145,7 @@ DISEASE_DETECTOR_DIR = Path(__file__).resolve().parent / 'services' / 'DiseaseDe
 if str(DISEASE_DETECTOR_DIR) not in sys.path:
     sys.path.append(str(DISEASE_DETECTOR_DIR))
 
-from disease_detector import predict as detector_predict, init_model as detector_init
+from disease_detector import predict as detector_predict, predict_batch as detector_predict_batch, init_model as detector_init, get_runtime_info as detector_runtime_info
 
 # We will lazy-load the model to speed up server boot
 _disease_model_loaded = False
@@ -142,9 +172,12 @@ if str(PEST_DETECTOR_DIR) not in sys.path:
     sys.path.append(str(PEST_DETECTOR_DIR))
 
 try:
-    from pest_detector import predict as pest_predict, init_model as pest_init
-    # We will lazy load the pest detection model
+    from pest_detector import predict as pest_predict, init_model as pest_init, get_backend_info as pest_backend_info
+    from pest_detector import warm_up_async as pest_warm_up
+    # The pest model loads lazily on the first request; PEST_WARMUP=true loads it in the background instead
     _pest_model_loaded = False
+    if os.getenv("PEST_WARMUP", "false").lower() == "true":
+        pest_warm_up()
 except Exception as e:
     print(f"Warning: Pest detection model imports failed: {e}")
     print("   The /api/pest/detect endpoint will return errors until dependencies are available.")
@@ -156,7 +189,19 @@ if str(BUSINESS_ADVISOR_DIR) not in sys.path:
     sys.path.append(str(BUSINESS_ADVISOR_DIR))
 
 from krishi_chatbot import KrishiSahAIAdvisor, FarmerProfile
-advisor_sessions = {}
+from session_store import create_session_store
+advisor_sessions = create_session_store()
+
+# Scheduled Job: Drop idle advisor sessions from memory and the session backend.
+# Not in SHARED_JOBS: every worker has its own live sessions to purge.
+@scheduler.task('interval', id='purge_advisor_sessions_job', minutes=15)
+def scheduled_session_purge():
+    try:
+        removed = advisor_sessions.purge_expired()
+        if removed:
+            print(f"[ADVISOR] Purged {removed} expired sessions")
+    except Exception as e:
+        print(f"[ADVISOR] Session purge error: {e}")
 
 # --- Waste To Value Setup ---
 WASTE_TO_VALUE_DIR = Path(__file__).resolve().parent / 'services' / 'WasteToValue' / 'src'
@@ -217,14 +262,15 @@ def get_disease_info(crop_name, disease_name):
         print(f"Error getting disease info: {e}")
     return None
 
-def predict_disease(image_path):
+def predict_disease(image):
+    """`image` may be an upload stream, bytes, decoded array or (fallback) a file path."""
     global _disease_model_loaded
     try:
         if not _disease_model_loaded:
             print("Lazy loading Disease Detection model...")
             detector_init()
             _disease_model_loaded = True
-        return detector_predict(image_path)
+        return detector_predict(image)
     except Exception as e:
         print(f"Error in prediction: {e}")
         return {
@@ -234,19 +280,55 @@ def predict_disease(image_path):
             'severity': 'low'
         }
 
+def predict_disease_batch(images):
+    global _disease_model_loaded
+    if not _disease_model_loaded:
+        print("Lazy loading Disease Detection model...")
+        detector_init()
+        _disease_model_loaded = True
+    return detector_predict_batch(images)
+
+def build_disease_response(result):
+    """Attach treatment/pathogen info from the CSV to a raw detector result"""
+    disease_info = get_disease_info(result['crop'], result['disease'])
+    
+    treatment = []
+    if disease_info:
+        if disease_info['home_remedy'] and disease_info['home_remedy'] != 'N/A':
+            treatment.append(disease_info['home_remedy'])
+        if disease_info['chemical_recommendation'] and disease_info['chemical_recommendation'] != 'N/A':
+            treatment.append(f"Chemical: {disease_info['chemical_recommendation']}")
+    else:
+        treatment = ['Remove affected leaves', 'Apply fungicide']
+    
+    return {
+        'crop': result['crop'],
+        'disease': result['disease'],
+        'severity': result['severity'],
+        'confidence': result['confidence'],
+        'treatment': treatment,
+        'pathogen': disease_info['pathogen'] if disease_info else None
+    }
+
 @app.route('/api/health')
 def health_check():
     health_data = {'status': 'online'}
     
-    # 1. GPU Check
+    # 1. GPU Check (only if TensorFlow is already loaded; lightweight runtimes never import it)
     try:
-        import tensorflow as tf
-        gpus = tf.config.list_physical_devices('GPU')
-        health_data['gpu'] = {
-            'available': len(gpus) > 0,
-            'count': len(gpus),
-            'devices': [g.name for g in gpus]
-        }
+        if 'tensorflow' in sys.modules:
+            tf = sys.modules['tensorflow']
+            gpus = tf.config.list_physical_devices('GPU')
+            health_data['gpu'] = {
+                'available': len(gpus) > 0,
+                'count': len(gpus),
+                'devices': [g.name for g in gpus]
+            }
+        else:
+            health_data['gpu'] = {'available': False, 'count': 0, 'note': 'TensorFlow not loaded'}
+        health_data['disease_runtime'] = detector_runtime_info()
+        if pest_predict is not None:
+            health_data['pest_backend'] = pest_backend_info()
     except Exception as e:
         health_data['gpu'] = {'error': str(e)}
 
@@ -273,6 +355,61 @@ def health_check():
     except Exception as e:
          health_data['memory'] = str(e)
 
+    # 4. Advisor session store
+    try:
+        health_data['advisor_sessions'] = advisor_sessions.stats()
+    except Exception as e:
+        health_data['advisor_sessions'] = {'error': str(e)}
+
+    # 5. Shared LLM clients (per-role concurrency)
+    try:
+        health_data['llm'] = get_llm_stats()
+    except Exception as e:
+        health_data['llm'] = {'error': str(e)}
+
+    # 6. Generation cache (recommendations, waste analysis, farm health)
+    try:
+        health_data['generation_cache'] = get_generation_cache().stats()
+    except Exception as e:
+        health_data['generation_cache'] = {'error': str(e)}
+
+    # 7. Farm health analysis (queue wait, in-flight, coalesced requests)
+    if health_engine is not None:
+        try:
+            health_data['farm_health'] = health_engine.stats()
+        except Exception as e:
+            health_data['farm_health'] = {'error': str(e)}
+
+    # 8. Streaming routes (completed vs cancelled by client disconnect)
+    try:
+        health_data['streams'] = get_stream_stats()
+    except Exception as e:
+        health_data['streams'] = {'error': str(e)}
+
+    # 9. Scheduled notification pipeline (throughput, dedupe ratio, stage timings)
+    try:
+        health_data['notification_pipeline'] = notification_pipeline.stats()
+    except Exception as e:
+        health_data['notification_pipeline'] = {'error': str(e)}
+
+    # 10. Notification store (read cache hits, pending write-behind)
+    try:
+        health_data['notification_store'] = notification_engine.store.stats()
+    except Exception as e:
+        health_data['notification_store'] = {'error': str(e)}
+
+    # 11. Notification push connections (subscribers, frames vs heartbeats)
+    try:
+        health_data['notification_stream'] = notification_hub.stats()
+    except Exception as e:
+        health_data['notification_stream'] = {'error': str(e)}
+
+    # 12. Scheduler lease (which worker runs scheduled jobs, failovers)
+    try:
+        health_data['scheduler'] = scheduler_lease.stats()
+    except Exception as e:
+        health_data['scheduler'] = {'error': str(e)}
+
     return jsonify(health_data)
 
 # --- Disease Detector Routes ---
@@ -289,37 +426,15 @@ def detect_disease():
             return jsonify({'error': 'Invalid file type'}), 400
         
         filename = secure_filename(file.filename)
-        image_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(image_path)
         
         print(f"[SCAN] Request received: {filename}")
-        result = predict_disease(image_path)
+        # Decode straight from the upload stream, no temp file on disk
+        result = predict_disease(file.stream)
         print(f"[SCAN] Result: {result.get('disease')} ({int(result.get('confidence',0)*100)}%)")
         
-        disease_info = get_disease_info(result['crop'], result['disease'])
-        
-        treatment = []
-        if disease_info:
-            if disease_info['home_remedy'] and disease_info['home_remedy'] != 'N/A':
-                treatment.append(disease_info['home_remedy'])
-            if disease_info['chemical_recommendation'] and disease_info['chemical_recommendation'] != 'N/A':
-                treatment.append(f"Chemical: {disease_info['chemical_recommendation']}")
-        else:
-            treatment = ['Remove affected leaves', 'Apply fungicide']
-            
-        try: os.remove(image_path)
-        except: pass
-        
         return jsonify({
             'success': True,
-            'result': {
-                'crop': result['crop'],
-                'disease': result['disease'],
-                'severity': result['severity'],
-                'confidence': result['confidence'],
-                'treatment': treatment,
-                'pathogen': disease_info['pathogen'] if disease_info else None
-            }
+            'result': build_disease_response(result)
         })
     except Exception as e:
         print(f"[SCAN] Error: {e}")
@@ -327,6 +442,36 @@ def detect_disease():
         traceback.print_exc()
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/disease/detect-batch', methods=['POST'])
+@require_auth
+def detect_disease_batch():
+    try:
+        files = request.files.getlist('images')
+        if not files:
+            return jsonify({'error': 'No image files provided'}), 400
+        if len(files) > MAX_BATCH_IMAGES:
+            return jsonify({'error': f'Too many images (max {MAX_BATCH_IMAGES})'}), 400
+        
+        results = [None] * len(files)
+        streams, positions = [], []
+        for i, file in enumerate(files):
+            if file.filename == '' or not allowed_file(file.filename):
+                results[i] = {'filename': file.filename, 'error': 'Invalid file type'}
+            else:
+                streams.append(file.stream)
+                positions.append(i)
+        
+        print(f"[SCAN] Batch request received: {len(files)} images ({len(streams)} valid)")
+        for pos, result in zip(positions, predict_disease_batch(streams)):
+            results[pos] = {'filename': secure_filename(files[pos].filename), **build_disease_response(result)}
+        
+        return jsonify({'success': True, 'results': results, 'count': len(results)})
+    except Exception as e:
+        print(f"[SCAN] Batch Error: {e}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({'error': str(e)}), 500
+
 # --- Pest Detector Routes ---
 @app.route('/api/pest/detect', methods=['POST'])
 @require_auth
@@ -350,16 +495,12 @@ def detect_pest():
             return jsonify({'error': 'Invalid file type'}), 400
         
         filename = secure_filename(file.filename)
-        image_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(image_path)
         
         print(f"[PEST] Request received: {filename}")
-        result = pest_predict(image_path)
+        # Decode straight from the upload stream, no temp file on disk
+        result = pest_predict(file.stream)
         print(f"[PEST] Result: {result.get('pest_name')} ({int(result.get('confidence',0)*100)}%)")
         
-        try: os.remove(image_path)
-        except: pass
-        
         return jsonify({
             'success': True,
             'result': {
@@ -431,9 +572,8 @@ def init_advisor():
             farm_name=data.get('farm_name')
         )
         
-        session_id = str(uuid.uuid4())
         advisor = KrishiSahAIAdvisor(profile)
-        advisor_sessions[session_id] = advisor
+        session_id = advisor_sessions.create(advisor)
         
         try:
             recommendations = advisor.generate_recommendations()
@@ -462,14 +602,15 @@ def chat_advisor_api():
         session_id = data.get('session_id')
         message = data.get('message')
         
-        if not session_id or session_id not in advisor_sessions:
+        advisor = advisor_sessions.get(session_id)
+        if advisor is None:
             return jsonify({'error': 'Invalid session_id'}), 404
         if not message:
             return jsonify({'error': 'message is required'}), 400
             
-        advisor = advisor_sessions[session_id]
         print(f"[ADVISOR] Chat -> Input: \"{message[:50]}...\"")
         response = advisor.chat(message, language=data.get('language'))
+        advisor_sessions.save(session_id, advisor)
         print(f"[ADVISOR] Success -> Output: \"{response[:50]}...\" ({len(response)} chars)")
         
         return jsonify({'success': True, 'response': response})
@@ -487,28 +628,25 @@ def chat_advisor_stream():
         session_id = data.get('session_id')
         message = data.get('message')
         
-        if not session_id or session_id not in advisor_sessions:
+        advisor = advisor_sessions.get(session_id)
+        if advisor is None:
             return jsonify({'error': 'Invalid session_id'}), 400
         if not message:
             return jsonify({'error': 'message is required'}), 400
             
-        advisor = advisor_sessions[session_id]
         print(f"[ADVISOR] Stream Chat -> Input: \"{message[:50]}...\"")
 
-        def generate():
-            try:
-                for chunk in advisor.stream_chat(message, language=data.get('language')):
-                    yield f"data: {json.dumps({'chunk': chunk})}\n\n"
-                print(f"[ADVISOR] Stream completed for session {session_id[:8]}...")
-            except Exception as e:
-                print(f"[ADVISOR] Generator Error: {e}")
-                yield f"data: {json.dumps({'error': str(e)})}\n\n"
-        
-        response = Response(generate(), mimetype='text/event-stream')
-        response.headers['Cache-Control'] = 'no-cache'
-        response.headers['X-Accel-Buffering'] = 'no'
-        response.headers['Connection'] = 'keep-alive'
-        return response
+        def on_close():
+            # Also persists a partial answer kept after a client disconnect
+            advisor_sessions.save(session_id, advisor)
+            print(f"[ADVISOR] Stream closed for session {session_id[:8]}...")
+
+        return sse_response(
+            'advisor',
+            token_events(advisor.stream_chat(message, language=data.get('language'))),
+            token_budget=getattr(advisor.llm, 'num_predict', None),
+            on_close=on_close,
+        )
     except Exception as e:
         print(f"[ADVISOR] Stream Chat Error: {e}")
         return jsonify({'error': str(e)}), 500
@@ -520,10 +658,10 @@ def generate_chat_title():
         data = request.json
         session_id = data.get('session_id')
         
-        if not session_id or session_id not in advisor_sessions:
+        advisor = advisor_sessions.get(session_id)
+        if advisor is None:
             return jsonify({'error': 'Invalid session_id'}), 404
             
-        advisor = advisor_sessions[session_id]
         print(f"[ADVISOR] Generating smart title for session {session_id[:8]}...")
         title = advisor.generate_title()
         print(f"[ADVISOR] Smart Title: \"{title}\"")
@@ -543,12 +681,12 @@ def integrated_advice():
         
         if not session_id: 
             return jsonify({'error': 'session_id is required'}), 400
-        if session_id not in advisor_sessions: 
+        advisor = advisor_sessions.get(session_id)
+        if advisor is None: 
             return jsonify({'error': 'Invalid session_id'}), 404
         if not disease_result: 
             return jsonify({'error': 'disease_result is required'}), 400
         
-        advisor = advisor_sessions[session_id]
         crop = disease_result.get('crop', 'Unknown')
         disease = disease_result.get('disease', 'Unknown')
         severity = disease_result.get('severity', 'medium')
@@ -557,6 +695,7 @@ def integrated_advice():
         print(f"[ADVISOR] Integrated Advice -> Disease: {disease} on {crop}")
         
         response = advisor.chat(context_message, language=data.get('language'))
+        advisor_sessions.save(session_id, advisor)
         print(f"[ADVISOR] Integrated Advice Success")
         
         return jsonify({
@@ -636,19 +775,11 @@ def chat_waste_stream():
         if waste_engine is None:
             return jsonify({'error': 'Waste-to-Value service is currently unavailable.'}), 503
         
-        def generate():
-            try:
-                for chunk in waste_engine.stream_chat_waste(context, question, language):
-                    yield f"data: {json.dumps({'chunk': chunk})}\n\n"
-            except Exception as e:
-                print(f"[WASTE] Generator Error: {e}")
-                yield f"data: {json.dumps({'error': str(e)})}\n\n"
-        
-        response = Response(generate(), mimetype='text/event-stream')
-        response.headers['Cache-Control'] = 'no-cache'
-        response.headers['X-Accel-Buffering'] = 'no'
-        response.headers['Connection'] = 'keep-alive'
-        return response
+        return sse_response(
+            'waste_chat',
+            token_events(waste_engine.stream_chat_waste(context, question, language)),
+            token_budget=waste_engine.chat_llm.num_predict,
+        )
     except Exception as e:
         print(f"[WASTE] Stream Chat Error: {e}")
         return jsonify({'error': str(e)}), 500
@@ -700,19 +831,11 @@ def chat_health_stream():
         if health_engine is None:
             return jsonify({'error': 'Farm Health AI service is currently unavailable.'}), 503
             
-        def generate():
-            try:
-                for chunk in health_engine.stream_chat_health(context, question, language):
-                    yield f"data: {json.dumps({'chunk': chunk})}\n\n"
-            except Exception as e:
-                print(f"[FARM_HEALTH] Generator Error: {e}")
-                yield f"data: {json.dumps({'error': str(e)})}\n\n"
-                
-        response = Response(generate(), mimetype='text/event-stream')
-        response.headers['Cache-Control'] = 'no-cache'
-        response.headers['X-Accel-Buffering'] = 'no'
-        response.headers['Connection'] = 'keep-alive'
-        return response
+        return sse_response(
+            'farm_health_chat',
+            token_events(health_engine.stream_chat_health(context, question, language)),
+            token_budget=health_engine.chat_llm.num_predict,
+        )
     except Exception as e:
         print(f"[FARM_HEALTH] Stream Chat Error: {e}")
         return jsonify({'error': str(e)}), 500
@@ -755,6 +878,36 @@ def generate_roadmap():
         return jsonify({'error': str(e)}), 500
 
 
+@app.route('/api/generate-roadmap/stream', methods=['POST'])
+@require_auth
+def generate_roadmap_stream():
+    """SSE variant of /api/generate-roadmap: token, section and year events, then the full roadmap."""
+    try:
+        data = request.json
+        user_id = request.user.get('uid')
+
+        if not user_id and os.getenv("FLASK_ENV") == "development":
+             user_id = data.get('user_id', 'test_user')
+
+        business_name = data.get('business_name') or data.get('selected_business_name')
+        language = data.get('language', 'en')
+
+        if not business_name:
+            return jsonify({'error': 'Business name is required'}), 400
+
+        print(f"[ROADMAP] Streaming for User: {user_id}, Business: {business_name}, Language: {language}")
+
+        return sse_response(
+            'roadmap',
+            roadmap_generator.stream_roadmap(user_id, business_name, language),
+            error_event=lambda e: {'type': 'error', 'error': str(e)},
+        )
+
+    except Exception as e:
+        print(f"[ROADMAP] Stream Error: {e}")
+        return jsonify({'error': str(e)}), 500
+
+
 @app.route('/api/generate-crop-roadmap', methods=['POST'])
 @require_auth
 def generate_crop_roadmap():
@@ -808,6 +961,69 @@ def generate_crop_roadmap():
         return jsonify({'error': str(e)}), 500
 
 
+@app.route('/api/generate-crop-roadmap/stream', methods=['POST'])
+@require_auth
+def generate_crop_roadmap_stream():
+    """SSE variant of /api/generate-crop-roadmap. A saved plan is sent as a single done event."""
+    try:
+        data = request.json
+        user_id = request.user.get('uid')
+
+        if not user_id and os.getenv("FLASK_ENV") == "development":
+             user_id = data.get('user_id', 'test_user')
+
+        crop_name = data.get('crop_name')
+        language = data.get('language', 'en')
+
+        if not crop_name:
+            return jsonify({'error': 'Crop name is required'}), 400
+
+        print(f"[CROP-ROADMAP] Streaming for User: {user_id}, Crop: {crop_name}, Language: {language}")
+
+        from firebase_admin import firestore
+
+        doc_ref = None
+        existing = None
+        try:
+            db = firestore.client()
+            plan_id = f"{crop_name}_{language}"
+            doc_ref = db.collection('users').document(user_id).collection('crop_plans').document(plan_id)
+            doc = doc_ref.get()
+            if doc.exists:
+                existing = doc.to_dict().get('roadmap')
+        except Exception as e:
+            print(f"[CROP-ROADMAP WARNING] Firestore not available: {e}")
+
+        def events():
+            if existing:
+                print(f"[CROP-ROADMAP] Returning existing plan for {crop_name} in {language}")
+                yield {'type': 'done', 'roadmap': existing}
+                return
+            stream = crop_planner_generator.stream_crop_roadmap(user_id, crop_name, language)
+            try:
+                for event in stream:
+                    yield event
+                    roadmap = event.get('roadmap') if event.get('type') == 'done' else None
+                    if doc_ref and roadmap and not roadmap.get('overview', '').startswith('Error') and roadmap.get('verdict') != 'Error':
+                        try:
+                            doc_ref.set({'roadmap': roadmap, 'created_at': firestore.SERVER_TIMESTAMP})
+                            print(f"[CROP-ROADMAP] Saved new plan for {crop_name} in {language}")
+                        except Exception as e:
+                            print(f"[CROP-ROADMAP WARNING] Failed to save plan: {e}")
+            finally:
+                stream.close()
+
+        return sse_response(
+            'crop_roadmap',
+            events(),
+            error_event=lambda e: {'type': 'error', 'error': str(e)},
+        )
+
+    except Exception as e:
+        print(f"[CROP-ROADMAP] Stream Error: {e}")
+        return jsonify({'error': str(e)}), 500
+
+
 # --- Weather & News Services ---
 from services.WeatherNewsIntegration.weather_service import WeatherService
 from services.WeatherNewsIntegration.news_service import NewsService
@@ -815,6 +1031,12 @@ from services.WeatherNewsIntegration.news_service import NewsService
 weather_service = WeatherService()
 news_service = NewsService()
 
+# Close pooled HTTP clients on the background loop at process exit
+on_shutdown(weather_service.aclose)
+on_shutdown(news_service.aclose)
+on_shutdown(notification_engine.weather_service.aclose)
+on_shutdown(notification_engine.news_service.aclose)
+
 @app.route('/api/news/<user_id>', methods=['GET', 'OPTIONS'])
 @require_auth
 def get_personalized_news(user_id):
@@ -855,9 +1077,7 @@ def get_personalized_news(user_id):
             
         print(f"[NEWS] Personalized - Fetching for {user_id} (Crops: {crops}, Loc: {location})")
         
-        # Async call wrapper
-        import asyncio
-        news = asyncio.run(news_service.get_personalized_news(crops, location))
+        news = run_async(news_service.get_personalized_news(crops, location))
         
         if isinstance(news, dict) and 'error' in news:
             return jsonify({'success': False, 'error': news['error']}), 500
@@ -878,9 +1098,7 @@ def get_general_news():
     try:
         print(f"[NEWS] General - Fetching broad agriculture news")
         
-        # Async call wrapper
-        import asyncio
-        news = asyncio.run(news_service.get_general_news())
+        news = run_async(news_service.get_general_news())
         
         if isinstance(news, dict) and 'error' in news:
             return jsonify({'success': False, 'error': news['error']}), 500
@@ -1046,8 +1264,7 @@ def generate_roadmap_pdf_route():
 def get_current_weather():
     try:
         location = request.args.get('location', 'India')
-        import asyncio
-        weather = asyncio.run(weather_service.get_weather(location))
+        weather = run_async(weather_service.get_weather(location))
         return jsonify({'success': True, 'weather': weather})
     except Exception as e:
         print(f"[WEATHER] Error: {e}")
@@ -1055,23 +1272,56 @@ def get_current_weather():
 
 # --- Notification Routes (Demo) ---
 # --- Notification Routes (NEW) ---
+def _notifications_for(user_id):
+    notifications = notification_engine.get_notifications(user_id)
+
+    # Fallback to demo if empty (for Hackathon demo purposes if engine hasn't run yet)
+    if not notifications:
+         print(f"[NOTIF] No live notifications for {user_id}, returning demo data.")
+         notifications = get_demo_notifications(user_id)
+    return notifications
+
 @app.route('/api/notifications', methods=['GET'])
 @require_auth
 def get_notifications():
     try:
         user_id = request.user.get('uid')
-        notifications = notification_engine.get_notifications(user_id)
-        
-        # Fallback to demo if empty (for Hackathon demo purposes if engine hasn't run yet)
-        if not notifications:
-             print(f"[NOTIF] No live notifications for {user_id}, returning demo data.")
-             notifications = get_demo_notifications(user_id)
-             
+        notifications = _notifications_for(user_id)
         return jsonify({'success': True, 'notifications': notifications})
     except Exception as e:
         print(f"[NOTIF] Error: {e}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/notifications/stream', methods=['GET'])
+@require_auth
+def stream_notifications():
+    """Push channel: the current notifications, then every change (see notification_hub.py)."""
+    user_id = request.user.get('uid')
+    subscriber = notification_hub.subscribe(user_id)
+    if subscriber is None:
+        # Worker is at its connection cap; the client polls GET /api/notifications instead
+        response = jsonify({'error': 'Notification stream unavailable, poll /api/notifications'})
+        response.headers['Retry-After'] = '60'
+        return response, 503
+    # The stream's own cleanup only runs once the body is iterated; release the slot on close regardless
+    return push_response(notification_hub.stream(subscriber, lambda: _notifications_for(user_id)),
+                         on_close=lambda: notification_hub.unsubscribe(subscriber))
+
+@app.route('/api/notifications/read', methods=['POST'])
+@require_auth
+def mark_notifications_read():
+    try:
+        user_id = request.user.get('uid')
+        data = request.get_json(silent=True) or {}
+        ids = data.get('ids')  # omitted: mark all
+        if ids is not None and not isinstance(ids, list):
+            return jsonify({'error': 'ids must be a list'}), 400
+        updated = notification_engine.mark_read(user_id, ids, bool(data.get('read', True)))
+        return jsonify({'success': True, 'updated': updated})
+    except Exception as e:
+        print(f"[NOTIF] Mark read error: {e}")
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/notifications/trigger', methods=['POST'])
 @require_auth
 def trigger_notifications():
@@ -1079,8 +1329,7 @@ def trigger_notifications():
         user_id = request.user.get('uid')
         print(f"[NOTIF] Manual trigger initiated for {user_id}")
         
-        import asyncio
-        notifications = asyncio.run(notification_engine.generate_notifications_for_user(user_id))
+        notifications = run_async(notification_engine.generate_notifications_for_user(user_id))
         
         print(f"[NOTIF] Trigger success: {len(notifications)} notifications generated for {user_id}")
         return jsonify({'success': True, 'notifications': notifications, 'count': len(notifications)})
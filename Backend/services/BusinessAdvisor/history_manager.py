@@ -0,0 +1,146 @@
+"""
+Token-budgeted chat history for KrishiSahAI Business Advisor sessions.
+
+The advisor prompt is: system rules + farmer profile, the chat history, and
+the new message. Sending the whole history every turn makes prompt
+evaluation grow with the conversation, and once it passes `num_ctx` Ollama
+silently truncates from the front, which drops the system prompt first.
+
+`ChatHistoryManager` keeps the prompt inside a token budget instead:
+
+- the most recent turns that fit the budget are sent verbatim;
+- older turns are folded into a running summary by a background worker, off
+  the request path, and sent as one short system message;
+- until a summary is ready, turns outside the window are simply left out, so
+  a request never waits on summarization.
+
+Token counts are estimates (no tokenizer for the served model is available
+here): ~4 characters per token for Latin script and ~1.5 for Devanagari,
+which errs on the high side for Hindi/Marathi.
+"""
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage
+
+# Matches the chat client: OLLAMA_NUM_CTX (4096), num_predict=1200
+CONTEXT_TOKENS = int(os.getenv("ADVISOR_CONTEXT_TOKENS", os.getenv("OLLAMA_NUM_CTX", "4096")))
+RESPONSE_TOKENS = int(os.getenv("ADVISOR_RESPONSE_TOKENS", "1200"))
+SAFETY_TOKENS = 256
+SUMMARY_MAX_TOKENS = int(os.getenv("ADVISOR_SUMMARY_TOKENS", "300"))
+
+SUMMARY_PROMPT = """You maintain a running summary of a conversation between a farmer and an agricultural business advisor.
+
+Existing summary (may be empty):
+{summary}
+
+New conversation turns to fold in:
+{turns}
+
+Write the updated summary in the same language as the conversation, in at most {max_words} words.
+Keep facts the farmer stated, options already discussed or rejected, numbers (costs, land, capital) and open questions.
+Return only the summary text."""
+
+_summary_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="advisor-summary")
+
+
+def estimate_tokens(text: str) -> int:
+    ascii_chars = sum(1 for ch in text if ord(ch) < 128)
+    other_chars = len(text) - ascii_chars
+    return int(ascii_chars / 4 + other_chars / 1.5) + 4  # + per-message framing
+
+
+def _message_tokens(msg: BaseMessage) -> int:
+    return estimate_tokens(str(msg.content))
+
+
+class ChatHistoryManager:
+    """Chat turns plus a rolling summary of the turns that no longer fit the prompt budget."""
+
+    def __init__(self, summarize: Optional[Callable[[str], str]] = None,
+                 prompt_budget: int = CONTEXT_TOKENS - RESPONSE_TOKENS - SAFETY_TOKENS):
+        self.messages: List[BaseMessage] = []
+        self.summary = ""
+        self.prompt_budget = prompt_budget
+        self._summarize = summarize
+        self._lock = threading.Lock()
+        self._pending = False
+
+    def reset(self, messages: Optional[List[BaseMessage]] = None, summary: str = ""):
+        with self._lock:
+            self.messages = list(messages or [])
+            self.summary = summary
+
+    def append(self, *messages: BaseMessage):
+        with self._lock:
+            self.messages.extend(messages)
+
+    def for_prompt(self, reserved_tokens: int) -> List[BaseMessage]:
+        """
+        Messages for the MessagesPlaceholder: the summary (if any) plus the newest turns
+        that fit in the budget left after the system prompt and the new input.
+        Schedules summarization of older turns when some had to be left out.
+        """
+        with self._lock:
+            budget = self.prompt_budget - reserved_tokens
+            prefix: List[BaseMessage] = []
+            if self.summary:
+                prefix = [SystemMessage(content=f"Summary of the earlier conversation:\n{self.summary}")]
+                budget -= _message_tokens(prefix[0])
+
+            start = self._window_start(budget)
+            window = self.messages[start:]
+            if start > 0:
+                # Fold down to half the budget so the summary is not refreshed on every turn
+                self._schedule_summary(self._window_start(budget // 2))
+            return prefix + window
+
+    def _window_start(self, budget: int) -> int:
+        """Index of the oldest message kept when walking back from the newest in whole turns (human + ai)"""
+        start = len(self.messages)
+        used = 0
+        while start > 0:
+            step = 2 if start >= 2 and isinstance(self.messages[start - 2], HumanMessage) else 1
+            cost = sum(_message_tokens(m) for m in self.messages[start - step:start])
+            if used + cost > budget:
+                break
+            used += cost
+            start -= step
+        return start
+
+    def _schedule_summary(self, upto: int):
+        # Caller holds the lock
+        if self._pending or self._summarize is None:
+            return
+        self._pending = True
+        turns = list(self.messages[:upto])
+        summary = self.summary
+        _summary_executor.submit(self._run_summary, turns, summary)
+
+    def _run_summary(self, turns: List[BaseMessage], summary: str):
+        try:
+            transcript = "\n".join(
+                f"{'Advisor' if isinstance(m, AIMessage) else 'Farmer'}: {m.content}" for m in turns
+            )
+            new_summary = self._summarize(SUMMARY_PROMPT.format(
+                summary=summary or "(none)",
+                turns=transcript,
+                max_words=int(SUMMARY_MAX_TOKENS * 0.75),
+            )).strip()
+            if not new_summary:
+                return
+            with self._lock:
+                # Drop the folded turns only if the history was not reset meanwhile
+                folded = self.messages[:len(turns)]
+                if self.summary == summary and len(folded) == len(turns) and all(a is b for a, b in zip(folded, turns)):
+                    self.messages = self.messages[len(turns):]
+                    self.summary = new_summary
+                    print(f"[ADVISOR] Folded {len(turns)} messages into the running summary")
+        except Exception as e:
+            print(f"[ADVISOR] History summarization failed: {e}")
+        finally:
+            with self._lock:
+                self._pending = False
@@ -4,19 +4,30 @@ AI-powered business advisor for Indian farmers using LangChain + Ollama
 """
 
 import os
+import sys
 from typing import Optional, List
 import json
 import re
 import html
+import time
 
 # --- LANGCHAIN IMPORTS (Refactored for correctness) ---
-from langchain_community.chat_models import ChatOllama
+from langchain_ollama import ChatOllama
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder, SystemMessagePromptTemplate, HumanMessagePromptTemplate
 from langchain_core.messages import SystemMessage, HumanMessage, AIMessage, BaseMessage
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.runnables import RunnableSerializable
 from pydantic import BaseModel, field_validator
 
+# Backend/ must be importable when this file is run directly as the CLI
+_BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "../../"))
+if _BACKEND_DIR not in sys.path:
+    sys.path.append(_BACKEND_DIR)
+
+from services.Shared.llm_registry import get_llm
+from services.Shared.generation_cache import get_generation_cache
+from services.BusinessAdvisor.history_manager import ChatHistoryManager, estimate_tokens
+
 # ============================================
 # BUSINESS OPTIONS (STRICT LIST)
 # ============================================
@@ -47,6 +58,8 @@ DEFAULT_OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "llama3.2")
 DEFAULT_OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
 
 force_cpu = os.getenv("OLLAMA_FORCE_CPU", "1").lower() not in {"0", "false"}
+# Keep the part of an answer streamed before the client disconnected in the chat history
+KEEP_PARTIAL_ANSWERS = os.getenv("ADVISOR_KEEP_PARTIAL_ANSWERS", "true").lower() not in {"0", "false"}
 if force_cpu and "OLLAMA_NUM_GPU" not in os.environ:
     # Force Ollama to run the model on CPU to avoid CUDA dependency on machines without GPUs
     os.environ["OLLAMA_NUM_GPU"] = "0"
@@ -248,6 +261,20 @@ RULES:
 
 
 
+# Fixed opening exchange that anchors Devanagari replies. It is part of the static
+# prompt prefix (never stored in history), so it is identical on every turn.
+LANGUAGE_PRIMERS = {
+    "marathi": [
+        HumanMessage(content="तुम्ही कोण आहात?"),
+        AIMessage(content="मी तुमचा कृषी-मार्गदर्शक आहे. मी फक्त मराठीतच बोलणार आहे."),
+    ],
+    "hindi": [
+        HumanMessage(content="आप कौन हैं?"),
+        AIMessage(content="मैं आपका कृषि-सहायक हूँ। मैं केवल हिंदी में बात करूँगा।"),
+    ],
+}
+
+
 # ============================================
 # CHATBOT CLASS
 # ============================================
@@ -259,21 +286,20 @@ class KrishiSahAIAdvisor:
         self.profile = farmer_profile
         self.llm: Optional[ChatOllama] = None
         self.chain: Optional[RunnableSerializable] = None
-        self.chat_history: List[BaseMessage] = []
+        self._system_tokens = 0
         # Track the last language received from the API/UI toggle
         self.last_api_language = farmer_profile.language.lower()
         self._initialize_llm()
+        self.history = ChatHistoryManager(summarize=self._summarize_history)
         self._initialize_chain()
     
     def _initialize_llm(self):
-        """Initialize ChatOllama LLM"""
+        """Attach the shared chat client (built once, reused by every session)"""
         try:
-            self.llm = ChatOllama(
-                model=DEFAULT_OLLAMA_MODEL,
+            self.llm = get_llm(
+                "chat",
                 temperature=0.1,  # Lower temperature for stricter language adherence
-                num_ctx=4096,     # Full context window for complete conversation memory
                 num_predict=1200, # Balanced response length for streaming
-                base_url=DEFAULT_OLLAMA_BASE_URL,
             )
         except Exception as e:
             print(f"Error initializing ChatOllama: {e}")
@@ -319,11 +345,17 @@ class KrishiSahAIAdvisor:
         prompt_key = lang_map.get(lang_input, "english")
         system_rules = SYSTEM_PROMPTS.get(prompt_key, SYSTEM_PROMPTS["english"])
         
+        # Static prefix first, in a fixed order: language rules (shared by every session in
+        # this language), then the profile, then the primer turns. It is rendered once per
+        # chain, so Ollama can reuse its cached evaluation on every following turn.
         full_system_context = f"{system_rules}\n\n{self.profile.to_context()}"
+        primers = LANGUAGE_PRIMERS.get(prompt_key, [])
+        self._system_tokens = estimate_tokens(full_system_context) + sum(estimate_tokens(m.content) for m in primers)
         print(f"[ADVISOR] Priming chain for {lang_input} with Rules (len: {len(system_rules)})")
         
         prompt = ChatPromptTemplate.from_messages([
             SystemMessage(content=full_system_context),
+            *primers,
             MessagesPlaceholder(variable_name="chat_history"),
             HumanMessagePromptTemplate.from_template("{input}")
         ])
@@ -361,27 +393,20 @@ class KrishiSahAIAdvisor:
             # to reinforce the LLM to respond only in the selected language.
             lang_key = self.profile.language.lower()
             if lang_key in ["marathi", "mr"]:
-                if not self.chat_history:
-                    self.chat_history.append(HumanMessage(content="तुम्ही कोण आहात?"))
-                    self.chat_history.append(AIMessage(content="मी तुमचा कृषी-मार्गदर्शक आहे. मी फक्त मराठीतच बोलणार आहे."))
                 clean_message = f"(MANDATORY: RESPOND IN MARATHI DEVANAGARI ONLY — IGNORE INPUT LANGUAGE) {user_message}"
             elif lang_key in ["hindi", "hi"]:
-                if not self.chat_history:
-                    self.chat_history.append(HumanMessage(content="आप कौन हैं?"))
-                    self.chat_history.append(AIMessage(content="मैं आपका कृषि-सहायक हूँ। मैं केवल हिंदी में बात करूँगा।"))
                 clean_message = f"(MANDATORY: RESPOND IN HINDI DEVANAGARI ONLY — IGNORE INPUT LANGUAGE) {user_message}"
             else:
                 clean_message = f"(MANDATORY: RESPOND IN ENGLISH ONLY — IGNORE INPUT LANGUAGE) {user_message}"
             
-            # Invoke chain with current history
+            # Invoke chain with the budgeted history (summary + recent turns)
             response = self.chain.invoke({
-                "chat_history": self.chat_history,
+                "chat_history": self.history.for_prompt(self._system_tokens + estimate_tokens(clean_message)),
                 "input": clean_message
             })
             
             # Update history manually
-            self.chat_history.append(HumanMessage(content=clean_message))
-            self.chat_history.append(AIMessage(content=response))
+            self.history.append(HumanMessage(content=clean_message), AIMessage(content=response))
             
             return response.strip()
         except Exception as e:
@@ -415,39 +440,58 @@ class KrishiSahAIAdvisor:
             # to reinforce the LLM to respond only in the selected language.
             lang_key = self.profile.language.lower()
             if lang_key in ["marathi", "mr"]:
-                if not self.chat_history:
-                    self.chat_history.append(HumanMessage(content="तुम्ही कोण आहात?"))
-                    self.chat_history.append(AIMessage(content="मी तुमचा कृषी-मार्गदर्शक आहे. मी फक्त मराठीतच बोलणार आहे."))
                 clean_message = f"(MANDATORY: RESPOND IN MARATHI DEVANAGARI ONLY — IGNORE INPUT LANGUAGE) {user_message}"
             elif lang_key in ["hindi", "hi"]:
-                if not self.chat_history:
-                    self.chat_history.append(HumanMessage(content="आप कौन हैं?"))
-                    self.chat_history.append(AIMessage(content="मैं आपका कृषि-सहायक हूँ। मैं केवल हिंदी में बात करूँगा।"))
                 clean_message = f"(MANDATORY: RESPOND IN HINDI DEVANAGARI ONLY — IGNORE INPUT LANGUAGE) {user_message}"
             else:
                 clean_message = f"(MANDATORY: RESPOND IN ENGLISH ONLY — IGNORE INPUT LANGUAGE) {user_message}"
             
             full_response = ""
+            start = time.monotonic()
 
             # Use the .stream() method of the chain
-            for chunk in self.chain.stream({
-                "chat_history": self.chat_history,
+            stream = self.chain.stream({
+                "chat_history": self.history.for_prompt(self._system_tokens + estimate_tokens(clean_message)),
                 "input": clean_message
-            }):
-                full_response += chunk
-                yield chunk
+            })
+            try:
+                for chunk in stream:
+                    if not full_response and chunk:
+                        print(f"[ADVISOR] First token after {(time.monotonic() - start) * 1000:.0f} ms")
+                    full_response += chunk
+                    yield chunk
+            except GeneratorExit:
+                # Client disconnected: the question and the partial answer go into history together
+                if KEEP_PARTIAL_ANSWERS and full_response:
+                    self.history.append(HumanMessage(content=clean_message), AIMessage(content=full_response))
+                raise
+            finally:
+                # Closes the Ollama HTTP stream so generation stops with the client
+                stream.close()
             
             # Update history after full response is generated
-            self.chat_history.append(HumanMessage(content=clean_message))
-            self.chat_history.append(AIMessage(content=full_response))
+            self.history.append(HumanMessage(content=clean_message), AIMessage(content=full_response))
             
         except Exception as e:
             print(f"Stream Chat Error: {e}")
             yield f"Error: {str(e)}"
     
+    @property
+    def chat_history(self) -> List[BaseMessage]:
+        """Turns not yet folded into the running summary"""
+        return self.history.messages
+
+    @chat_history.setter
+    def chat_history(self, messages: List[BaseMessage]):
+        self.history.reset(messages)
+
+    def _summarize_history(self, prompt_text: str) -> str:
+        """Background summarizer for ChatHistoryManager (runs off the request path)"""
+        return get_llm("long-form", temperature=0.1, num_predict=400).invoke(prompt_text).content
+
     def get_chat_history(self) -> str:
         """Get conversation history as a formatted string (for debugging/display)"""
-        formatted = ""
+        formatted = f"Summary: {self.history.summary}\n" if self.history.summary else ""
         for msg in self.chat_history:
             role = "AI" if isinstance(msg, AIMessage) else "User"
             formatted += f"{role}: {msg.content}\n"
@@ -458,6 +502,37 @@ class KrishiSahAIAdvisor:
         self.chat_history = []
         print("Conversation memory cleared")
 
+    def to_state(self) -> dict:
+        """Compact, JSON-serializable snapshot of the session (profile, history, language)"""
+        return {
+            "profile": self.profile.model_dump(exclude_none=True),
+            "history": [
+                ["ai" if isinstance(msg, AIMessage) else "human", msg.content]
+                for msg in self.chat_history
+            ],
+            "language": self.last_api_language,
+            "summary": self.history.summary,
+        }
+
+    @classmethod
+    def from_state(cls, state: dict) -> "KrishiSahAIAdvisor":
+        """Rebuild an advisor from a `to_state()` snapshot"""
+        # The profile was validated when the session was created, so skip re-validation
+        profile = FarmerProfile.model_construct(**state["profile"])
+        advisor = cls(profile)
+        advisor.last_api_language = state.get("language") or profile.language.lower()
+        messages = [
+            AIMessage(content=content) if role == "ai" else HumanMessage(content=content)
+            for role, content in state.get("history", [])
+        ]
+        # Older snapshots stored the language primer turns in the history; they now live in the prompt
+        for primers in LANGUAGE_PRIMERS.values():
+            if [m.content for m in messages[:len(primers)]] == [m.content for m in primers]:
+                messages = messages[len(primers):]
+                break
+        advisor.history.reset(messages, summary=state.get("summary", ""))
+        return advisor
+
     def generate_recommendations(self) -> List[dict]:
         """Generate top 3 business recommendations based on profile"""
         if not self.llm:
@@ -503,45 +578,56 @@ class KrishiSahAIAdvisor:
         """
         
         try:
-            # Use LLM directly for one-off generation
-            response_msg = self.llm.invoke(prompt_text)
-            response = response_msg.content
-            
-            # Robust JSON extraction
-            cleaned_response = response.strip()
-            
-            # Remove markdown code fences
-            cleaned_response = re.sub(r'```json\s*|\s*```', '', cleaned_response)
-            
-            # Try to extract JSON array from text (in case LLM added explanation)
-            json_match = re.search(r'\[\s*\{.*\}\s*\]', cleaned_response, re.DOTALL)
-            if json_match:
-                cleaned_response = json_match.group(0)
-            
-            # Remove trailing commas before closing braces/brackets (common LLM error)
-            cleaned_response = re.sub(r',(\s*[}\]])', r'\1', cleaned_response)
-            
-            try:
-                recommendations = json.loads(cleaned_response)
-            except json.JSONDecodeError as json_err:
-                print(f"Warning: JSON parse error: {json_err}")
-                print(f"Raw response (first 500 chars): {response[:500]}")
-                print(f"Cleaned response (first 500 chars): {cleaned_response[:500]}")
-                raise  # Re-raise to trigger fallback
-            
-            # Ensure we strictly have 3 items and they match our ID list
-            valid_ids = {b['id'] for b in BUSINESS_OPTIONS}
-            valid_recs = [r for r in recommendations if r.get('id') in valid_ids]
-            
-            # Return top 3, or fallback if empty
-            if not valid_recs:
-                raise ValueError("No valid recommendations generated")
-            
-            return valid_recs[:3]
+            # The prompt embeds the full profile, so identical profiles share one cached result
+            return get_generation_cache().cached(
+                "recommendations",
+                prompt_text,
+                self.llm,
+                {},
+                lambda: self._generate_recommendations(prompt_text),
+            )
         except Exception as e:
             print(f"Error generating recommendations: {e}")
             return self._get_fallback_recommendations()
 
+    def _generate_recommendations(self, prompt_text: str) -> List[dict]:
+        """Run the model and validate its recommendations; raises so failures are never cached"""
+        # Use LLM directly for one-off generation
+        response_msg = self.llm.invoke(prompt_text)
+        response = response_msg.content
+        
+        # Robust JSON extraction
+        cleaned_response = response.strip()
+        
+        # Remove markdown code fences
+        cleaned_response = re.sub(r'```json\s*|\s*```', '', cleaned_response)
+        
+        # Try to extract JSON array from text (in case LLM added explanation)
+        json_match = re.search(r'\[\s*\{.*\}\s*\]', cleaned_response, re.DOTALL)
+        if json_match:
+            cleaned_response = json_match.group(0)
+        
+        # Remove trailing commas before closing braces/brackets (common LLM error)
+        cleaned_response = re.sub(r',(\s*[}\]])', r'\1', cleaned_response)
+        
+        try:
+            recommendations = json.loads(cleaned_response)
+        except json.JSONDecodeError as json_err:
+            print(f"Warning: JSON parse error: {json_err}")
+            print(f"Raw response (first 500 chars): {response[:500]}")
+            print(f"Cleaned response (first 500 chars): {cleaned_response[:500]}")
+            raise  # Re-raise to trigger fallback
+        
+        # Ensure we strictly have 3 items and they match our ID list
+        valid_ids = {b['id'] for b in BUSINESS_OPTIONS}
+        valid_recs = [r for r in recommendations if r.get('id') in valid_ids]
+        
+        # Return top 3, or fallback if empty
+        if not valid_recs:
+            raise ValueError("No valid recommendations generated")
+        
+        return valid_recs[:3]
+
     def generate_title(self) -> str:
         """Generate a short 3-5 word summary title for the chat session"""
         if not self.llm or not self.chat_history:
@@ -0,0 +1,679 @@
+"""
+Session store for KrishiSahAI Business Advisor sessions.
+
+Live `KrishiSahAIAdvisor` objects are kept in a small in-process LRU (the hot
+tier) bounded by session count, approximate memory and idle time. Every
+session is also written to a backend in a compact serialized form
+(FarmerProfile + chat history + language) so it survives eviction, restarts
+and requests that land on a different gunicorn worker.
+
+Backends:
+- memory  : in-process dict (single worker, default)
+- sqlite  : shared SQLite file (multiple workers on one host)
+- redis   : any Redis-compatible server (requires the `redis` package); with
+            ADVISOR_SESSION_REDIS_URL=local, or when no server is reachable, a
+            Redis-like stand-in (`LocalRedis`) keeps the same keys and TTLs in
+            the ADVISOR_SESSION_DB file, shared by the workers on one host
+
+Every read of a session (not only `save()`) refreshes its idle TTL in the
+backend, so a session that is only being read does not expire.
+
+Writes are compare-and-swap on the session version: if another worker saved
+the session since this worker loaded it, `save()` re-reads the stored state,
+appends the turns added here on top of it and retries, so concurrent turns on
+two workers are both kept.
+
+Configuration (environment):
+    ADVISOR_SESSION_BACKEND   memory | sqlite | redis   (default: memory)
+    ADVISOR_SESSION_DB        SQLite file path           (default: Backend/advisor_sessions.db)
+    ADVISOR_SESSION_REDIS_URL Redis URL, or "local"      (default: redis://localhost:6379/0)
+    ADVISOR_SESSION_MAX       max live sessions per worker (default: 200)
+    ADVISOR_SESSION_MAX_MB    max approx. memory of live sessions per worker (default: 64)
+    ADVISOR_SESSION_TTL       idle seconds before a session expires (default: 86400)
+"""
+
+import os
+import json
+import sqlite3
+import threading
+import time
+import uuid
+import weakref
+import zlib
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional, Tuple
+
+from krishi_chatbot import KrishiSahAIAdvisor
+
+# Blobs larger than this are zlib-compressed before hitting the backend
+_COMPRESS_THRESHOLD = 1024
+_RAW_PREFIX = b"j"
+_ZLIB_PREFIX = b"z"
+# Compare-and-swap attempts before a save gives up
+_SAVE_ATTEMPTS = 5
+# Saves of one session are serialized within a worker; sessions share this many locks
+_SAVE_LOCK_STRIPES = 64
+
+
+# ============================================
+# SERIALIZATION
+# ============================================
+
+def serialize_state(state: dict) -> bytes:
+    """Encode an advisor state dict into a compact byte blob"""
+    raw = json.dumps(state, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    if len(raw) > _COMPRESS_THRESHOLD:
+        return _ZLIB_PREFIX + zlib.compress(raw, 6)
+    return _RAW_PREFIX + raw
+
+
+def deserialize_state(blob: bytes) -> dict:
+    """Decode a blob produced by `serialize_state`"""
+    prefix, body = blob[:1], blob[1:]
+    if prefix == _ZLIB_PREFIX:
+        body = zlib.decompress(body)
+    return json.loads(body.decode("utf-8"))
+
+
+def estimate_session_bytes(advisor: KrishiSahAIAdvisor) -> int:
+    """Rough resident size of a live session: history text + profile context + fixed object overhead"""
+    history_bytes = sum(len(str(msg.content).encode("utf-8")) for msg in advisor.chat_history)
+    history_bytes += len(advisor.history.summary.encode("utf-8"))
+    profile_bytes = len(advisor.profile.model_dump_json())
+    # Each message object and the chain/prompt objects add some constant overhead
+    return history_bytes + profile_bytes + 200 * len(advisor.chat_history) + 8 * 1024
+
+
+# ============================================
+# BACKENDS
+# ============================================
+
+class InMemorySessionBackend:
+    """Process-local backend. Sessions are lost on restart and not shared between workers."""
+
+    def __init__(self, ttl: int):
+        self.ttl = ttl
+        self._data = {}  # session_id -> (version, blob, last_access)
+        self._lock = threading.Lock()
+
+    def load(self, session_id: str) -> Optional[Tuple[int, bytes]]:
+        with self._lock:
+            entry = self._data.get(session_id)
+            if entry is None:
+                return None
+            version, blob, last_access = entry
+            if time.time() - last_access > self.ttl:
+                del self._data[session_id]
+                return None
+            self._data[session_id] = (version, blob, time.time())
+            return version, blob
+
+    def touch(self, session_id: str) -> Optional[int]:
+        """Refresh the session's idle TTL; returns its version, or None if it is gone"""
+        entry = self.load(session_id)
+        return entry[0] if entry else None
+
+    def store(self, session_id: str, blob: bytes, expected_version: Optional[int] = None) -> Optional[int]:
+        """Write a new version; with `expected_version`, only if that is still current (else None)"""
+        with self._lock:
+            entry = self._data.get(session_id)
+            current = entry[0] if entry else 0
+            if expected_version is not None and current != expected_version:
+                return None
+            version = current + 1
+            self._data[session_id] = (version, blob, time.time())
+            return version
+
+    def delete(self, session_id: str):
+        with self._lock:
+            self._data.pop(session_id, None)
+
+    def purge_expired(self) -> int:
+        cutoff = time.time() - self.ttl
+        with self._lock:
+            expired = [sid for sid, (_, _, last) in self._data.items() if last < cutoff]
+            for sid in expired:
+                del self._data[sid]
+        return len(expired)
+
+
+class SQLiteSessionBackend:
+    """SQLite-file backend. Lets several workers on the same host share sessions."""
+
+    def __init__(self, path: str, ttl: int):
+        self.path = path
+        self.ttl = ttl
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS advisor_sessions ("
+            " session_id TEXT PRIMARY KEY,"
+            " version INTEGER NOT NULL,"
+            " blob BLOB NOT NULL,"
+            " last_access REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_advisor_sessions_last_access ON advisor_sessions(last_access)")
+        conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def load(self, session_id: str) -> Optional[Tuple[int, bytes]]:
+        conn = self._conn()
+        row = conn.execute(
+            "SELECT version, blob, last_access FROM advisor_sessions WHERE session_id = ?",
+            (session_id,),
+        ).fetchone()
+        if row is None:
+            return None
+        version, blob, last_access = row
+        now = time.time()
+        if now - last_access > self.ttl:
+            self.delete(session_id)
+            return None
+        conn.execute("UPDATE advisor_sessions SET last_access = ? WHERE session_id = ?", (now, session_id))
+        return version, bytes(blob)
+
+    def touch(self, session_id: str) -> Optional[int]:
+        """Refresh the session's idle TTL; returns its version, or None if it is gone"""
+        conn = self._conn()
+        now = time.time()
+        cur = conn.execute(
+            "UPDATE advisor_sessions SET last_access = ? WHERE session_id = ? AND last_access >= ?",
+            (now, session_id, now - self.ttl),
+        )
+        if cur.rowcount == 0:
+            return None
+        row = conn.execute("SELECT version FROM advisor_sessions WHERE session_id = ?", (session_id,)).fetchone()
+        return row[0] if row else None
+
+    def store(self, session_id: str, blob: bytes, expected_version: Optional[int] = None) -> Optional[int]:
+        """Write a new version; with `expected_version`, only if that is still current (else None)"""
+        conn = self._conn()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if expected_version is None:
+                conn.execute(
+                    "INSERT INTO advisor_sessions (session_id, version, blob, last_access) VALUES (?, 1, ?, ?) "
+                    "ON CONFLICT(session_id) DO UPDATE SET version = version + 1, blob = excluded.blob, "
+                    "last_access = excluded.last_access",
+                    (session_id, sqlite3.Binary(blob), now),
+                )
+            else:
+                cur = conn.execute(
+                    "UPDATE advisor_sessions SET version = version + 1, blob = ?, last_access = ? "
+                    "WHERE session_id = ? AND version = ?",
+                    (sqlite3.Binary(blob), now, session_id, expected_version),
+                )
+                if cur.rowcount == 0:
+                    conn.execute("COMMIT")
+                    return None
+            row = conn.execute("SELECT version FROM advisor_sessions WHERE session_id = ?", (session_id,)).fetchone()
+            conn.execute("COMMIT")
+            return row[0]
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def delete(self, session_id: str):
+        self._conn().execute("DELETE FROM advisor_sessions WHERE session_id = ?", (session_id,))
+
+    def purge_expired(self) -> int:
+        cur = self._conn().execute("DELETE FROM advisor_sessions WHERE last_access < ?", (time.time() - self.ttl,))
+        return cur.rowcount
+
+
+class LocalRedis:
+    """
+    Redis-like stand-in for a single host: the hash and key-TTL commands
+    RedisSessionBackend uses, kept in a SQLite file that all workers share.
+    Pipelines run in one transaction, like MULTI/EXEC.
+    """
+
+    COMMANDS = ("hget", "hmget", "hset", "hincrby", "expire", "delete")
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS redis_hash ("
+            " key TEXT NOT NULL,"
+            " field TEXT NOT NULL,"
+            " value BLOB NOT NULL,"
+            " PRIMARY KEY (key, field))"
+        )
+        conn.execute("CREATE TABLE IF NOT EXISTS redis_expiry (key TEXT PRIMARY KEY, expires_at REAL NOT NULL)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_redis_expiry_expires_at ON redis_expiry(expires_at)")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _execute(self, calls) -> list:
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            results = [getattr(self, f"_{name}")(conn, *args) for name, args in calls]
+            conn.execute("COMMIT")
+            return results
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def pipeline(self) -> "_LocalPipeline":
+        return _LocalPipeline(self)
+
+    def hget(self, key: str, field: str) -> Optional[bytes]:
+        return self._execute([("hget", (key, field))])[0]
+
+    def hmget(self, key: str, *fields: str) -> list:
+        return self._execute([("hmget", (key, *fields))])[0]
+
+    def hset(self, key: str, field: str, value) -> int:
+        return self._execute([("hset", (key, field, value))])[0]
+
+    def hincrby(self, key: str, field: str, amount: int = 1) -> int:
+        return self._execute([("hincrby", (key, field, amount))])[0]
+
+    def expire(self, key: str, seconds: int) -> bool:
+        return self._execute([("expire", (key, seconds))])[0]
+
+    def delete(self, *keys: str) -> int:
+        return self._execute([("delete", keys)])[0]
+
+    def set_if_version(self, key: str, expected: int, blob: bytes, ttl: int) -> int:
+        """Same contract as RedisSessionBackend's Lua script: the new version, or -1 on a mismatch"""
+        return self._execute([("set_if_version", (key, expected, blob, ttl))])[0]
+
+    def purge_expired(self) -> int:
+        """Delete keys whose TTL has passed (Redis does this by itself)"""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            expired = [row[0] for row in conn.execute(
+                "SELECT key FROM redis_expiry WHERE expires_at <= ?", (time.time(),))]
+            removed = self._delete(conn, *expired)
+            conn.execute("COMMIT")
+            return removed
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    # ---------- commands, inside a transaction ----------
+
+    def _exists(self, conn, key: str) -> bool:
+        """Whether `key` exists, deleting it first if its TTL has passed"""
+        row = conn.execute("SELECT expires_at FROM redis_expiry WHERE key = ?", (key,)).fetchone()
+        if row is not None and row[0] <= time.time():
+            self._delete(conn, key)
+            return False
+        return conn.execute("SELECT 1 FROM redis_hash WHERE key = ? LIMIT 1", (key,)).fetchone() is not None
+
+    def _hget(self, conn, key, field):
+        if not self._exists(conn, key):
+            return None
+        row = conn.execute("SELECT value FROM redis_hash WHERE key = ? AND field = ?", (key, field)).fetchone()
+        return bytes(row[0]) if row else None
+
+    def _hmget(self, conn, key, *fields):
+        return [self._hget(conn, key, field) for field in fields]
+
+    def _hset(self, conn, key, field, value):
+        self._exists(conn, key)  # an expired key starts over without its old fields
+        if isinstance(value, str):
+            value = value.encode("utf-8")
+        elif isinstance(value, int):
+            value = str(value).encode("ascii")
+        conn.execute(
+            "INSERT INTO redis_hash (key, field, value) VALUES (?, ?, ?) "
+            "ON CONFLICT(key, field) DO UPDATE SET value = excluded.value",
+            (key, field, sqlite3.Binary(value)),
+        )
+        return 1
+
+    def _hincrby(self, conn, key, field, amount=1):
+        value = int(self._hget(conn, key, field) or 0) + amount
+        self._hset(conn, key, field, value)
+        return value
+
+    def _expire(self, conn, key, seconds):
+        if not self._exists(conn, key):
+            return False
+        conn.execute(
+            "INSERT INTO redis_expiry (key, expires_at) VALUES (?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET expires_at = excluded.expires_at",
+            (key, time.time() + seconds),
+        )
+        return True
+
+    def _set_if_version(self, conn, key, expected, blob, ttl):
+        if int(self._hget(conn, key, "version") or 0) != expected:
+            return -1
+        version = self._hincrby(conn, key, "version", 1)
+        self._hset(conn, key, "blob", blob)
+        self._expire(conn, key, ttl)
+        return version
+
+    def _delete(self, conn, *keys):
+        removed = 0
+        for key in keys:
+            cur = conn.execute("DELETE FROM redis_hash WHERE key = ?", (key,))
+            conn.execute("DELETE FROM redis_expiry WHERE key = ?", (key,))
+            removed += 1 if cur.rowcount else 0
+        return removed
+
+
+class _LocalPipeline:
+    """Queues LocalRedis commands; `execute()` runs them in one transaction"""
+
+    def __init__(self, client: LocalRedis):
+        self._client = client
+        self._calls = []
+
+    def __getattr__(self, name):
+        if name not in LocalRedis.COMMANDS:
+            raise AttributeError(name)
+
+        def queue(*args):
+            self._calls.append((name, args))
+            return self
+        return queue
+
+    def execute(self) -> list:
+        calls, self._calls = self._calls, []
+        return self._client._execute(calls)
+
+
+class RedisSessionBackend:
+    """Redis-compatible backend. Expiry is delegated to Redis key TTLs."""
+
+    # Compare-and-swap in one round trip: KEYS[1] = session key, ARGV = expected version, blob, ttl
+    _SET_IF_VERSION = """
+local current = tonumber(redis.call('HGET', KEYS[1], 'version') or '0')
+if current ~= tonumber(ARGV[1]) then return -1 end
+local version = redis.call('HINCRBY', KEYS[1], 'version', 1)
+redis.call('HSET', KEYS[1], 'blob', ARGV[2])
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+return version
+"""
+
+    def __init__(self, client, ttl: int, prefix: str = "krishi:advisor:"):
+        self.client = client  # redis.Redis or LocalRedis
+        self.ttl = ttl
+        self.prefix = prefix
+        if isinstance(client, LocalRedis):
+            self._set_if_version = lambda key, expected, blob: client.set_if_version(key, expected, blob, self.ttl)
+        else:
+            script = client.register_script(self._SET_IF_VERSION)
+            self._set_if_version = lambda key, expected, blob: script(keys=[key], args=[expected, blob, self.ttl])
+
+    def _key(self, session_id: str) -> str:
+        return f"{self.prefix}{session_id}"
+
+    def load(self, session_id: str) -> Optional[Tuple[int, bytes]]:
+        key = self._key(session_id)
+        pipe = self.client.pipeline()
+        pipe.hmget(key, "version", "blob")
+        pipe.expire(key, self.ttl)
+        (version, blob), _ = pipe.execute()
+        if version is None or blob is None:
+            return None
+        return int(version), blob
+
+    def touch(self, session_id: str) -> Optional[int]:
+        """Refresh the session's idle TTL; returns its version, or None if it is gone"""
+        key = self._key(session_id)
+        pipe = self.client.pipeline()
+        pipe.hget(key, "version")
+        pipe.expire(key, self.ttl)
+        version, _ = pipe.execute()
+        return int(version) if version is not None else None
+
+    def store(self, session_id: str, blob: bytes, expected_version: Optional[int] = None) -> Optional[int]:
+        """Write a new version; with `expected_version`, only if that is still current (else None)"""
+        key = self._key(session_id)
+        if expected_version is not None:
+            version = int(self._set_if_version(key, expected_version, blob))
+            return version if version >= 0 else None
+        pipe = self.client.pipeline()
+        pipe.hincrby(key, "version", 1)
+        pipe.hset(key, "blob", blob)
+        pipe.expire(key, self.ttl)
+        version, _, _ = pipe.execute()
+        return int(version)
+
+    def delete(self, session_id: str):
+        self.client.delete(self._key(session_id))
+
+    def purge_expired(self) -> int:
+        if isinstance(self.client, LocalRedis):
+            return self.client.purge_expired()
+        return 0  # Handled by Redis TTLs
+
+
+def _redis_client(url: str, local_path: str):
+    """A Redis client for `url`, or the LocalRedis stand-in for "local" or when no server answers"""
+    if url != "local":
+        try:
+            import redis  # Optional dependency, only needed for a real Redis server
+            client = redis.Redis.from_url(url)
+            client.ping()
+            return client
+        except Exception as e:
+            print(f"[ADVISOR] Redis at {url} unavailable ({e}), using the local stand-in in {local_path}")
+    return LocalRedis(local_path)
+
+
+# ============================================
+# SESSION STORE
+# ============================================
+
+class _LiveSession:
+    __slots__ = ("advisor", "version", "size", "last_access")
+
+    def __init__(self, advisor, version, size):
+        self.advisor = advisor
+        self.version = version
+        self.size = size
+        self.last_access = time.time()
+
+
+class AdvisorSessionStore:
+    """
+    LRU + idle-TTL cache of live advisors in front of a serialized session backend.
+
+    Call `save()` after every mutation (chat turn) so other workers, and this
+    worker after eviction, can rehydrate the latest history.
+
+    For every advisor object the store remembers the backend version it was last
+    synced with and its messages at that point; a save writes only if that
+    version is still current, otherwise the messages added since are merged onto
+    the newer stored state.
+    """
+
+    def __init__(self, backend, max_sessions: int = 200, max_memory_bytes: int = 64 * 1024 * 1024, idle_ttl: int = 86400):
+        self.backend = backend
+        self.max_sessions = max_sessions
+        self.max_memory_bytes = max_memory_bytes
+        self.idle_ttl = idle_ttl
+        self._live: "OrderedDict[str, _LiveSession]" = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.RLock()
+        self._stats = {"hits": 0, "rehydrations": 0, "misses": 0, "evictions": 0, "expirations": 0,
+                       "save_conflicts": 0}
+        # advisor -> (backend version, messages at that version)
+        self._synced: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+        self._save_locks = [threading.Lock() for _ in range(_SAVE_LOCK_STRIPES)]
+
+    def create(self, advisor: KrishiSahAIAdvisor) -> str:
+        """Register a new advisor and return its session id"""
+        session_id = str(uuid.uuid4())
+        self.save(session_id, advisor)
+        return session_id
+
+    def get(self, session_id: str) -> Optional[KrishiSahAIAdvisor]:
+        """Return the live advisor for `session_id`, rehydrating from the backend if needed"""
+        if not session_id:
+            return None
+
+        with self._lock:
+            live = self._live.get(session_id)
+            if live is not None and time.time() - live.last_access > self.idle_ttl:
+                self._drop(session_id)
+                self._stats["expirations"] += 1
+                live = None
+
+        if live is not None:
+            # Another worker may have advanced this session since we cached it; the
+            # touch also keeps a session that is only being read from expiring
+            backend_version = self.backend.touch(session_id)
+            if backend_version is None:
+                with self._lock:
+                    self._drop(session_id)
+                    self._stats["misses"] += 1
+                return None
+            if backend_version == live.version:
+                with self._lock:
+                    live.last_access = time.time()
+                    self._live.move_to_end(session_id)
+                    self._stats["hits"] += 1
+                return live.advisor
+
+        loaded = self.backend.load(session_id)
+        if loaded is None:
+            with self._lock:
+                self._stats["misses"] += 1
+            return None
+
+        version, blob = loaded
+        advisor = KrishiSahAIAdvisor.from_state(deserialize_state(blob))
+        with self._lock:
+            self._stats["rehydrations"] += 1
+        self._put_live(session_id, advisor, version)
+        return advisor
+
+    def save(self, session_id: str, advisor: KrishiSahAIAdvisor):
+        """
+        Persist the advisor's current state and refresh its live entry. If another
+        worker saved this session in the meantime, the turns added through this
+        advisor are appended to the stored history and the write is retried.
+        """
+        # Two requests of this worker saving the same advisor must not look like a conflict
+        with self._save_locks[hash(session_id) % _SAVE_LOCK_STRIPES]:
+            with self._lock:
+                expected, base = self._synced.get(advisor, (None, []))
+            for _ in range(_SAVE_ATTEMPTS):
+                version = self.backend.store(session_id, serialize_state(advisor.to_state()), expected)
+                if version is not None:
+                    break
+                with self._lock:
+                    self._stats["save_conflicts"] += 1
+                loaded = self.backend.load(session_id)
+                if loaded is None:
+                    expected = None  # expired or deleted meanwhile: write this state as is
+                    continue
+                expected, blob = loaded
+                theirs = KrishiSahAIAdvisor.from_state(deserialize_state(blob))
+                synced_ids = {id(m) for m in base}
+                added = [m for m in advisor.chat_history if id(m) not in synced_ids]
+                advisor.history.reset(theirs.chat_history + added, summary=theirs.history.summary)
+                base = list(theirs.chat_history)
+            else:
+                raise RuntimeError(f"Session {session_id} kept changing, could not save after {_SAVE_ATTEMPTS} attempts")
+            self._put_live(session_id, advisor, version)
+
+    def delete(self, session_id: str):
+        with self._lock:
+            self._drop(session_id)
+        self.backend.delete(session_id)
+
+    def __contains__(self, session_id) -> bool:
+        return self.get(session_id) is not None
+
+    def purge_expired(self) -> int:
+        """Drop idle live sessions and expired backend rows. Returns number of backend rows removed."""
+        cutoff = time.time() - self.idle_ttl
+        with self._lock:
+            for sid in [sid for sid, live in self._live.items() if live.last_access < cutoff]:
+                self._drop(sid)
+                self._stats["expirations"] += 1
+        return self.backend.purge_expired()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                **self._stats,
+                "live_sessions": len(self._live),
+                "live_memory_bytes": self._memory_bytes,
+                "max_sessions": self.max_sessions,
+                "max_memory_bytes": self.max_memory_bytes,
+                "backend": type(self.backend).__name__,
+            }
+
+    def _put_live(self, session_id: str, advisor: KrishiSahAIAdvisor, version: int):
+        size = estimate_session_bytes(advisor)
+        with self._lock:
+            self._synced[advisor] = (version, list(advisor.chat_history))
+            self._drop(session_id)
+            self._live[session_id] = _LiveSession(advisor, version, size)
+            self._memory_bytes += size
+            self._evict()
+
+    def _drop(self, session_id: str):
+        live = self._live.pop(session_id, None)
+        if live is not None:
+            self._memory_bytes -= live.size
+
+    def _evict(self):
+        # Always keep the most recent session, even if it alone exceeds the memory budget
+        while len(self._live) > 1 and (
+            len(self._live) > self.max_sessions or self._memory_bytes > self.max_memory_bytes
+        ):
+            oldest = next(iter(self._live))
+            self._drop(oldest)
+            self._stats["evictions"] += 1
+
+
+def create_session_store() -> AdvisorSessionStore:
+    """Build the session store configured by the ADVISOR_SESSION_* environment variables"""
+    ttl = int(os.getenv("ADVISOR_SESSION_TTL", "86400"))
+    kind = os.getenv("ADVISOR_SESSION_BACKEND", "memory").lower()
+
+    db_path = os.getenv("ADVISOR_SESSION_DB", str(Path(__file__).resolve().parents[2] / "advisor_sessions.db"))
+
+    backend = None
+    try:
+        if kind == "sqlite":
+            backend = SQLiteSessionBackend(db_path, ttl)
+        elif kind == "redis":
+            url = os.getenv("ADVISOR_SESSION_REDIS_URL", "redis://localhost:6379/0")
+            backend = RedisSessionBackend(_redis_client(url, db_path), ttl)
+    except Exception as e:
+        print(f"[ADVISOR] Session backend '{kind}' unavailable ({e}), falling back to in-memory store")
+        backend = None
+
+    if backend is None:
+        backend = InMemorySessionBackend(ttl)
+
+    store = AdvisorSessionStore(
+        backend,
+        max_sessions=int(os.getenv("ADVISOR_SESSION_MAX", "200")),
+        max_memory_bytes=int(float(os.getenv("ADVISOR_SESSION_MAX_MB", "64")) * 1024 * 1024),
+        idle_ttl=ttl,
+    )
+    print(f"[ADVISOR] Session store ready (backend: {type(backend).__name__})")
+    return store
@@ -0,0 +1,178 @@
+"""
+Converts `plant_disease_model.h5` into lightweight CPU artifacts:
+
+    plant_disease_model.tflite        float32 TFLite
+    plant_disease_model_int8.tflite   post-training INT8 TFLite (needs --calibration-dir)
+    plant_disease_model.onnx          ONNX (needs tf2onnx)
+    plant_disease_model_int8.onnx     static INT8 ONNX (needs --calibration-dir and onnxruntime)
+
+and checks each artifact against the Keras model on a fixture set of leaf
+images (top-1 agreement and max probability drift). Conversion refuses to run
+without fixture images unless --skip-parity is given. Serve an artifact with
+DISEASE_RUNTIME=tflite | tflite-int8 | onnx | onnx-int8; production then never imports
+TensorFlow.
+
+Usage:
+    python convert_model.py --formats tflite onnx --int8 \
+        --calibration-dir samples/leaves --fixtures-dir samples/fixtures
+"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+from pathlib import Path
+from typing import Iterator, List
+
+import numpy as np
+
+from disease_detector import (
+    BASE_DIR,
+    MODEL_PATH,
+    TFLITE_PATH,
+    TFLITE_INT8_PATH,
+    ONNX_PATH,
+    ONNX_INT8_PATH,
+    KerasRunner,
+    TFLiteRunner,
+    OnnxRunner,
+    _preprocess,
+)
+
+IMAGE_EXTENSIONS = {".png", ".jpg", ".jpeg", ".bmp", ".gif"}
+
+
+def _image_paths(directory: Path | None, limit: int | None = None) -> List[Path]:
+    if directory is None or not directory.exists():
+        return []
+    paths = sorted(p for p in directory.rglob("*") if p.suffix.lower() in IMAGE_EXTENSIONS)
+    return paths[:limit] if limit else paths
+
+
+def _load_batch(paths: List[Path]) -> np.ndarray:
+    return np.concatenate([_preprocess(p) for p in paths], axis=0)
+
+
+def _representative_samples(paths: List[Path]) -> Iterator[np.ndarray]:
+    for path in paths:
+        yield _preprocess(path)
+
+
+# ============================================
+# CONVERTERS
+# ============================================
+
+def convert_tflite(keras_model, output: Path, calibration: List[Path] | None = None) -> Path:
+    import tensorflow as tf
+
+    converter = tf.lite.TFLiteConverter.from_keras_model(keras_model)
+    if calibration:
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.representative_dataset = lambda: ([sample] for sample in _representative_samples(calibration))
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+        # Keep float32 I/O so callers feed the same preprocessed arrays
+    output.write_bytes(converter.convert())
+    print(f"[CONVERT] Wrote {output.name} ({output.stat().st_size / 1024 / 1024:.1f} MB)")
+    return output
+
+
+def convert_onnx(keras_model, output: Path, opset: int = 13) -> Path:
+    import tensorflow as tf
+    import tf2onnx
+
+    spec = (tf.TensorSpec((None, 128, 128, 3), tf.float32, name="input"),)
+    tf2onnx.convert.from_keras(keras_model, input_signature=spec, opset=opset, output_path=str(output))
+    print(f"[CONVERT] Wrote {output.name} ({output.stat().st_size / 1024 / 1024:.1f} MB)")
+    return output
+
+
+def quantize_onnx(float_model: Path, output: Path, calibration: List[Path]) -> Path:
+    import onnxruntime as ort
+    from onnxruntime.quantization import CalibrationDataReader, QuantType, quantize_static
+
+    input_name = ort.InferenceSession(str(float_model), providers=["CPUExecutionProvider"]).get_inputs()[0].name
+
+    class _Reader(CalibrationDataReader):
+        def __init__(self):
+            self._samples = _representative_samples(calibration)
+
+        def get_next(self):
+            sample = next(self._samples, None)
+            return None if sample is None else {input_name: sample}
+
+    quantize_static(str(float_model), str(output), _Reader(), weight_type=QuantType.QInt8)
+    print(f"[CONVERT] Wrote {output.name} ({output.stat().st_size / 1024 / 1024:.1f} MB)")
+    return output
+
+
+# ============================================
+# PARITY CHECK
+# ============================================
+
+def check_parity(reference: np.ndarray, runner, batch: np.ndarray, min_agreement: float) -> bool:
+    """Compare an artifact's predictions with the Keras reference probabilities."""
+    probs = runner.predict_on_batch(batch)
+    agreement = float(np.mean(np.argmax(probs, axis=1) == np.argmax(reference, axis=1)))
+    max_drift = float(np.max(np.abs(probs - reference)))
+    ok = agreement >= min_agreement
+    status = "OK" if ok else "FAIL"
+    print(f"[PARITY] {runner.name:<6} top-1 agreement {agreement * 100:.1f}% | max prob drift {max_drift:.4f} | {status}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert the plant disease model to TFLite / ONNX.")
+    parser.add_argument("--formats", nargs="+", choices=["tflite", "onnx"], default=["tflite"])
+    parser.add_argument("--int8", action="store_true", help="Also produce INT8 post-training quantized artifacts")
+    parser.add_argument("--calibration-dir", type=Path, help="Sample leaf images for INT8 calibration")
+    parser.add_argument("--calibration-size", type=int, default=200)
+    parser.add_argument("--fixtures-dir", type=Path, default=BASE_DIR / "fixtures", help="Leaf images for the parity check")
+    parser.add_argument("--skip-parity", action="store_true", help="Convert without checking the artifacts against Keras")
+    parser.add_argument("--min-agreement", type=float, default=0.98, help="Required top-1 agreement with Keras (INT8: minus 0.02)")
+    args = parser.parse_args()
+
+    if not MODEL_PATH.exists():
+        sys.exit(f"Model file not found at {MODEL_PATH}")
+
+    fixtures = [] if args.skip_parity else _image_paths(args.fixtures_dir)
+    if not args.skip_parity and not fixtures:
+        sys.exit(f"No fixture images in {args.fixtures_dir}: pass --fixtures-dir with labelled leaves, "
+                 "or --skip-parity to convert without the accuracy check")
+
+    calibration = _image_paths(args.calibration_dir, args.calibration_size)
+    if args.int8 and not calibration:
+        sys.exit("--int8 requires --calibration-dir with sample leaf images")
+
+    keras_runner = KerasRunner(MODEL_PATH)
+    produced = []
+
+    if "tflite" in args.formats:
+        produced.append((TFLiteRunner, convert_tflite(keras_runner.model, TFLITE_PATH), False))
+        if args.int8:
+            produced.append((TFLiteRunner, convert_tflite(keras_runner.model, TFLITE_INT8_PATH, calibration), True))
+
+    if "onnx" in args.formats:
+        onnx_path = convert_onnx(keras_runner.model, ONNX_PATH)
+        produced.append((OnnxRunner, onnx_path, False))
+        if args.int8:
+            produced.append((OnnxRunner, quantize_onnx(onnx_path, ONNX_INT8_PATH, calibration), True))
+
+    if args.skip_parity:
+        print("[PARITY] Skipped (--skip-parity): artifacts were not checked against Keras")
+        return
+
+    batch = _load_batch(fixtures)
+    reference = keras_runner.predict_on_batch(batch)
+    all_ok = True
+    for runner_cls, path, quantized in produced:
+        runner = runner_cls(path)
+        runner.name = f"{runner.name}{'-int8' if quantized else ''}"
+        threshold = args.min_agreement - (0.02 if quantized else 0.0)
+        all_ok = check_parity(reference, runner, batch, threshold) and all_ok
+
+    if not all_ok:
+        sys.exit("Parity check failed: do not deploy the failing artifact(s)")
+
+
+if __name__ == "__main__":
+    main()
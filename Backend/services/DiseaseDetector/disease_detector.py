@@ -1,26 +1,42 @@
 """
 Standalone disease detector helper.
-Loads the trained TensorFlow model from `plant_disease_model.h5`
-and exposes a simple `predict(image_path)` function that returns the
+Loads the trained model (Keras `plant_disease_model.h5`, or a TFLite / ONNX
+artifact converted from it, see DISEASE_RUNTIME and convert_model.py)
+and exposes a simple `predict(image)` function that returns the
 detected crop, disease and confidence score.
+
+`image` may be a file path, raw encoded bytes, a binary file-like object
+(e.g. a Flask upload stream) or an already-decoded RGB array, so callers
+never need to write uploads to disk.
+
+Concurrent `predict` calls are coalesced by a micro-batching scheduler
+(DISEASE_BATCH_MAX_SIZE / DISEASE_BATCH_MAX_WAIT_MS, disable with
+DISEASE_BATCHING=0); `predict_batch` runs many images in one call through
+the same scheduler. A request still waiting after DISEASE_PREDICT_TIMEOUT
+seconds (default 30) gets an error result instead of blocking its thread.
 """
 
 from __future__ import annotations
 
+import io
 import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeout
 from pathlib import Path
-from typing import Dict, Any
+from typing import Dict, Any, BinaryIO, Iterable, List, Union
 
 import numpy as np
-try:
-    import tensorflow as tf
-except ImportError:
-    tf = None
 from PIL import Image
 
 # Resolve paths relative to this file so the script works from anywhere.
 BASE_DIR = Path(__file__).resolve().parent
 MODEL_PATH = BASE_DIR / "plant_disease_model.h5"
+TFLITE_PATH = BASE_DIR / "plant_disease_model.tflite"
+TFLITE_INT8_PATH = BASE_DIR / "plant_disease_model_int8.tflite"
+ONNX_PATH = BASE_DIR / "plant_disease_model.onnx"
+ONNX_INT8_PATH = BASE_DIR / "plant_disease_model_int8.onnx"
 
 # Class labels used during model training (must keep ordering intact).
 CLASS_NAMES = [
@@ -64,27 +80,154 @@ CLASS_NAMES = [
     'Tomato___healthy'
 ]
 
+INPUT_SIZE = (128, 128)
+
+ImageSource = Union[str, os.PathLike, bytes, bytearray, memoryview, BinaryIO, "Image.Image", np.ndarray]
+
+# Runtime used to execute the classifier:
+#   keras       - tf.keras on plant_disease_model.h5 (imports TensorFlow)
+#   tflite      - plant_disease_model.tflite via tflite_runtime (or tf.lite as fallback)
+#   tflite-int8 - plant_disease_model_int8.tflite
+#   onnx        - plant_disease_model.onnx via onnxruntime
+#   onnx-int8   - plant_disease_model_int8.onnx
+#   auto        - first available of tflite, onnx, keras
+# Artifacts are produced by convert_model.py.
+RUNTIME = os.getenv("DISEASE_RUNTIME", "auto").lower()
+
 _MODEL: Any | None = None
 
 
+def _import_tensorflow():
+    try:
+        import tensorflow as tf
+        return tf
+    except ImportError:
+        return None
+
+
+class KerasRunner:
+    """Executes the original Keras .h5 model."""
+
+    name = "keras"
+
+    def __init__(self, model_path: Path):
+        tf = _import_tensorflow()
+        if tf is None:
+            raise RuntimeError("TensorFlow not installed")
+        self.model = tf.keras.models.load_model(str(model_path))
+
+    def predict_on_batch(self, batch: np.ndarray) -> np.ndarray:
+        return np.asarray(self.model.predict_on_batch(batch))
+
+
+class TFLiteRunner:
+    """Executes a .tflite artifact. Handles float and fully-quantized (int8/uint8) I/O."""
+
+    name = "tflite"
+
+    def __init__(self, model_path: Path):
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            tf = _import_tensorflow()
+            if tf is None:
+                raise RuntimeError("Neither tflite_runtime nor TensorFlow is installed")
+            Interpreter = tf.lite.Interpreter
+        self.interpreter = Interpreter(model_path=str(model_path), num_threads=os.cpu_count())
+        self.input_detail = self.interpreter.get_input_details()[0]
+        self.output_detail = self.interpreter.get_output_details()[0]
+        self._batch_size = None
+        # The interpreter is not thread-safe
+        self._lock = threading.Lock()
+
+    def _resize(self, batch_size: int):
+        if batch_size != self._batch_size:
+            self.interpreter.resize_tensor_input(self.input_detail["index"], [batch_size, *INPUT_SIZE[::-1], 3])
+            self.interpreter.allocate_tensors()
+            self.input_detail = self.interpreter.get_input_details()[0]
+            self.output_detail = self.interpreter.get_output_details()[0]
+            self._batch_size = batch_size
+
+    def predict_on_batch(self, batch: np.ndarray) -> np.ndarray:
+        with self._lock:
+            self._resize(len(batch))
+            in_dtype = self.input_detail["dtype"]
+            if in_dtype != np.float32:
+                scale, zero_point = self.input_detail["quantization"]
+                batch = np.clip(np.round(batch / scale + zero_point), np.iinfo(in_dtype).min, np.iinfo(in_dtype).max)
+            self.interpreter.set_tensor(self.input_detail["index"], batch.astype(in_dtype, copy=False))
+            self.interpreter.invoke()
+            out = self.interpreter.get_tensor(self.output_detail["index"]).copy()
+        if out.dtype != np.float32:
+            scale, zero_point = self.output_detail["quantization"]
+            out = (out.astype(np.float32) - zero_point) * scale
+        return out
+
+
+class OnnxRunner:
+    """Executes a .onnx artifact with ONNX Runtime on CPU."""
+
+    name = "onnx"
+
+    def __init__(self, model_path: Path):
+        import onnxruntime as ort
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(str(model_path), options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def predict_on_batch(self, batch: np.ndarray) -> np.ndarray:
+        return self.session.run(None, {self.input_name: batch.astype(np.float32, copy=False)})[0]
+
+
+_RUNTIMES = {
+    "keras": (KerasRunner, MODEL_PATH),
+    "tflite": (TFLiteRunner, TFLITE_PATH),
+    "tflite-int8": (TFLiteRunner, TFLITE_INT8_PATH),
+    "onnx": (OnnxRunner, ONNX_PATH),
+    "onnx-int8": (OnnxRunner, ONNX_INT8_PATH),
+}
+
+
+def _load_runner(runtime: str) -> Any:
+    runner_cls, path = _RUNTIMES[runtime]
+    if not path.exists():
+        raise FileNotFoundError(f"Model file not found at {path}")
+    runner = runner_cls(path)
+    print(f"[DISEASE] Using {runtime} runtime ({path.name})")
+    return runner
+
+
 def _load_model() -> Any:
-    """Load and cache the TensorFlow model."""
+    """Load and cache the classifier for the configured runtime."""
     global _MODEL
     if _MODEL is None:
-        if tf is None:
-            print("Warning: TensorFlow not installed. Disease detector will return error messages.")
-            return None
-        if not MODEL_PATH.exists():
-            print(f"Warning: Model file not found at {MODEL_PATH}")
-            return None
-        try:
-            _MODEL = tf.keras.models.load_model(str(MODEL_PATH))
-        except Exception as e:
-            print(f"Error loading model: {e}")
+        candidates = ["tflite", "onnx", "keras"] if RUNTIME == "auto" else [RUNTIME]
+        for runtime in candidates:
+            if runtime not in _RUNTIMES:
+                print(f"Warning: Unknown DISEASE_RUNTIME '{runtime}'")
+                continue
+            try:
+                _MODEL = _load_runner(runtime)
+                break
+            except Exception as e:
+                if RUNTIME != "auto" or runtime == "keras":
+                    print(f"Error loading model ({runtime}): {e}")
+        if _MODEL is None:
+            print("Warning: No disease model runtime available. Disease detector will return error messages.")
             return None
     return _MODEL
 
 
+def get_runtime_info() -> Dict[str, Any]:
+    """Which runtime is serving (without forcing a model load)."""
+    return {
+        "configured": RUNTIME,
+        "active": getattr(_MODEL, "name", None),
+        "model": type(_MODEL).__name__ if _MODEL is not None else None,
+    }
+
+
 def init_model():
     """Explicitly load the model to warm it up."""
     print("Preloading Disease Detection Model...")
@@ -92,31 +235,47 @@ def init_model():
     print("Disease Detection Model loaded successfully.")
 
 
-def _preprocess(image_path: str | os.PathLike) -> np.ndarray:
-    """Resize and normalize the image for prediction."""
-    with Image.open(image_path) as img:
-        img = img.convert("RGB")
-        img = img.resize((128, 128))
-        arr = np.array(img, dtype=np.float32)
+def _to_rgb_array(img: "Image.Image") -> np.ndarray:
+    img = img.convert("RGB")
+    if img.size != INPUT_SIZE:
+        img = img.resize(INPUT_SIZE)
+    return np.asarray(img, dtype=np.float32)
+
+
+def _preprocess(image: ImageSource) -> np.ndarray:
+    """Decode (if needed), resize and normalize the image for prediction."""
+    if isinstance(image, np.ndarray):
+        if image.ndim == 4:
+            image = image[0]
+        if image.shape[:2] == INPUT_SIZE[::-1] and image.shape[-1] == 3:
+            arr = image.astype(np.float32, copy=False)
+        else:
+            arr = _to_rgb_array(Image.fromarray(image.astype(np.uint8, copy=False)))
+        return np.expand_dims(arr, axis=0)
+
+    if isinstance(image, Image.Image):
+        return np.expand_dims(_to_rgb_array(image), axis=0)
+
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        image = io.BytesIO(image)
+
+    # Path (fallback) or binary stream
+    with Image.open(image) as img:
+        arr = _to_rgb_array(img)
     return np.expand_dims(arr, axis=0)
 
 
-def predict(image_path: str | os.PathLike) -> Dict[str, Any]:
-    """
-    Run detection on the provided image path.
+def _unavailable_result(reason: str = "model runtime or file missing") -> Dict[str, Any]:
+    return {
+        "crop": "Error",
+        "disease": f"Disease detection service is currently unavailable ({reason}).",
+        "confidence": 0.0,
+        "severity": "low",
+    }
 
-    Returns a dict containing crop, disease, confidence and severity.
-    """
-    model = _load_model()
-    if model is None:
-        return {
-            "crop": "Error",
-            "disease": "Disease detection service is currently unavailable (TensorFlow/Model missing).",
-            "confidence": 0.0,
-            "severity": "low",
-        }
-    processed = _preprocess(image_path)
-    prediction = model.predict(processed, verbose=0)[0]
+
+def _postprocess(prediction: np.ndarray) -> Dict[str, Any]:
+    """Turn one row of class probabilities into the API result dict."""
     class_idx = int(np.argmax(prediction))
     confidence = float(prediction[class_idx])
 
@@ -151,6 +310,215 @@ def predict(image_path: str | os.PathLike) -> Dict[str, Any]:
     }
 
 
+# The scheduler thread and unbatched callers share one model; Keras is not re-entrant
+_forward_lock = threading.Lock()
+
+
+def _forward(model: Any, batch: np.ndarray) -> np.ndarray:
+    """Single forward pass over an (N, 128, 128, 3) batch."""
+    with _forward_lock:
+        return np.asarray(model.predict_on_batch(batch.astype(np.float32, copy=False)))
+
+
+# ============================================
+# DYNAMIC MICRO-BATCHING
+# ============================================
+
+class _BatchRequest:
+    __slots__ = ("array", "future")
+
+    def __init__(self, array: np.ndarray):
+        self.array = array
+        self.future: Future = Future()
+
+
+class BatchScheduler:
+    """
+    Coalesces concurrent single-image requests into one forward pass.
+
+    The worker thread blocks until a request arrives, then keeps collecting
+    until either `max_batch_size` requests are queued or `max_wait_ms` has
+    passed since the first one. A lone request therefore waits at most
+    `max_wait_ms` before running on its own.
+    """
+
+    def __init__(self, max_batch_size: int = 16, max_wait_ms: float = 5.0):
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self._queue: "queue.Queue[_BatchRequest]" = queue.Queue()
+        self._thread: threading.Thread | None = None
+        self._lock = threading.Lock()
+        self.stats = {"batches": 0, "images": 0, "max_batch_seen": 0}
+
+    def _ensure_worker(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="disease-batcher", daemon=True)
+                self._thread.start()
+
+    def submit(self, array: np.ndarray) -> Future:
+        """Queue one preprocessed (128, 128, 3) image; resolves to its probability row."""
+        self._ensure_worker()
+        request = _BatchRequest(array)
+        self._queue.put(request)
+        return request.future
+
+    def _collect(self) -> list:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                # Deadline passed: still take anything already queued, but don't wait
+                try:
+                    batch.append(self._queue.get_nowait())
+                    continue
+                except queue.Empty:
+                    break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            # Requests that timed out while queued were cancelled by their caller
+            batch = [r for r in self._collect() if r.future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            model = _load_model()
+            if model is None:
+                for request in batch:
+                    request.future.set_exception(RuntimeError("Disease model unavailable"))
+                continue
+            try:
+                probs = _forward(model, np.stack([r.array for r in batch]))
+            except Exception as e:
+                for request in batch:
+                    request.future.set_exception(e)
+                continue
+
+            self.stats["batches"] += 1
+            self.stats["images"] += len(batch)
+            self.stats["max_batch_seen"] = max(self.stats["max_batch_seen"], len(batch))
+            for request, row in zip(batch, probs):
+                request.future.set_result(row)
+
+
+_BATCHING_ENABLED = os.getenv("DISEASE_BATCHING", "1").lower() not in {"0", "false"}
+PREDICT_TIMEOUT = float(os.getenv("DISEASE_PREDICT_TIMEOUT", "30"))
+_timeouts = 0
+_scheduler = BatchScheduler(
+    max_batch_size=int(os.getenv("DISEASE_BATCH_MAX_SIZE", "16")),
+    max_wait_ms=float(os.getenv("DISEASE_BATCH_MAX_WAIT_MS", "5")),
+)
+
+
+def get_batch_stats() -> Dict[str, Any]:
+    """Counters for the micro-batching scheduler."""
+    return {
+        "enabled": _BATCHING_ENABLED,
+        "max_batch_size": _scheduler.max_batch_size,
+        "max_wait_ms": _scheduler.max_wait * 1000.0,
+        **_scheduler.stats,
+        "timeouts": _timeouts,
+    }
+
+
+def _await_prediction(future: Future, deadline: float) -> np.ndarray | None:
+    """The probability row, or None once `deadline` (time.monotonic) has passed."""
+    global _timeouts
+    try:
+        return future.result(timeout=max(0.0, deadline - time.monotonic()))
+    except FutureTimeout:
+        future.cancel()
+        _timeouts += 1
+        return None
+
+
+# ============================================
+# PUBLIC API
+# ============================================
+
+def predict_bytes(data: bytes) -> Dict[str, Any]:
+    """Run detection on encoded image bytes (JPEG/PNG/...) without touching disk."""
+    return predict(data)
+
+
+def predict_array(arr: np.ndarray) -> Dict[str, Any]:
+    """Run detection on an already-decoded HxWx3 RGB array."""
+    return predict(arr)
+
+
+def predict(image: ImageSource) -> Dict[str, Any]:
+    """
+    Run detection on the provided image (path, bytes, stream or RGB array).
+
+    Concurrent calls are coalesced by the batch scheduler into a single
+    forward pass. Returns a dict containing crop, disease, confidence and severity.
+    """
+    model = _load_model()
+    if model is None:
+        return _unavailable_result()
+    processed = _preprocess(image)
+    if _BATCHING_ENABLED:
+        prediction = _await_prediction(_scheduler.submit(processed[0]), time.monotonic() + PREDICT_TIMEOUT)
+        if prediction is None:
+            return _unavailable_result(f"no result within {PREDICT_TIMEOUT:g}s, please try again")
+    else:
+        prediction = _forward(model, processed)[0]
+    return _postprocess(prediction)
+
+
+def predict_batch(images: Iterable[ImageSource]) -> List[Dict[str, Any]]:
+    """
+    Run detection on many images at once. With batching enabled the images go
+    through the scheduler (which runs them in chunks of its max batch size,
+    together with concurrent single requests); otherwise they run here in chunks
+    of that size. Images that cannot be decoded or time out get an error entry
+    instead of failing the whole batch.
+    """
+    images = list(images)
+    model = _load_model()
+    if model is None:
+        return [_unavailable_result() for _ in images]
+
+    results: List[Dict[str, Any] | None] = [None] * len(images)
+    arrays, positions = [], []
+    for i, image in enumerate(images):
+        try:
+            arrays.append(_preprocess(image)[0])
+            positions.append(i)
+        except Exception as e:
+            results[i] = {
+                "crop": "Unknown",
+                "disease": f"Could not read image: {e}",
+                "confidence": 0.0,
+                "severity": "low",
+            }
+
+    if _BATCHING_ENABLED:
+        deadline = time.monotonic() + PREDICT_TIMEOUT
+        futures = [_scheduler.submit(arr) for arr in arrays]
+        for pos, future in zip(positions, futures):
+            row = _await_prediction(future, deadline)
+            if row is None:
+                results[pos] = _unavailable_result(f"no result within {PREDICT_TIMEOUT:g}s, please try again")
+            else:
+                results[pos] = _postprocess(row)
+        return results
+
+    chunk = _scheduler.max_batch_size
+    for start in range(0, len(arrays), chunk):
+        probs = _forward(model, np.stack(arrays[start:start + chunk]))
+        for pos, row in zip(positions[start:start + chunk], probs):
+            results[pos] = _postprocess(row)
+    return results
+
+
 if __name__ == "__main__":
     import argparse
 
@@ -1,39 +1,105 @@
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_ollama import ChatOllama
-from langchain_core.output_parsers import JsonOutputParser
-from services.FarmHealth.src.prompts import HEALTH_ANALYSIS_SYSTEM_PROMPT, HEALTH_GUARDRAIL_PROMPT
+from services.Shared.llm_registry import get_llm, RoleLimiter
+from services.Shared.generation_cache import get_generation_cache
+from services.Shared.single_flight import SingleFlight
+from langchain_core.output_parsers import JsonOutputParser, StrOutputParser
+from services.FarmHealth.src.prompts import HEALTH_ANALYSIS_SYSTEM_PROMPT, HEALTH_GUARDRAIL_PROMPT, HEALTH_CHAT_SYSTEM_PROMPT
+from collections import OrderedDict
+import hashlib
 import json
 import os
+import re
 import threading
 
+# Analyses allowed to run against Ollama at once (the json role cap still applies on top)
+MAX_CONCURRENCY = max(1, int(os.getenv("FARM_HEALTH_MAX_CONCURRENCY", "2")))
+
+# Compacted chat contexts kept per process, keyed by analysis hash
+CONTEXT_CACHE_SIZE = 256
+
+_COORDINATES = re.compile(r"^\s*(-?\d+(?:\.\d+)?)\s*,\s*(-?\d+(?:\.\d+)?)\s*$")
+
+
+def _compact_value(value) -> str:
+    if isinstance(value, dict):
+        return "; ".join(f"{k}: {_compact_value(v)}" for k, v in value.items() if v not in (None, "", [], {}))
+    if isinstance(value, (list, tuple)):
+        return ", ".join(_compact_value(v) for v in value)
+    return " ".join(str(value).split())
+
+
+def compact_analysis(context: dict) -> str:
+    """
+    Render an analyze_health() result as short plain lines for the chat prompt:
+    one line per fertilizer option, one for market advice, one per insight.
+    Unknown keys are kept as "key: value" lines so nothing the client sent is lost.
+    """
+    lines = []
+    for option in context.get("fertilizer_options") or []:
+        if isinstance(option, dict):
+            fields = [option.get(name) for name in ("name", "action", "quantity", "timing")]
+            line = " | ".join(" ".join(str(f).split()) for f in fields if f)
+            if option.get("advantages"):
+                line += f" | pros: {_compact_value(option['advantages'])}"
+            lines.append(f"- {line}")
+        else:
+            lines.append(f"- {_compact_value(option)}")
+
+    market = context.get("market_advice")
+    if isinstance(market, dict):
+        confidence = market.get("confidence_label") or ""
+        if market.get("confidence_percentage") is not None:
+            confidence = f"{confidence} {market['confidence_percentage']}%".strip()
+        lines.append(f"Market: {_compact_value(market.get('timing', ''))} ({confidence}) - {_compact_value(market.get('rationale', ''))}")
+    elif market:
+        lines.append(f"Market: {_compact_value(market)}")
+
+    for insight in context.get("insights") or []:
+        lines.append(f"* {_compact_value(insight)}")
+
+    for key, value in context.items():
+        if key not in ("fertilizer_options", "market_advice", "insights") and value not in (None, "", [], {}):
+            lines.append(f"{key}: {_compact_value(value)}")
+    return "\n".join(lines)
+
+
+def _location_bucket(location: str) -> str:
+    """Coordinates rounded to ~10 km, otherwise the normalized place name"""
+    match = _COORDINATES.match(location or "")
+    if match:
+        return f"{float(match.group(1)):.1f},{float(match.group(2)):.1f}"
+    return " ".join((location or "").split()).casefold()
+
+
 class FarmHealthEngine:
     def __init__(self):
-        # FIX: Ensure consistent model and url naming
-        self.model_name = os.getenv("OLLAMA_MODEL", "llama3.2")
-        self.base_url = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
-        self.lock = threading.Lock()
+        self.limiter = RoleLimiter("farm_health", MAX_CONCURRENCY)
+        # Identical requests arriving together share one generation
+        self.in_flight = SingleFlight("FARM_HEALTH")
+        self._contexts: "OrderedDict[str, str]" = OrderedDict()
+        self._contexts_lock = threading.Lock()
         
         # Optimized for JSON extraction
-        self.json_llm = ChatOllama(
-            model=self.model_name,
+        self.json_llm = get_llm(
+            "json",
             temperature=0.1,  # Low temp is critical for JSON stability
-            format="json",     # Forces Llama 3.2 into JSON mode
-            base_url=self.base_url,
             num_predict=1500
         )
         
         # Optimized for conversational chat
-        self.chat_llm = ChatOllama(
-            model=self.model_name,
+        self.chat_llm = get_llm(
+            "chat",
             temperature=0.4,
-            base_url=self.base_url,
             num_predict=1500
         )
 
+    HUMAN_TEMPLATE = "Analyze recommendations for {crop_name} in {location}. Output in {language} where possible."
+
     def analyze_health(self, crop_name: str, soil_data: dict, location: str, soil_type: str, language: str = "English") -> dict:
+        system_prompt = HEALTH_ANALYSIS_SYSTEM_PROMPT + "\n" + HEALTH_GUARDRAIL_PROMPT
         prompt = ChatPromptTemplate.from_messages([
-            ("system", HEALTH_ANALYSIS_SYSTEM_PROMPT + "\n" + HEALTH_GUARDRAIL_PROMPT),
-            ("human", "Analyze recommendations for {crop_name} in {location}. Output in {language} where possible."),
+            ("system", system_prompt),
+            ("human", self.HUMAN_TEMPLATE),
         ])
         
         chain = prompt | self.json_llm | JsonOutputParser()
@@ -45,22 +111,81 @@ class FarmHealthEngine:
             f"pH: {soil_data.get('ph')}"
         )
 
-        try:
-            with self.lock:
+        def generate():
+            with self.limiter.slot():
                 print(f"[FARM_HEALTH] Processing request for: {crop_name}")
                 # Langchain chain.invoke handles the dictionary mapping
-                response = chain.invoke({
+                return chain.invoke({
                     "crop_name": crop_name, 
                     "location": location,
                     "soil_data": soil_context,
                     "language": language
                 })
-                return response
+
+        flight_key = (
+            " ".join(str(crop_name).split()).casefold(),
+            *(str(soil_data.get(name)) for name in ("n", "p", "k", "ph")),
+            " ".join(str(soil_type).split()).casefold(),
+            _location_bucket(location),
+            str(language).casefold(),
+        )
+
+        try:
+            # Identical inputs return the stored analysis instead of re-running the model
+            return self.in_flight.do(flight_key, lambda: get_generation_cache().cached(
+                "farm_health",
+                system_prompt + self.HUMAN_TEMPLATE,
+                self.json_llm,
+                {"crop_name": crop_name, "soil_context": soil_context, "location": location, "language": language},
+                generate,
+            ))
         except Exception as e:
             print(f"Error in FarmHealthEngine: {e}")
             # Ensure we return valid JSON even on error so UI stops loading
             return self.get_error_fallback()
 
+    def _chat_context(self, context) -> str:
+        """Compact the analysis once per distinct analysis and reuse it for every question"""
+        if not isinstance(context, dict):
+            return " ".join(str(context).split())
+        key = hashlib.sha256(json.dumps(context, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+        with self._contexts_lock:
+            compact = self._contexts.get(key)
+            if compact is not None:
+                self._contexts.move_to_end(key)
+                return compact
+        compact = compact_analysis(context)
+        with self._contexts_lock:
+            self._contexts[key] = compact
+            while len(self._contexts) > CONTEXT_CACHE_SIZE:
+                self._contexts.popitem(last=False)
+        return compact
+
+    def stream_chat_health(self, context, question: str, language: str = "English"):
+        """Answer a follow-up question about an analysis, yielding response tokens"""
+        # Rules first, then the analysis: the prefix stays identical across questions on one analysis
+        prompt = ChatPromptTemplate.from_messages([
+            ("system", HEALTH_CHAT_SYSTEM_PROMPT),
+            ("human", "{question}"),
+        ])
+        chain = prompt | self.chat_llm | StrOutputParser()
+
+        try:
+            # yield from: closing this generator (client disconnect) closes the Ollama stream
+            yield from chain.stream({
+                "context": self._chat_context(context),
+                "language": language,
+                "question": question,
+            })
+        except Exception as e:
+            print(f"Error in Farm Health Stream Chat: {e}")
+            yield "I apologize, but I'm having trouble connecting to the knowledge base right now. Please try again."
+
+    def stats(self) -> dict:
+        limiter = self.limiter.stats()
+        limiter.pop("latency", None)
+        return {"concurrency": limiter, "coalescing": self.in_flight.stats()}
+
     def get_error_fallback(self):
         return {
             "fertilizer_options": [
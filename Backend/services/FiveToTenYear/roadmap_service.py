@@ -1,9 +1,9 @@
 
-import os
 import json
 import firebase_admin
 from firebase_admin import firestore
-from langchain_ollama import ChatOllama
+from services.Shared.llm_registry import get_llm
+from services.Shared.roadmap_stream import ROADMAP_HEADERS, stream_roadmap_events
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 
@@ -39,11 +39,7 @@ BUSINESS_OPTIONS = [
 
 class SustainabilityRoadmapGenerator:
     def __init__(self):
-        self.llm = ChatOllama(
-            model=os.getenv("OLLAMA_MODEL", "llama3.2"),
-            temperature=0.5, # Increased for better structured output
-            base_url=os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
-        )
+        self.llm = get_llm("long-form", temperature=0.5) # Increased for better structured output
 
     def get_farmer_profile(self, user_id):
         try:
@@ -71,7 +67,8 @@ class SustainabilityRoadmapGenerator:
                 return b
         return {"title": business_title_or_id, "id": "unknown"}
 
-    def generate_roadmap(self, user_id, business_name, language='en'):
+    def _build_roadmap_prompt(self, user_id, business_name, language):
+        """Returns (prompt, context, lang_upper) for the blocking and streaming generators."""
         # 1. Fetch Data
         profile = self.get_farmer_profile(user_id)
         if not profile:
@@ -197,6 +194,11 @@ Structure (Use these exact Headers in {context['language_name']}):
 DISCLAIMER: This roadmap is an AI-generated simulation based on provided data and regional averages. Actual results may vary due to market fluctuations, climate conditions, and individual management. This should not be considered financial or legal advice. Consult with local agricultural experts before major investments.
 """
         
+        return prompt, context, lang_upper
+
+    def generate_roadmap(self, user_id, business_name, language='en'):
+        prompt, context, lang_upper = self._build_roadmap_prompt(user_id, business_name, language)
+
         # 4. Call LLM
         print(f"[ROADMAP] Generating roadmap for {business_name} in {lang_upper} using markdown prompt...")
         try:
@@ -223,6 +225,31 @@ DISCLAIMER: This roadmap is an AI-generated simulation based on provided data an
                 "final_verdict": "Retry Later"
             }
 
+    def stream_roadmap(self, user_id, business_name, language='en'):
+        """
+        Streaming variant of generate_roadmap: yields token events, then each section /
+        year as soon as it is complete, and finally {"type": "done", "roadmap": ...} with
+        the same dict generate_roadmap would return for the same text.
+        """
+        prompt, context, lang_upper = self._build_roadmap_prompt(user_id, business_name, language)
+        print(f"[ROADMAP] Streaming roadmap for {business_name} in {lang_upper}...")
+        yield {"type": "meta", "title": f"10-Year Sustainability & Profit Planner for {context['business_name']}"}
+        try:
+            yield from stream_roadmap_events(
+                self.llm,
+                prompt,
+                lambda text: self.parse_markdown_roadmap(text, context['business_name'], lang_upper),
+            )
+        except Exception as e:
+            print(f"[ROADMAP ERROR] Streaming failed: {e}")
+            yield {"type": "error", "error": str(e)}
+            yield {"type": "done", "roadmap": {
+                "title": f"Roadmap for {business_name} (Error)",
+                "overview": "Could not generate detailed roadmap due to high server load.",
+                "phases": [],
+                "final_verdict": "Retry Later"
+            }}
+
     def parse_markdown_roadmap(self, text, business_name, language='EN'):
         """
         Parses the multi-section Markdown output into a dictionary for the frontend.
@@ -241,16 +268,7 @@ DISCLAIMER: This roadmap is an AI-generated simulation based on provided data an
             "disclaimer": ""
         }
 
-        # Multi-language header mapping for the parser
-        # We look for ANY of these patterns to demarcate sections
-        HEADERS = {
-            "overview": r'# (?:Overview|अवलोकन|आढावा|Crop Overview|फसल अवलोकन|पीक आढावा)',
-            "planner": r'# (?:1\. 10-Year Growth & Profit Planner|1\. 10-वर्षीय विकास और लाभ योजनाकार|1\. 10-वर्षांचे विकास आणि नफा नियोजक|1\. Crop Lifecycle Planner|1\. फसल जीवनचक्र योजनाकार|1\. पीक जीवनचक्र नियोजक)',
-            "labor": r'# (?:2\. Labor & Aging Analysis|2\. श्रम और उम्र बढ़ने का विश्लेषण|2\. श्रम आणि वृद्धत्व विश्लेषण|2\. Resource & Labor Management|2\. संसाधन और श्रम प्रबंधन|2\. संसाधन आणि श्रम व्यवस्थापन)',
-            "sustainability": r'# (?:3\. Sustainability & Succession|3\. स्थिरता और उत्तराधिकार|3\. शाश्वतता आणि उत्तराधिकार|3\. Quality & Harvest Sustainability|3\. गुणवत्ता और फसल स्थिरता|3\. गुणवत्ता आणि पीक शाश्वतता)',
-            "resilience": r'# (?:4\. Financial Resilience|4\. वित्तीय लचीलापन|4\. आर्थिक लवचिकता|4\. Market & Risk Management|4\. बाजार और जोखिम प्रबंधन|4\. बाजार आणि जोखीम व्यवस्थापन)',
-            "verdict": r'# (?:5\. Final Verdict|5\. अंतिम निर्णय|5\. अंतिम निकाल|5\. Final Harvest Verdict|5\. अंतिम फसल निर्णय|5\. अंतिम पीक निकाल)'
-        }
+        HEADERS = ROADMAP_HEADERS
 
         def extract_between(start_regex, end_regex=None):
             if end_regex:
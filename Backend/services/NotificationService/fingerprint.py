@@ -0,0 +1,80 @@
+"""
+Fingerprints of the inputs a notification batch was generated from.
+
+The scheduler runs every 30 minutes, but on a quiet day nothing the prompt
+depends on changes between runs. A fingerprint keeps only what would change
+the notifications:
+
+    profile   hash of the farmer profile (location, crops, land, soil, irrigation)
+    weather   bands instead of raw readings: rain probability band, current
+              temperature in NOTIFICATION_TEMP_BAND degree bands, daily max/min
+              bands, and wet vs dry sky; a 0.3 degree drift or "Sunny" turning
+              into "Clear" keeps the same fingerprint
+    news      ids (url, else headline) of the articles the prompt includes
+
+Rain probability is banded as (0, 10], (10, 20], ... (upper bound
+inclusive), matching the `> 60` rule in the prompt and the `> 70` Heavy Rain
+Alert in `_process_and_prioritize`: 60 and 61 (or 70 and 71) always fall in
+different bands, so crossing a threshold always changes the fingerprint.
+"""
+
+import hashlib
+import json
+import math
+import os
+from typing import Any, Dict, List
+
+TEMP_BAND = max(1.0, float(os.getenv("NOTIFICATION_TEMP_BAND", "3")))
+
+# Number of news articles passed to the LLM (see NotificationEngine._generate_ai_insights)
+NEWS_IN_PROMPT = 2
+
+_WET_WORDS = ("rain", "drizzle", "shower", "thunder", "storm", "sleet", "snow", "hail")
+
+
+def _band(value, width: float):
+    try:
+        return int(float(value) // width)
+    except (TypeError, ValueError):
+        return None
+
+
+def _rain_band(value):
+    """ceil(p / 10): the alert rules use strict `>` thresholds at multiples of ten"""
+    try:
+        return math.ceil(float(value) / 10)
+    except (TypeError, ValueError):
+        return None
+
+
+def profile_hash(profile: Dict[str, Any]) -> str:
+    raw = json.dumps(profile, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:16]
+
+
+def weather_bands(weather: Dict[str, Any]) -> Dict[str, Any]:
+    if not isinstance(weather, dict) or "error" in weather:
+        return {"error": True}
+    condition = str(weather.get("condition") or "").casefold()
+    return {
+        "rain_band": _rain_band(weather.get("rainfall_probability")),
+        "temp": _band(weather.get("temperature"), TEMP_BAND),
+        "max": _band(weather.get("daily_max_temp"), TEMP_BAND),
+        "min": _band(weather.get("daily_min_temp"), TEMP_BAND),
+        "wet": any(word in condition for word in _WET_WORDS),
+    }
+
+
+def news_ids(news) -> List[str]:
+    if not isinstance(news, list):
+        return []
+    return [str(a.get("url") or a.get("headline") or "") for a in news[:NEWS_IN_PROMPT] if isinstance(a, dict)]
+
+
+def input_fingerprint(profile: Dict[str, Any], weather: Dict[str, Any], news) -> str:
+    parts = {
+        "profile": profile_hash(profile),
+        "weather": weather_bands(weather),
+        "news": news_ids(news),
+    }
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode("utf-8")).hexdigest()[:20]
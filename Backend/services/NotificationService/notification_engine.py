@@ -5,17 +5,36 @@ import asyncio
 import firebase_admin
 from firebase_admin import firestore
 from datetime import datetime
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Tuple
 
 # Internal Service Imports
 from services.WeatherNewsIntegration.weather_service import WeatherService
 from services.WeatherNewsIntegration.news_service import NewsService
+from services.NotificationService.fingerprint import input_fingerprint
+from services.NotificationService.notification_store import create_notification_store
+from services.NotificationService.notification_hub import notification_hub
 
 # LangChain Imports
-from langchain_ollama import ChatOllama
+from services.Shared.llm_registry import get_llm
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 
+# A batch whose input fingerprint is unchanged is reused for at most this long
+MAX_REUSE_SECONDS = float(os.getenv("NOTIFICATION_MAX_REUSE_HOURS", "6")) * 3600
+
+# Verbose per-step trace of generation runs; unset to disable
+DEBUG_LOG_PATH = os.getenv("NOTIFICATION_DEBUG_LOG")
+
+
+def _debug_log(message: str):
+    if not DEBUG_LOG_PATH:
+        return
+    try:
+        with open(DEBUG_LOG_PATH, "a") as logf:
+            logf.write(f"[NOTIF-ENGINE] {message}\n")
+    except OSError:
+        pass
+
 class NotificationEngine:
     def __init__(self):
         self.weather_service = WeatherService()
@@ -25,17 +44,15 @@ class NotificationEngine:
         
         # LLM Setup
         self.llm_model = os.getenv("OLLAMA_MODEL", "llama3.2")
-        self.llm_base_url = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
-        self.llm = ChatOllama(
-            model=self.llm_model,
-            base_url=self.llm_base_url,
+        self.llm = get_llm(
+            "json",
             temperature=0.3, # Low temperature for more deterministic/factual outputs
-            num_ctx=4096
+            format=None,  # Output is a JSON array, parsed after stripping code fences
+            num_predict=None,
         )
         
-        # In-memory store for notifications (for now)
-        # Structure: {user_id: [Notification objects]}
-        self.notification_store = {}
+        # Firestore-backed store with a memory read cache (see notification_store.py)
+        self.store = create_notification_store(self._get_db)
 
     def _get_db(self):
         if not self.db:
@@ -53,60 +70,67 @@ class NotificationEngine:
         Orchestrator: Fetches profile -> weather/news -> LLM -> Notifications
         """
         try:
-            with open("d:/Projects/KrishiSahAI TechFiesta/app_debug.log", "a") as logf:
-                logf.write(f"[NOTIF-ENGINE] Starting generation for {user_id}\n")
-            
+            _debug_log(f"Starting generation for {user_id}")
+
             # 1. Fetch Profile
             profile = self._get_farmer_profile(user_id)
             if not profile:
-                with open("d:/Projects/KrishiSahAI TechFiesta/app_debug.log", "a") as logf:
-                    logf.write(f"[NOTIF-ENGINE] Profile not found for {user_id}\n")
+                _debug_log(f"Profile not found for {user_id}")
                 return []
 
             # 2. Fetch Real-time Data
             location_query = self._get_location_string(profile)
             crops = profile.get('crops', [])
             
-            with open("d:/Projects/KrishiSahAI TechFiesta/app_debug.log", "a") as logf:
-                logf.write(f"[NOTIF-ENGINE] Fetching for {location_query} (Crops: {crops})\n")
+            _debug_log(f"Fetching for {location_query} (Crops: {crops})")
                 
             weather_task = self.weather_service.get_weather(location_query)
             news_task = self.news_service.get_personalized_news(crops, location_query)
             
             weather_data, news_data = await asyncio.gather(weather_task, news_task)
             
-            with open("d:/Projects/KrishiSahAI TechFiesta/app_debug.log", "a") as logf:
-                logf.write(f"[NOTIF-ENGINE] Real-time data gathered for {user_id}. Starting LLM...\n")
-                
-            # 3. Generate Insights via LLM
-            raw_insights = await self._generate_ai_insights(profile, weather_data, news_data)
-            
-            # 4. Parse & Prioritize
-            notifications = self._process_and_prioritize(raw_insights, weather_data, news_data)
-            
-            # Fallback if no notifications generated by LLM
-            if not notifications:
-                 with open("d:/Projects/KrishiSahAI TechFiesta/app_debug.log", "a") as logf:
-                    logf.write(f"[NOTIF-ENGINE] LLM returned nothing. Using deterministic fallback.\n")
-                 notifications = self._get_fallback_notifications(profile, weather_data)
+            _debug_log(f"Real-time data gathered for {user_id}. Starting LLM...")
 
-            # 5. Store & Return
-            self._store_notifications(user_id, notifications)
-            
-            with open("d:/Projects/KrishiSahAI TechFiesta/app_debug.log", "a") as logf:
-                logf.write(f"[NOTIF-ENGINE] Success: Generated {len(notifications)} notifications for {user_id}\n")
-                
+            # 3-5. Insights, prioritization, storage
+            fingerprint = input_fingerprint(profile, weather_data, news_data)
+            notifications, _ = await self.generate_from_inputs(user_id, profile, weather_data, news_data, fingerprint)
             return notifications
         except Exception as e:
             import traceback
-            error_trace = traceback.format_exc()
-            try:
-                with open("d:/Projects/KrishiSahAI TechFiesta/app_debug.log", "a") as logf:
-                    logf.write(f"[NOTIF-ENGINE] ERROR for {user_id}: {str(e)}\n{error_trace}\n")
-            except: pass
+            _debug_log(f"ERROR for {user_id}: {str(e)}\n{traceback.format_exc()}")
             print(f"[NOTIF-ENGINE] ERROR: {e}")
             return []
 
+    async def generate_from_inputs(self, user_id: str, profile: Dict[str, Any], weather_data, news_data,
+                                   fingerprint: str = None) -> Tuple[List[Dict], bool]:
+        """
+        LLM -> Notifications for a user whose profile, weather and news are already known.
+        The scheduler pipeline calls this directly after fetching shared inputs once per group.
+        `fingerprint` (see fingerprint.py) is stored with the batch so an unchanged
+        input set can be reused by `reuse_if_unchanged`.
+        Returns the notifications and whether they are the deterministic fallback
+        because the LLM returned nothing usable.
+        """
+        # 3. Generate Insights via LLM
+        raw_insights = await self._generate_ai_insights(profile, weather_data, news_data)
+        
+        # 4. Parse & Prioritize
+        notifications = self._process_and_prioritize(raw_insights, weather_data, news_data)
+        
+        # Fallback if no notifications generated by LLM
+        used_fallback = not notifications
+        if used_fallback:
+            _debug_log("LLM returned nothing. Using deterministic fallback.")
+            notifications = self._get_fallback_notifications(profile, weather_data)
+            fingerprint = None  # retry the LLM next cycle instead of keeping the fallback
+
+        # 5. Store & Return
+        self._store_notifications(user_id, notifications, fingerprint)
+        
+        _debug_log(f"Success: Generated {len(notifications)} notifications for {user_id}")
+            
+        return notifications, used_fallback
+
     def _get_fallback_notifications(self, profile, weather):
         """Standard high-quality fallback when LLM is unavailable"""
         crops = profile.get('crops', ['Crops'])
@@ -160,24 +184,28 @@ class NotificationEngine:
             db = self._get_db()
             doc = db.collection('users').document(user_id).get()
             if doc.exists:
-                data = doc.to_dict()
-                return {
-                    "name": data.get("name", "Farmer"),
-                    "location": {
-                        "village": data.get("village"),
-                        "district": data.get("district"),
-                        "state": data.get("state")
-                    },
-                    "crops": data.get("crops_grown", []) or data.get("mainCrops", []) or [],
-                    "land_size": data.get("land_size", "Unknown"),
-                    "soil_type": data.get("soil_type", "Unknown"),
-                    "irrigation": data.get("irrigation_source", "Unknown")
-                }
+                return self.profile_from_user_doc(doc.to_dict())
             return None
         except Exception as e:
             print(f"[NOTIF-ENGINE] DB Error: {e}")
             return None
 
+    @staticmethod
+    def profile_from_user_doc(data: Dict[str, Any]) -> Dict[str, Any]:
+        """Farmer profile fields used for notifications, from a users/{uid} document"""
+        return {
+            "name": data.get("name", "Farmer"),
+            "location": {
+                "village": data.get("village"),
+                "district": data.get("district"),
+                "state": data.get("state")
+            },
+            "crops": data.get("crops_grown", []) or data.get("mainCrops", []) or [],
+            "land_size": data.get("land_size", "Unknown"),
+            "soil_type": data.get("soil_type", "Unknown"),
+            "irrigation": data.get("irrigation_source", "Unknown")
+        }
+
     def _get_location_string(self, profile: Dict) -> str:
         loc = profile.get("location", {})
         parts = [loc.get("district"), loc.get("state")]
@@ -188,10 +216,7 @@ class NotificationEngine:
         Uses LLM to analyze data and generate specific notifications.
         Returns a list of raw notification dictionaries.
         """
-        try:
-            with open("d:/Projects/KrishiSahAI TechFiesta/app_debug.log", "a") as logf:
-                logf.write(f"[NOTIF-ENGINE] LLM Method Start for {profile.get('name')}\n")
-        except: pass
+        _debug_log(f"LLM Method Start for {profile.get('name')}")
         
         if "error" in weather: weather = {"condition": "Unknown", "temp": "N/A"}
         
@@ -242,33 +267,26 @@ class NotificationEngine:
             
             chain = prompt | self.llm | StrOutputParser()
             
-            with open("d:/Projects/KrishiSahAI TechFiesta/app_debug.log", "a") as logf:
-                logf.write(f"[NOTIF-ENGINE] Chain prepared. Invoking LLM ({self.llm_model})...\n")
+            _debug_log(f"Chain prepared. Invoking LLM ({self.llm_model})...")
             
             # Now we only need to pass 'crops' as it's the only {var} in the system/user prompt templates
             response = await chain.ainvoke({
                 "crops": ", ".join(profile.get('crops', []))
             })
             
-            with open("d:/Projects/KrishiSahAI TechFiesta/app_debug.log", "a") as logf:
-                logf.write(f"[NOTIF-ENGINE] LLM Response received (len: {len(response)}). Parsing JSON...\n")
-                logf.write(f"[NOTIF-ENGINE] RAW RESPONSE: {response}\n")
+            _debug_log(f"LLM Response received (len: {len(response)}). Parsing JSON...")
+            _debug_log(f"RAW RESPONSE: {response}")
             
             # Clean up response (remove code blocks if any)
             cleaned = response.strip().replace("```json", "").replace("```", "")
             results = json.loads(cleaned)
             
-            with open("d:/Projects/KrishiSahAI TechFiesta/app_debug.log", "a") as logf:
-                logf.write(f"[NOTIF-ENGINE] Successfully parsed {len(results)} insights\n")
+            _debug_log(f"Successfully parsed {len(results)} insights")
             
             return results
         except Exception as e:
             import traceback
-            error_trace = traceback.format_exc()
-            try:
-                with open("d:/Projects/KrishiSahAI TechFiesta/app_debug.log", "a") as logf:
-                    logf.write(f"[NOTIF-ENGINE] LLM Method ERROR: {str(e)}\n{error_trace}\n")
-            except: pass
+            _debug_log(f"LLM Method ERROR: {str(e)}\n{traceback.format_exc()}")
             print(f"[NOTIF-ENGINE] LLM Method ERROR: {e}")
             return []
 
@@ -309,11 +327,31 @@ class NotificationEngine:
         
         return processed
 
-    def _store_notifications(self, user_id, notifications):
-        self.notification_store[user_id] = notifications
+    def _store_notifications(self, user_id, notifications, fingerprint=None):
+        self.store.add_batch(user_id, notifications, fingerprint)
+        self._publish(user_id)
+
+    def _publish(self, user_id):
+        # Push to open /api/notifications/stream connections of this user (see notification_hub.py)
+        if notification_hub.has_subscribers(user_id):
+            notification_hub.publish(user_id, self.store.notifications(user_id))
+
+    def reuse_if_unchanged(self, user_id: str, fingerprint: str) -> bool:
+        """
+        True if the latest stored batch was generated from the same inputs (and
+        is not older than NOTIFICATION_MAX_REUSE_HOURS); its checked_at is then
+        bumped and no LLM call is needed.
+        """
+        return self.store.touch_if_unchanged(user_id, fingerprint, MAX_REUSE_SECONDS)
 
     def get_notifications(self, user_id):
-        return self.notification_store.get(user_id, [])
+        return self.store.notifications(user_id)
+
+    def mark_read(self, user_id, ids=None, read=True) -> int:
+        updated = self.store.mark_read(user_id, ids, read)
+        if updated:
+            self._publish(user_id)
+        return updated
 
 # Singleton Instance
 notification_engine = NotificationEngine()
@@ -0,0 +1,190 @@
+"""
+Push delivery of notification updates to open /api/notifications/stream connections.
+
+Instead of polling GET /api/notifications (token verification and a store
+lookup every time), a client subscribes once and receives the user's
+notification list whenever it changes:
+
+    data: {"type": "notifications", "notifications": [...]}
+
+The engine publishes to the hub after storing a batch or changing read
+state; each connection of that user has a small bounded queue. Only the
+latest list matters, so when a slow client's queue is full the oldest queued
+update is dropped rather than blocking the publisher.
+
+Publishing only reaches connections on the same worker. To pick up batches
+written by another worker (or the scheduler on another host), each
+connection also re-reads the store every NOTIFICATION_STREAM_RECHECK seconds,
+which is a memory hit in the store's cache most of the time, and only sends
+a frame if the list changed. An idle connection gets a `: keep-alive` comment
+every SSE_HEARTBEAT seconds.
+
+Each subscription holds a server thread, so the hub caps connections per
+user and per worker (newest wins per user; a full worker answers 503 and the
+client falls back to polling) and ends connections after
+NOTIFICATION_STREAM_MAX_SECONDS with a `{"type": "reconnect"}` event.
+
+Configuration (environment):
+    NOTIFICATION_STREAM_QUEUE            queued updates per connection (default: 4)
+    NOTIFICATION_STREAM_MAX_PER_USER     connections per user per worker (default: 3)
+    NOTIFICATION_STREAM_MAX_SUBSCRIBERS  connections per worker (default: 48)
+    NOTIFICATION_STREAM_RECHECK          seconds between store re-reads (default: 60)
+    NOTIFICATION_STREAM_MAX_SECONDS      connection lifetime (default: 900)
+"""
+
+import hashlib
+import json
+import os
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from services.Shared.sse import HEARTBEAT_INTERVAL, sse_frame
+
+QUEUE_SIZE = max(1, int(os.getenv("NOTIFICATION_STREAM_QUEUE", "4")))
+MAX_PER_USER = max(1, int(os.getenv("NOTIFICATION_STREAM_MAX_PER_USER", "3")))
+MAX_SUBSCRIBERS = max(1, int(os.getenv("NOTIFICATION_STREAM_MAX_SUBSCRIBERS", "48")))
+RECHECK_SECONDS = float(os.getenv("NOTIFICATION_STREAM_RECHECK", "60"))
+MAX_CONNECTION_SECONDS = float(os.getenv("NOTIFICATION_STREAM_MAX_SECONDS", "900"))
+
+# Queued in place of an update when a newer connection replaces this one
+_CLOSE = object()
+
+
+def _digest(notifications: List[Dict[str, Any]]) -> str:
+    raw = json.dumps(notifications, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class Subscriber:
+    def __init__(self, uid: str):
+        self.uid = uid
+        self.queue: "queue.Queue" = queue.Queue(maxsize=QUEUE_SIZE)
+        self.opened_at = time.monotonic()
+
+    def offer(self, item) -> bool:
+        """Queue an update without blocking; returns False if an older update had to be dropped"""
+        while True:
+            try:
+                self.queue.put_nowait(item)
+                return True
+            except queue.Full:
+                try:
+                    self.queue.get_nowait()
+                except queue.Empty:
+                    continue
+                try:
+                    self.queue.put_nowait(item)
+                except queue.Full:
+                    continue
+                return False
+
+
+class NotificationHub:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers: Dict[str, List[Subscriber]] = {}
+        self._stats = {"connections": 0, "rejected": 0, "replaced": 0, "published": 0, "dropped": 0,
+                       "frames": 0, "heartbeats": 0, "rechecks": 0}
+
+    def _count(self, name: str, n: int = 1):
+        with self._lock:
+            self._stats[name] += n
+
+    def subscribe(self, uid: str) -> Optional[Subscriber]:
+        """Register a connection, or None if this worker is at NOTIFICATION_STREAM_MAX_SUBSCRIBERS"""
+        subscriber = Subscriber(uid)
+        replaced = None
+        with self._lock:
+            if sum(len(subs) for subs in self._subscribers.values()) >= MAX_SUBSCRIBERS:
+                self._stats["rejected"] += 1
+                return None
+            subs = self._subscribers.setdefault(uid, [])
+            if len(subs) >= MAX_PER_USER:
+                replaced = subs.pop(0)
+                self._stats["replaced"] += 1
+            subs.append(subscriber)
+            self._stats["connections"] += 1
+        if replaced is not None:
+            replaced.offer(_CLOSE)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        with self._lock:
+            subs = self._subscribers.get(subscriber.uid, [])
+            if subscriber in subs:
+                subs.remove(subscriber)
+            if not subs:
+                self._subscribers.pop(subscriber.uid, None)
+
+    def has_subscribers(self, uid: str) -> bool:
+        with self._lock:
+            return bool(self._subscribers.get(uid))
+
+    def publish(self, uid: str, notifications: List[Dict[str, Any]]):
+        """Hand the user's current notification list to each of their connections"""
+        with self._lock:
+            subs = list(self._subscribers.get(uid, []))
+        dropped = sum(0 if sub.offer(notifications) else 1 for sub in subs)
+        with self._lock:
+            self._stats["published"] += len(subs)
+            self._stats["dropped"] += dropped
+
+    def stream(self, subscriber: Subscriber, snapshot: Callable[[], List[Dict[str, Any]]]) -> Iterator[str]:
+        """SSE frames for one connection: the current list, then every change, until closed"""
+        last_digest = None
+
+        def frame(notifications) -> Optional[str]:
+            nonlocal last_digest
+            digest = _digest(notifications)
+            if digest == last_digest:
+                return None
+            last_digest = digest
+            self._count("frames")
+            return sse_frame({"type": "notifications", "notifications": notifications})
+
+        try:
+            yield frame(snapshot())
+            deadline = subscriber.opened_at + MAX_CONNECTION_SECONDS
+            next_recheck = time.monotonic() + RECHECK_SECONDS
+            while True:
+                now = time.monotonic()
+                if now >= deadline:
+                    yield sse_frame({"type": "reconnect"})
+                    return
+                wait = max(0.0, min(HEARTBEAT_INTERVAL, next_recheck - now, deadline - now))
+                try:
+                    item = subscriber.queue.get(timeout=wait)
+                except queue.Empty:
+                    item = None
+
+                if item is _CLOSE:
+                    yield sse_frame({"type": "reconnect", "reason": "replaced"})
+                    return
+                text = None
+                if item is not None:
+                    text = frame(item)
+                elif time.monotonic() >= next_recheck:
+                    self._count("rechecks")
+                    next_recheck = time.monotonic() + RECHECK_SECONDS
+                    text = frame(snapshot())
+                if text:
+                    yield text
+                elif item is None:
+                    self._count("heartbeats")
+                    yield ": keep-alive\n\n"
+        finally:
+            self.unsubscribe(subscriber)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                **self._stats,
+                "users": len(self._subscribers),
+                "subscribers": sum(len(subs) for subs in self._subscribers.values()),
+                "max_subscribers": MAX_SUBSCRIBERS,
+            }
+
+
+notification_hub = NotificationHub()
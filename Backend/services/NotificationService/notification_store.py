@@ -0,0 +1,369 @@
+"""
+Notification store: Firestore-backed, with a memory read cache and write-behind.
+
+Each user has one document, `{NOTIFICATION_COLLECTION}/{uid}`:
+
+    notifications   newest first, at most NOTIFICATION_MAX_PER_USER, each with
+                    `read` and `created_at` (epoch seconds)
+    fingerprint     inputs of the latest batch (see fingerprint.py)
+    generated_at    when the latest batch was generated
+    checked_at      when the scheduler last confirmed its inputs were unchanged
+
+New batches are prepended to the user's unexpired notifications, so read
+state survives regeneration; notifications older than NOTIFICATION_TTL_HOURS
+are dropped on read and on write.
+
+Reads are served from a per-worker LRU of NOTIFICATION_CACHE_MAX users. An
+entry is trusted for NOTIFICATION_CACHE_TTL seconds (another worker may have
+written since) and is then re-read from Firestore; entries with unflushed
+changes are never evicted.
+
+Writes apply to the cache right away and are also queued as operations (add
+a batch, bump checked_at, set read flags). The cached document may be stale,
+so it is never written back as a whole: a background thread flushes every
+NOTIFICATION_FLUSH_SECONDS by replaying each user's queued operations on the
+current document inside a Firestore transaction, so changes made by other
+workers in the meantime are kept. Users whose only change is a checked_at bump
+(the common scheduler case) get a field-level merge instead, up to 500 per
+batched commit. The flush backs off while Firestore is unreachable, and
+pending operations are flushed at exit.
+
+Configuration (environment):
+    NOTIFICATION_COLLECTION        Firestore collection        (default: notifications)
+    NOTIFICATION_MAX_PER_USER      notifications kept per user (default: 20)
+    NOTIFICATION_TTL_HOURS         notification lifetime       (default: 72)
+    NOTIFICATION_CACHE_MAX         users cached per worker     (default: 1000)
+    NOTIFICATION_CACHE_TTL         seconds a clean cache entry is trusted (default: 60)
+    NOTIFICATION_FLUSH_SECONDS     write-behind interval       (default: 2)
+"""
+
+import atexit
+import copy
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+# Firestore rejects batches with more than 500 writes
+FIRESTORE_BATCH_LIMIT = 500
+MAX_BACKOFF_SECONDS = 60.0
+
+
+class _Op:
+    """A queued write: `apply(doc, at)` mutates a document and returns whether it changed"""
+    __slots__ = ("kind", "apply", "at")
+
+    def __init__(self, kind: str, apply: Callable[[Dict[str, Any], float], Any], at: float):
+        self.kind = kind
+        self.apply = apply
+        self.at = at
+
+
+class _Entry:
+    __slots__ = ("doc", "loaded_at", "ops")
+
+    def __init__(self, doc: Dict[str, Any], loaded_at: float):
+        self.doc = doc
+        self.loaded_at = loaded_at
+        self.ops: List[_Op] = []  # not yet written to Firestore
+
+    @property
+    def dirty(self) -> bool:
+        return bool(self.ops)
+
+
+def _empty_doc() -> Dict[str, Any]:
+    return {"notifications": [], "fingerprint": None, "generated_at": None, "checked_at": None}
+
+
+class NotificationStore:
+    def __init__(self, get_db: Callable[[], Any], collection: str = "notifications",
+                 max_per_user: int = 20, ttl: float = 72 * 3600, cache_max: int = 1000,
+                 cache_ttl: float = 60, flush_interval: float = 2.0):
+        self._get_db = get_db
+        self.collection = collection
+        self.max_per_user = max_per_user
+        self.ttl = ttl
+        self.cache_max = cache_max
+        self.cache_ttl = cache_ttl
+        self.flush_interval = flush_interval
+        self._cache: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._lock = threading.RLock()
+        self._flush_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._backoff = flush_interval
+        self._stats = {"hits": 0, "loads": 0, "load_errors": 0, "flushes": 0, "docs_written": 0,
+                       "transactions": 0, "field_updates": 0, "flush_errors": 0, "evictions": 0}
+
+    # ---------- cache ----------
+
+    def _fresh(self, entry: Optional[_Entry], now: float) -> bool:
+        return entry is not None and now - entry.loaded_at <= self.cache_ttl
+
+    def _expire(self, doc: Dict[str, Any], now: float) -> Dict[str, Any]:
+        cutoff = now - self.ttl
+        doc["notifications"] = [n for n in doc.get("notifications") or [] if (n.get("created_at") or now) >= cutoff]
+        return doc
+
+    def _remember(self, uid: str, doc: Dict[str, Any], now: float) -> _Entry:
+        """Cache a document read from Firestore, with this worker's unflushed operations on top"""
+        # Caller holds the lock
+        entry = self._cache.get(uid)
+        if entry is None:
+            entry = self._cache[uid] = _Entry(doc, now)
+        for op in entry.ops:
+            op.apply(doc, op.at)
+        entry.doc = self._expire(doc, now)
+        entry.loaded_at = now
+        self._cache.move_to_end(uid)
+        self._evict()
+        return entry
+
+    def _evict(self):
+        # Unflushed entries stay until the next flush has written them
+        while len(self._cache) > self.cache_max:
+            victim = next((uid for uid, e in self._cache.items() if not e.dirty), None)
+            if victim is None:
+                return
+            del self._cache[victim]
+            self._stats["evictions"] += 1
+
+    def _count(self, name: str, n: int = 1):
+        with self._lock:
+            self._stats[name] += n
+
+    def _load(self, uid: str) -> Dict[str, Any]:
+        self._count("loads")
+        try:
+            snapshot = self._get_db().collection(self.collection).document(uid).get()
+            return {**_empty_doc(), **snapshot.to_dict()} if snapshot.exists else _empty_doc()
+        except Exception as e:
+            self._count("load_errors")
+            print(f"[NOTIF-STORE] Load failed for {uid}: {e}")
+            return _empty_doc()
+
+    def _entry(self, uid: str) -> _Entry:
+        now = time.time()
+        with self._lock:
+            entry = self._cache.get(uid)
+            if self._fresh(entry, now):
+                self._cache.move_to_end(uid)
+                self._stats["hits"] += 1
+                return entry
+
+        doc = self._expire(self._load(uid), now)
+        with self._lock:
+            return self._remember(uid, doc, now)
+
+    def preload(self, uids: Iterable[str]):
+        """Load uncached users with one Firestore round trip (the scheduler calls this per page)"""
+        now = time.time()
+        with self._lock:
+            missing = [uid for uid in uids if not self._fresh(self._cache.get(uid), now)]
+        if not missing:
+            return
+        try:
+            db = self._get_db()
+            refs = [db.collection(self.collection).document(uid) for uid in missing]
+            snapshots = {s.id: s for s in db.get_all(refs)}
+        except Exception as e:
+            self._count("load_errors")
+            print(f"[NOTIF-STORE] Preload of {len(missing)} users failed: {e}")
+            return
+        with self._lock:
+            self._stats["loads"] += len(missing)
+            for uid in missing:
+                snapshot = snapshots.get(uid)
+                doc = {**_empty_doc(), **snapshot.to_dict()} if snapshot is not None and snapshot.exists else _empty_doc()
+                self._remember(uid, self._expire(doc, now), now)
+
+    # ---------- reads ----------
+
+    def notifications(self, uid: str) -> List[Dict[str, Any]]:
+        entry = self._entry(uid)
+        with self._lock:
+            self._expire(entry.doc, time.time())
+            return copy.deepcopy(entry.doc["notifications"])
+
+    # ---------- writes ----------
+
+    def _update(self, uid: str, kind: str, mutate: Callable[[Dict[str, Any], float], Any]):
+        """Apply `mutate` to the cached document and queue it for the next flush if it changed anything"""
+        entry = self._entry(uid)
+        now = time.time()
+        with self._lock:
+            entry = self._cache.get(uid) or entry
+            changed = mutate(entry.doc, now)
+            if changed:
+                self._expire(entry.doc, now)
+                entry.ops.append(_Op(kind, mutate, now))
+                if uid not in self._cache:
+                    self._cache[uid] = entry
+                self._cache.move_to_end(uid)
+        if changed:
+            self._start()
+        return changed
+
+    def add_batch(self, uid: str, notifications: List[Dict[str, Any]], fingerprint: Optional[str] = None):
+        def mutate(doc, now):
+            fresh = [{**n, "created_at": now, "read": bool(n.get("read", False))} for n in notifications]
+            doc["notifications"] = (fresh + doc["notifications"])[:self.max_per_user]
+            doc.update(fingerprint=fingerprint, generated_at=now, checked_at=now)
+            return True
+        self._update(uid, "batch", mutate)
+
+    def touch_if_unchanged(self, uid: str, fingerprint: str, max_age: float) -> bool:
+        """Bump checked_at if the latest batch has this fingerprint and is younger than max_age"""
+        def mutate(doc, now):
+            if not fingerprint or doc.get("fingerprint") != fingerprint:
+                return False
+            if not doc.get("generated_at") or now - doc["generated_at"] > max_age:
+                return False
+            doc["checked_at"] = now
+            return True
+        return bool(self._update(uid, "touch", mutate))
+
+    def mark_read(self, uid: str, ids: Optional[Iterable[str]] = None, read: bool = True) -> int:
+        """Set the read state of the given notification ids (all when None); returns how many changed"""
+        wanted = None if ids is None else {str(i) for i in ids}
+
+        def mutate(doc, now):
+            changed = 0
+            for n in doc["notifications"]:
+                if (wanted is None or str(n.get("id")) in wanted) and bool(n.get("read")) != read:
+                    n["read"] = read
+                    changed += 1
+            return changed
+        return self._update(uid, "read", mutate) or 0
+
+    # ---------- write-behind ----------
+
+    def _start(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._flush_loop, name="notification-store-flush", daemon=True)
+                self._thread.start()
+                atexit.register(self.close)
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self._backoff)
+            try:
+                self.flush()
+                self._backoff = self.flush_interval
+            except Exception as e:
+                self._backoff = min(MAX_BACKOFF_SECONDS, self._backoff * 2)
+                print(f"[NOTIF-STORE] Flush failed, retrying in {self._backoff:g}s: {e}")
+
+    def _apply_transaction(self, db, uid: str, ops: List[_Op]) -> Dict[str, Any]:
+        """Replay `ops` on the current Firestore document in a transaction; returns the document"""
+        from firebase_admin import firestore
+
+        ref = db.collection(self.collection).document(uid)
+
+        @firestore.transactional
+        def attempt(transaction):
+            snapshot = ref.get(transaction=transaction)
+            doc = {**_empty_doc(), **snapshot.to_dict()} if snapshot.exists else _empty_doc()
+            changed = False
+            for op in ops:
+                changed = bool(op.apply(doc, op.at)) or changed
+            doc = self._expire(doc, time.time())
+            if changed:
+                transaction.set(ref, doc)
+            return doc
+
+        return attempt(db.transaction())
+
+    def _committed(self, uid: str, doc: Optional[Dict[str, Any]]):
+        """Refresh the cache from a document just written, keeping operations queued since"""
+        # Caller holds the lock
+        if doc is not None and uid in self._cache:
+            self._remember(uid, copy.deepcopy(doc), time.time())
+
+    def flush(self) -> int:
+        """Write all queued operations to Firestore; returns users written"""
+        with self._flush_lock:
+            with self._lock:
+                pending = [(uid, e.ops) for uid, e in self._cache.items() if e.ops]
+                for uid, _ in pending:
+                    self._cache[uid].ops = []
+            if not pending:
+                return 0
+
+            # Only checked_at changed: a field-level merge cannot clobber anything
+            touches = [(uid, ops) for uid, ops in pending if all(op.kind == "touch" for op in ops)]
+            others = [(uid, ops) for uid, ops in pending if any(op.kind != "touch" for op in ops)]
+            done = set()
+            try:
+                db = self._get_db()
+                collection = db.collection(self.collection)
+                for start in range(0, len(touches), FIRESTORE_BATCH_LIMIT):
+                    chunk = touches[start:start + FIRESTORE_BATCH_LIMIT]
+                    batch = db.batch()
+                    for uid, ops in chunk:
+                        batch.set(collection.document(uid), {"checked_at": max(op.at for op in ops)}, merge=True)
+                    batch.commit()
+                    done.update(uid for uid, _ in chunk)
+                    self._count("field_updates", len(chunk))
+                for uid, ops in others:
+                    doc = self._apply_transaction(db, uid, ops)
+                    done.add(uid)
+                    with self._lock:
+                        self._stats["transactions"] += 1
+                        self._committed(uid, doc)
+            except Exception:
+                # Operations not written are queued again, ahead of any added meanwhile
+                with self._lock:
+                    self._stats["flush_errors"] += 1
+                    for uid, ops in pending:
+                        if uid in done:
+                            continue
+                        entry = self._cache.get(uid)
+                        if entry is None:
+                            entry = self._cache[uid] = _Entry(_empty_doc(), 0.0)
+                        entry.ops = ops + entry.ops
+                raise
+            finally:
+                with self._lock:
+                    self._stats["docs_written"] += len(done)
+                    if done:
+                        self._stats["flushes"] += 1
+                    self._evict()
+            return len(done)
+
+    def close(self):
+        """Write pending changes before the process exits"""
+        try:
+            written = self.flush()
+            if written:
+                print(f"[NOTIF-STORE] Flushed {written} pending user(s) at shutdown")
+        except Exception as e:
+            print(f"[NOTIF-STORE] Final flush failed: {e}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                **self._stats,
+                "cached_users": len(self._cache),
+                "dirty_users": sum(1 for e in self._cache.values() if e.dirty),
+                "cache_max": self.cache_max,
+                "max_per_user": self.max_per_user,
+                "ttl_hours": round(self.ttl / 3600, 1),
+            }
+
+
+def create_notification_store(get_db: Callable[[], Any]) -> NotificationStore:
+    """Build the store configured by the NOTIFICATION_* environment variables"""
+    return NotificationStore(
+        get_db,
+        collection=os.getenv("NOTIFICATION_COLLECTION", "notifications"),
+        max_per_user=int(os.getenv("NOTIFICATION_MAX_PER_USER", "20")),
+        ttl=float(os.getenv("NOTIFICATION_TTL_HOURS", "72")) * 3600,
+        cache_max=int(os.getenv("NOTIFICATION_CACHE_MAX", "1000")),
+        cache_ttl=float(os.getenv("NOTIFICATION_CACHE_TTL", "60")),
+        flush_interval=float(os.getenv("NOTIFICATION_FLUSH_SECONDS", "2")),
+    )
@@ -0,0 +1,270 @@
+"""
+Scheduled notification generation for all users.
+
+The per-user flow (`NotificationEngine.generate_notifications_for_user`)
+fetches weather and news for every farmer, so a district with fifty farmers
+triggered fifty identical weather requests. A scheduler run instead works in
+stages:
+
+    page      users are read from Firestore NOTIFICATION_PAGE_SIZE at a time,
+              ordered by document id and continued with a start_after cursor;
+              the next page is read while the current one is generating
+    group     each profile is keyed by normalized location (district, state)
+              and by crop set
+    fetch     weather per unique location and news per unique (crop set,
+              location) are fetched once per run, shared by every user in the
+              group and by later pages
+    generate  users whose input fingerprint (fingerprint.py) matches their
+              stored batch are only re-timestamped; the rest get LLM insights,
+              NOTIFICATION_LLM_CONCURRENCY at a time (the shared "json" role
+              cap in llm_registry still applies)
+
+Configuration (environment):
+    NOTIFICATION_PAGE_SIZE               users per Firestore page (default: 100)
+    NOTIFICATION_FETCH_CONCURRENCY       weather/news requests in flight (default: 8)
+    NOTIFICATION_LLM_CONCURRENCY         users generating at once (default: 2)
+
+Each run returns a report (users, users/min, dedupe ratio, LLM calls vs
+unchanged users, time per stage, per-user generation latency); `notification_pipeline.stats()` shows the run
+in progress and the last finished one for /api/health. Users whose LLM call
+returned nothing usable and got the deterministic fallback are counted as
+`fallbacks`, not `generated`, so an Ollama outage shows up in the report.
+"""
+
+import asyncio
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from services.NotificationService.fingerprint import input_fingerprint
+from services.NotificationService.notification_engine import notification_engine
+
+PAGE_SIZE = int(os.getenv("NOTIFICATION_PAGE_SIZE", "100"))
+FETCH_CONCURRENCY = max(1, int(os.getenv("NOTIFICATION_FETCH_CONCURRENCY", "8")))
+LLM_CONCURRENCY = max(1, int(os.getenv("NOTIFICATION_LLM_CONCURRENCY", "2")))
+
+STAGES = ("page", "group", "fetch", "generate")
+
+
+def _normalize(value) -> str:
+    return " ".join(str(value or "").split()).casefold()
+
+
+def location_key(profile: Dict[str, Any]) -> Tuple[str, str]:
+    loc = profile.get("location") or {}
+    return _normalize(loc.get("district")), _normalize(loc.get("state"))
+
+
+def crop_key(profile: Dict[str, Any]) -> Tuple[str, ...]:
+    return tuple(sorted({_normalize(c) for c in profile.get("crops") or [] if _normalize(c)}))
+
+
+class RunReport:
+    """Counters and stage timings of one pipeline run."""
+
+    def __init__(self):
+        self.started_at = time.time()
+        self.pages = 0
+        self.users = 0
+        self.aborted = False  # stopped early, e.g. the scheduler lease moved to another worker
+        self.generated = 0
+        self.unchanged = 0  # fingerprint matched, no LLM call
+        self.fallbacks = 0  # LLM returned nothing usable, deterministic notifications stored
+        self.failed = 0
+        self.weather_fetches = 0
+        self.news_fetches = 0
+        self.groups = set()
+        self.stage_s = {stage: 0.0 for stage in STAGES}
+        self._generate_ms: List[float] = []
+        self.finished_at: Optional[float] = None
+
+    def add_stage(self, stage: str, seconds: float):
+        self.stage_s[stage] += seconds
+
+    def record_user(self, seconds: float, outcome: str):
+        """`outcome` is one of: generated, fallback, failed"""
+        self._generate_ms.append(seconds * 1000)
+        if outcome == "generated":
+            self.generated += 1
+        elif outcome == "fallback":
+            self.fallbacks += 1
+        else:
+            self.failed += 1
+
+    def finish(self):
+        self.finished_at = time.time()
+
+    def as_dict(self) -> dict:
+        elapsed = (self.finished_at or time.time()) - self.started_at
+        # Without grouping every user would fetch weather and news once each
+        naive_fetches = 2 * self.users
+        fetches = self.weather_fetches + self.news_fetches
+        latencies = sorted(self._generate_ms)
+        data = {
+            "started_at": self.started_at,
+            "running": self.finished_at is None,
+            "aborted": self.aborted,
+            "elapsed_s": round(elapsed, 2),
+            "pages": self.pages,
+            "users": self.users,
+            "generated": self.generated,
+            "unchanged": self.unchanged,
+            "fallbacks": self.fallbacks,
+            "failed": self.failed,
+            "llm_calls": self.generated + self.fallbacks + self.failed,
+            "users_per_min": round(60 * (self.generated + self.unchanged + self.fallbacks + self.failed) / elapsed, 1) if elapsed > 0 else 0.0,
+            "groups": len(self.groups),
+            "weather_fetches": self.weather_fetches,
+            "news_fetches": self.news_fetches,
+            "dedupe_ratio": round(1 - fetches / naive_fetches, 3) if naive_fetches else 0.0,
+            "stage_s": {stage: round(s, 2) for stage, s in self.stage_s.items()},
+        }
+        if latencies:
+            data["generate_ms_p50"] = round(latencies[len(latencies) // 2], 1)
+            data["generate_ms_p95"] = round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 1)
+        return data
+
+
+class NotificationPipeline:
+    def __init__(self, engine):
+        self.engine = engine
+        self._lock = threading.Lock()
+        self._current: Optional[RunReport] = None
+        self._last: Optional[RunReport] = None
+        self.runs = 0
+
+    def _read_page(self, cursor):
+        query = self.engine._get_db().collection("users").order_by("__name__").limit(PAGE_SIZE)
+        if cursor is not None:
+            query = query.start_after(cursor)
+        return list(query.stream())
+
+    async def _pages(self, report: RunReport):
+        """Pages of user documents, reading the next page while the caller works on the current one"""
+        pending = asyncio.ensure_future(asyncio.to_thread(self._read_page, None))
+        while pending is not None:
+            start = time.monotonic()
+            docs = await pending
+            report.add_stage("page", time.monotonic() - start)
+            if len(docs) == PAGE_SIZE:
+                pending = asyncio.ensure_future(asyncio.to_thread(self._read_page, docs[-1]))
+            else:
+                pending = None
+            if docs:
+                report.pages += 1
+                yield docs
+
+    async def _fetch_weather(self, location: str, report: RunReport, limit: asyncio.Semaphore):
+        async with limit:
+            report.weather_fetches += 1
+            try:
+                return await self.engine.weather_service.get_weather(location)
+            except Exception as e:
+                print(f"[NOTIF-PIPELINE] Weather fetch failed for {location}: {e}")
+                return {"error": str(e)}
+
+    async def _fetch_news(self, crops: List[str], location: str, report: RunReport, limit: asyncio.Semaphore):
+        async with limit:
+            report.news_fetches += 1
+            try:
+                return await self.engine.news_service.get_personalized_news(crops, location)
+            except Exception as e:
+                print(f"[NOTIF-PIPELINE] News fetch failed for {location}: {e}")
+                return []
+
+    async def _generate(self, user_id: str, profile: dict, weather, news, report: RunReport, limit: asyncio.Semaphore):
+        fingerprint = input_fingerprint(profile, weather, news)
+        if self.engine.reuse_if_unchanged(user_id, fingerprint):
+            report.unchanged += 1
+            return
+        async with limit:
+            start = time.monotonic()
+            try:
+                _, used_fallback = await self.engine.generate_from_inputs(user_id, profile, weather, news, fingerprint)
+                report.record_user(time.monotonic() - start, "fallback" if used_fallback else "generated")
+            except Exception as e:
+                report.record_user(time.monotonic() - start, "failed")
+                print(f"[NOTIF-PIPELINE] Generation failed for {user_id}: {e}")
+
+    async def run(self, keep_running: Optional[Callable[[], bool]] = None) -> dict:
+        """One pass over all users; `keep_running` is checked before each page."""
+        report = RunReport()
+        with self._lock:
+            self._current = report
+            self.runs += 1
+
+        fetch_limit = asyncio.Semaphore(FETCH_CONCURRENCY)
+        llm_limit = asyncio.Semaphore(LLM_CONCURRENCY)
+        # Shared by all pages of this run: unique input -> task fetching it
+        weather_tasks: Dict[Tuple[str, str], asyncio.Future] = {}
+        news_tasks: Dict[Tuple, asyncio.Future] = {}
+
+        try:
+            async for docs in self._pages(report):
+                if keep_running is not None and not keep_running():
+                    report.aborted = True
+                    print(f"[NOTIF-PIPELINE] Stopping after {report.pages - 1} pages, no longer allowed to run")
+                    break
+                start = time.monotonic()
+                users = []
+                for doc in docs:
+                    report.users += 1
+                    data = doc.to_dict() or {}
+                    profile = self.engine.profile_from_user_doc(data)
+                    loc_key, crops = location_key(profile), crop_key(profile)
+                    query = self.engine._get_location_string(profile)
+                    report.groups.add((loc_key, crops))
+                    if loc_key not in weather_tasks:
+                        weather_tasks[loc_key] = asyncio.ensure_future(
+                            self._fetch_weather(query, report, fetch_limit))
+                    news_key = (crops, loc_key)
+                    if news_key not in news_tasks:
+                        news_tasks[news_key] = asyncio.ensure_future(
+                            self._fetch_news(list(crops), query, report, fetch_limit))
+                    users.append((doc.id, profile, weather_tasks[loc_key], news_tasks[news_key]))
+                # Stored batches for the whole page in one read, for the fingerprint check
+                await asyncio.to_thread(self.engine.store.preload, [user_id for user_id, _, _, _ in users])
+                report.add_stage("group", time.monotonic() - start)
+
+                start = time.monotonic()
+                await asyncio.gather(*{id(t): t for _, _, w, n in users for t in (w, n)}.values())
+                report.add_stage("fetch", time.monotonic() - start)
+
+                start = time.monotonic()
+                await asyncio.gather(*[
+                    self._generate(user_id, profile, weather.result(), news.result(), report, llm_limit)
+                    for user_id, profile, weather, news in users
+                ])
+                report.add_stage("generate", time.monotonic() - start)
+        finally:
+            report.finish()
+            with self._lock:
+                self._current = None
+                self._last = report
+
+        summary = report.as_dict()
+        print(
+            f"[NOTIF-PIPELINE] {summary['users']} users in {summary['elapsed_s']}s "
+            f"({summary['users_per_min']} users/min): {summary['generated']} generated, "
+            f"{summary['unchanged']} unchanged, {summary['fallbacks']} fallbacks, {summary['failed']} failed; "
+            f"{summary['groups']} groups, "
+            f"dedupe {summary['dedupe_ratio']:.0%}, stages {summary['stage_s']}"
+        )
+        return summary
+
+    def stats(self) -> dict:
+        with self._lock:
+            current, last = self._current, self._last
+            runs = self.runs
+        return {
+            "runs": runs,
+            "page_size": PAGE_SIZE,
+            "fetch_concurrency": FETCH_CONCURRENCY,
+            "llm_concurrency": LLM_CONCURRENCY,
+            "current_run": current.as_dict() if current else None,
+            "last_run": last.as_dict() if last else None,
+        }
+
+
+notification_pipeline = NotificationPipeline(notification_engine)
@@ -1,94 +1,329 @@
 """
-Pest Detection Module using YOLOv5 (PyTorch Hub) with Custom Local Repository and Weights
+Pest Detection Module using YOLOv5 with Custom Local Repository and Weights
+
+The model is built directly with the vendored attempt_load (no torch.hub), fused once
+and cached, and only loaded on first use or from warm_up_async().
+
+The PyTorch checkpoint is exported once per weight hash to a CPU-optimized format
+(ONNX Runtime or OpenVINO) under export_cache/<hash>/ and served through the vendored
+DetectMultiBackend. Select with PEST_BACKEND=auto | onnx | openvino | pytorch. Eager
+PyTorch serves requests while the export is built and validated on a background
+thread; the export replaces it only once validated, and any failure to export,
+validate or load leaves PyTorch in place.
 """
 
+import hashlib
+import io
+import json
+import os
+import shutil
 import sys
+import threading
+from functools import lru_cache
 from pathlib import Path
 from PIL import Image
 
+BASE_DIR = Path(__file__).parent.resolve()
+MODEL_PATH = BASE_DIR / 'krishisahai_yolo_final.pt'
+LOCAL_YOLO_REPO = BASE_DIR / 'yolov5_custom'
+EXPORT_CACHE_DIR = Path(os.getenv("PEST_EXPORT_CACHE", BASE_DIR / 'export_cache'))
+# Real field photos of the pests the model detects; the vendored yolov5 samples (COCO) give no detections
+VALIDATION_IMAGES_DIR = Path(os.getenv("PEST_VALIDATION_IMAGES", BASE_DIR / 'validation_images'))
+
+BACKEND = os.getenv("PEST_BACKEND", "auto").lower()
+EXPORT_IMG_SIZE = 640
+# Exported detections must match PyTorch within these bounds to be served
+CONF_TOLERANCE = float(os.getenv("PEST_EXPORT_CONF_TOLERANCE", "0.05"))
+IOU_TOLERANCE = float(os.getenv("PEST_EXPORT_MIN_IOU", "0.9"))
+# Detections below this may flip between backends and are not compared
+CONFIDENT = 0.25 + CONF_TOLERANCE
+# Bumped when validation gets stricter, so cached verdicts are re-validated
+VALIDATION_CHECK = 3
+
 # Global model instance
 _model = None
+_init_lock = threading.Lock()
+_warmup_thread = None
+_export_thread = None
+_backend_info = {'backend': None, 'artifact': None, 'weights_hash': None, 'validation': None, 'export_status': None}
+
+
+def _prepare_yolo_imports():
+    """Make the vendored yolov5 package importable (it tolerates missing IPython / pkg_resources)."""
+    if str(LOCAL_YOLO_REPO) not in sys.path:
+        sys.path.insert(0, str(LOCAL_YOLO_REPO))
+
+
+def _fused_checkpoint_path(weights_hash):
+    return EXPORT_CACHE_DIR / weights_hash / f"{MODEL_PATH.stem}_fused.pt"
+
+
+def _load_fused_checkpoint(path):
+    import torch
+
+    try:
+        return torch.load(path, map_location='cpu', weights_only=False, mmap=True)
+    except (TypeError, RuntimeError):
+        return torch.load(path, map_location='cpu', weights_only=False)  # legacy format / older torch
+
+
+def _load_pytorch():
+    """
+    Eager PyTorch model (the reference backend): attempt_load fuses Conv+BN and sets
+    eval mode, the fused module is cached per weight hash so warm restarts just
+    memory-map it, and AutoShape adds preprocessing and NMS.
+    """
+    import torch
+    from models.common import AutoShape
+    from models.experimental import attempt_load
+
+    fused_path = _fused_checkpoint_path(_weights_hash())
+    model = None
+    if fused_path.exists():
+        try:
+            model = _load_fused_checkpoint(fused_path)['model']
+            print(f"Loading YOLO pest detection model from {fused_path}")
+        except Exception as e:
+            print(f"[PEST] Ignoring unreadable fused checkpoint {fused_path}: {e}")
+
+    if model is None:
+        print(f"Loading YOLO pest detection model from {MODEL_PATH}")
+        model = attempt_load(MODEL_PATH, device=torch.device('cpu'), fuse=True)
+        try:
+            fused_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = fused_path.with_suffix('.tmp')
+            torch.save({'model': model}, tmp_path)
+            os.replace(tmp_path, fused_path)
+        except OSError as e:
+            print(f"[PEST] Could not cache fused checkpoint: {e}")
+
+    return AutoShape(model.eval(), verbose=False)
+
+
+# ============================================
+# EXPORT CACHE
+# ============================================
+
+@lru_cache(maxsize=None)
+def _weights_hash(path=MODEL_PATH):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+
+def _module_available(name):
+    try:
+        __import__(name)
+        return True
+    except ImportError:
+        return False
+
+
+def _resolve_backend():
+    if BACKEND != 'auto':
+        return BACKEND
+    if _module_available('onnxruntime'):
+        return 'onnx'
+    if _module_available('openvino'):
+        return 'openvino'
+    return 'pytorch'
+
+
+def _artifact_path(cache_dir, backend):
+    if backend == 'onnx':
+        return cache_dir / MODEL_PATH.with_suffix('.onnx').name
+    return cache_dir / f"{MODEL_PATH.stem}_openvino_model"
+
+
+def export_model(backend, cache_dir):
+    """
+    Export the checkpoint with the vendored yolov5 exporter into cache_dir.
+    Static 1x3x640x640 input: AutoShape letterboxes non-PyTorch backends to that size.
+    """
+    artifact = _artifact_path(cache_dir, backend)
+    if artifact.exists():
+        return artifact
+
+    import export as yolo_export
+
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    staged = cache_dir / MODEL_PATH.name  # exporter writes next to the weights it reads
+    shutil.copy2(MODEL_PATH, staged)
+    try:
+        print(f"[PEST] Exporting {MODEL_PATH.name} to {backend} in {cache_dir}")
+        yolo_export.run(
+            weights=str(staged),
+            imgsz=(EXPORT_IMG_SIZE, EXPORT_IMG_SIZE),
+            batch_size=1,
+            device='cpu',
+            include=(backend,),
+            simplify=_module_available('onnxsim'),
+        )
+    finally:
+        staged.unlink(missing_ok=True)
+
+    if not artifact.exists():
+        raise RuntimeError(f"Export did not produce {artifact}")
+    return artifact
+
+
+def _load_exported(artifact):
+    import torch
+    from models.common import AutoShape, DetectMultiBackend
+
+    backend = DetectMultiBackend(str(artifact), device=torch.device('cpu'), fuse=True)
+    return AutoShape(backend)
+
+
+# ============================================
+# VALIDATION
+# ============================================
+
+def _box_iou(a, b):
+    ix = max(0.0, min(a[2], b[2]) - max(a[0], b[0]))
+    iy = max(0.0, min(a[3], b[3]) - max(a[1], b[1]))
+    inter = ix * iy
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+def _covered(source, target):
+    """Every confident detection in `source` has a same-class box in `target` that agrees."""
+    for r in source:
+        if r[4] < CONFIDENT:
+            continue
+        best = max(
+            (c for c in target if int(c[5]) == int(r[5])),
+            key=lambda c: _box_iou(r[:4], c[:4]),
+            default=None,
+        )
+        if best is None or _box_iou(r[:4], best[:4]) < IOU_TOLERANCE or abs(best[4] - r[4]) > CONF_TOLERANCE:
+            return False
+    return True
+
+
+def _detections_match(reference, candidate):
+    """
+    Compare two NMS outputs (rows: x1, y1, x2, y2, conf, cls). Detections either model
+    is confident about (conf above the AutoShape threshold plus tolerance) must be
+    present in the other, so the export neither drops nor invents boxes; borderline
+    boxes may legitimately flip either way.
+    """
+    ref, cand = reference.tolist(), candidate.tolist()
+    return _covered(ref, cand) and _covered(cand, ref)
+
+
+def validate_export(reference_model, exported_model, images_dir=VALIDATION_IMAGES_DIR):
+    """
+    Run both models on the validation images and check detections agree. Images
+    without a confident reference detection prove nothing, so at least one image
+    must have one.
+    """
+    paths = sorted(p for p in Path(images_dir).glob('*') if p.suffix.lower() in {'.jpg', '.jpeg', '.png', '.bmp'})
+    if not paths:
+        return {'passed': False, 'images': 0, 'reason': f'no validation images in {images_dir}'}
+
+    with_detections = 0
+    for path in paths:
+        img = _open_image(path)
+        ref = reference_model(img, size=EXPORT_IMG_SIZE, raw=True)[0]
+        cand = exported_model(img, size=EXPORT_IMG_SIZE, raw=True)[0]
+        if not _detections_match(ref, cand):
+            return {'passed': False, 'images': len(paths), 'reason': f'detections differ on {path.name}'}
+        if any(r[4] >= CONFIDENT for r in ref.tolist()):
+            with_detections += 1
+    if not with_detections:
+        return {'passed': False, 'images': len(paths),
+                'reason': f'no confident reference detections in {images_dir}; add pest photos there'}
+    return {'passed': True, 'images': len(paths), 'images_with_detections': with_detections}
+
+
+def _load_validated_export(backend, reference_loader):
+    """
+    Export (once per weight hash), validate against PyTorch (once per artifact) and
+    load the exported model. A passing verdict is cached next to the artifact; a
+    failed one is not, so the next start validates again instead of staying on PyTorch.
+    """
+    weights_hash = _weights_hash()
+    cache_dir = EXPORT_CACHE_DIR / weights_hash
+    _backend_info['weights_hash'] = weights_hash
+
+    artifact = export_model(backend, cache_dir)
+    exported = _load_exported(artifact)
+
+    verdict_path = cache_dir / f"validated_{backend}.json"
+    verdict = None
+    if verdict_path.exists():
+        verdict = json.loads(verdict_path.read_text())
+        if not verdict.get('passed') or verdict.get('check') != VALIDATION_CHECK:
+            verdict = None
+    if verdict is None:
+        verdict = {**validate_export(reference_loader(), exported), 'check': VALIDATION_CHECK}
+        if verdict['passed']:
+            verdict_path.write_text(json.dumps(verdict))
+        elif verdict_path.exists():
+            verdict_path.unlink()
+    _backend_info['validation'] = verdict
+
+    if not verdict.get('passed'):
+        raise RuntimeError(f"Exported {backend} model failed validation: {verdict.get('reason')}")
+    _backend_info['artifact'] = str(artifact)
+    return exported
 
 
 def init_model():
     """Initialize the YOLOv5 model using the local yolov5_custom repository."""
-    global _model
-
     if _model is not None:
         return _model
 
-    try:
-        current_folder = Path(__file__).parent.resolve()
-        model_path = current_folder / 'krishisahai_yolo_final.pt'
-        local_yolo_repo = current_folder / 'yolov5_custom'
+    with _init_lock:  # first request and background warm-up may race
+        if _model is not None:
+            return _model
+        return _init_model_locked()
 
-        if not model_path.exists():
-            raise FileNotFoundError(f"Model file not found: {model_path}")
 
-        if not local_yolo_repo.exists():
-            raise FileNotFoundError(f"Missing custom YOLO architecture folder at: {local_yolo_repo}")
+def warm_up_async():
+    """Load the model on a daemon thread so startup never blocks on it."""
+    global _warmup_thread
 
-        # Add local repo to sys.path so Python finds custom modules
-        if str(local_yolo_repo) not in sys.path:
-            sys.path.insert(0, str(local_yolo_repo))
+    if _model is not None or (_warmup_thread is not None and _warmup_thread.is_alive()):
+        return _warmup_thread
+    _warmup_thread = threading.Thread(target=init_model, name="pest-warmup", daemon=True)
+    _warmup_thread.start()
+    return _warmup_thread
 
-        # --- PATCH 1: Mock IPython if not installed (only needed for Jupyter display) ---
-        try:
-            import IPython  # noqa: F401
-        except ImportError:
-            from unittest.mock import MagicMock
-            mock_ipython = MagicMock()
-            mock_ipython.version_info = (8, 0, 0, '')
-            sys.modules["IPython"] = mock_ipython
-            sys.modules["IPython.display"] = MagicMock()
-            sys.modules["IPython.core"] = MagicMock()
-            sys.modules["IPython.core.pylabtools"] = MagicMock()
-
-        # --- PATCH 2: Mock pkg_resources if not available (only used for version checks) ---
-        try:
-            import pkg_resources  # noqa: F401
-        except ImportError:
-            from unittest.mock import MagicMock
-            class MockPkgResources:
-                def parse_version(self, v): return v
-                def get_distribution(self, n): return MagicMock()
-                def require(self, r): return []
-                def parse_requirements(self, r): return []
-                VersionConflict = Exception
-                DistributionNotFound = Exception
-            mock_pkg = MockPkgResources()
-            sys.modules["pkg_resources"] = mock_pkg
-
-        import torch
-
-        # --- PATCH 3: Force weights_only=False in torch.load (PyTorch 2.6+ breaking change) ---
-        # YOLOv5 checkpoints embed numpy arrays which are not allowed under weights_only=True
-        _original_load = torch.load
-        def _permissive_load(*args, **kwargs):
-            kwargs.setdefault('weights_only', False)
-            return _original_load(*args, **kwargs)
-        torch.load = _permissive_load
-
-        print(f"Loading YOLO pest detection model from {model_path}")
+
+def _init_model_locked():
+    global _model
+
+    try:
+        if not MODEL_PATH.exists():
+            raise FileNotFoundError(f"Model file not found: {MODEL_PATH}")
+
+        if not LOCAL_YOLO_REPO.exists():
+            raise FileNotFoundError(f"Missing custom YOLO architecture folder at: {LOCAL_YOLO_REPO}")
+
+        _prepare_yolo_imports()
+
+        backend = _resolve_backend()
 
         try:
-            _model = torch.hub.load(
-                str(local_yolo_repo),
-                'custom',
-                path=str(model_path),
-                source='local',
-                force_reload=False,
-                verbose=False,
-            )
-            _model.eval()
+            _model = _load_pytorch()
+            _backend_info['backend'] = 'pytorch'
             print("Pest detection model loaded successfully")
         except Exception as e:
-            print(f"Error during hub load: {e}")
+            print(f"Error during model load: {e}")
             import traceback
             traceback.print_exc()
             _model = None
-        finally:
-            torch.load = _original_load  # Always restore original torch.load
+            return None
+
+        if backend in ('onnx', 'openvino'):
+            # Exporting (the vendored exporter may even install its requirements) and validating
+            # take far longer than a request should wait: keep serving PyTorch meanwhile
+            _start_export(backend, _model)
 
         return _model
 
@@ -99,12 +334,70 @@ def init_model():
         return None
 
 
-def predict(image_path):
+def _start_export(backend, reference):
+    global _export_thread
+
+    _backend_info['export_status'] = 'pending'
+    _export_thread = threading.Thread(target=_switch_to_export, args=(backend, reference),
+                                      name="pest-export", daemon=True)
+    _export_thread.start()
+
+
+def _switch_to_export(backend, reference):
+    """Build and validate the export against the PyTorch model already serving, then swap it in."""
+    global _model
+
+    try:
+        exported = _load_validated_export(backend, lambda: reference)
+    except Exception as e:
+        print(f"[PEST] {backend} backend unavailable, staying on PyTorch: {e}")
+        _backend_info['artifact'] = None
+        _backend_info['export_status'] = 'failed'
+        return
+    _model = exported
+    _backend_info['backend'] = backend
+    _backend_info['export_status'] = 'ready'
+    print(f"[PEST] Switched to the validated {backend} model")
+
+
+def get_backend_info():
+    """Which backend serves /api/pest/detect and, for exports, how it validated."""
+    return dict(_backend_info)
+
+
+def _open_image(image):
+    """
+    Returns something the YOLOv5 AutoShape model accepts directly.
+    PIL images and decoded arrays pass through; bytes and binary streams are
+    decoded in memory; a path is opened from disk (fallback).
+    """
+    if isinstance(image, Image.Image):
+        return image
+    if type(image).__module__ == 'numpy':
+        return image  # HxWx3 RGB array
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        image = io.BytesIO(image)
+    img = Image.open(image)
+    img.load()  # Decode now so the source stream can be released
+    return img
+
+
+def predict_bytes(data):
+    """Predict pest from encoded image bytes without touching disk."""
+    return predict(data)
+
+
+def predict_array(arr):
+    """Predict pest from an already-decoded HxWx3 RGB array."""
+    return predict(arr)
+
+
+def predict(image):
     """
     Predict pest from image using YOLOv5.
 
     Args:
-        image_path: Path to the image file
+        image: Image file path, encoded bytes, binary stream, PIL image or RGB array
 
     Returns:
         dict with pest_name, confidence, and severity
@@ -125,7 +418,7 @@ def predict(image_path):
 
         # Load image
         try:
-            img = Image.open(image_path)
+            img = _open_image(image)
         except Exception as e:
             return {
                 'pest_name': 'Error',
@@ -134,13 +427,12 @@ def predict(image_path):
                 'description': f'Failed to open image: {str(e)}'
             }
 
-        # Run inference
-        results = _model(img)
+        # Run inference. raw=True returns the NMS tensor directly (rows: x1, y1, x2, y2, conf, cls),
+        # skipping the Detections object and its pandas conversion
+        model = _model  # may be swapped for the validated export at any time
+        det = model(img, raw=True)[0]
 
-        # Convert detections to DataFrame
-        df = results.pandas().xyxy[0]  # columns: xmin, ymin, xmax, ymax, confidence, class, name
-
-        if df.empty:
+        if det.shape[0] == 0:
             return {
                 'pest_name': 'No Pest Detected',
                 'confidence': 0.0,
@@ -148,10 +440,9 @@ def predict(image_path):
                 'description': 'No pests were detected in the image.'
             }
 
-        # Get highest-confidence detection
-        best = df.sort_values('confidence', ascending=False).iloc[0]
-        pest_name = best['name']
-        confidence = float(best['confidence'])
+        # NMS output is sorted by confidence, so the first row is the best detection
+        _, _, _, _, confidence, cls = det[0].tolist()
+        pest_name = model.names[int(cls)]
 
         if confidence > 0.8:
             severity = 'high'
@@ -178,11 +469,3 @@ def predict(image_path):
             'description': f'Error during detection: {str(e)}'
         }
 
-
-# Warm up the model on import
-try:
-    print("Initializing pest detection model...")
-    init_model()
-    print("Pest detection model initialized successfully")
-except Exception as e:
-    print(f"Warning: Could not initialize pest detection model: {e}")
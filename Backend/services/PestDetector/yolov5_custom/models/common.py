@@ -9,7 +9,7 @@ import platform
 import warnings
 from collections import OrderedDict, namedtuple
 from copy import copy
-from functools import partial
+from functools import cached_property, partial
 from pathlib import Path
 from urllib.parse import urlparse
 
@@ -1386,7 +1386,7 @@ class AutoShape(nn.Module):
         return self
 
     @smart_inference_mode()
-    def forward(self, ims, size=640, augment=False, profile=False):
+    def forward(self, ims, size=640, augment=False, profile=False, raw=False):
         # Inference from various sources. For size(height=640, width=1280), RGB images example inputs are:
         #   file:        ims = 'data/images/zidane.jpg'  # str or PosixPath
         #   URI:             = 'https://ultralytics.com/images/zidane.jpg'
@@ -1395,6 +1395,8 @@ class AutoShape(nn.Module):
         #   numpy:           = np.zeros((640,1280,3))  # HWC
         #   torch:           = torch.zeros(16,3,320,640)  # BCHW (scaled to size=640, 0-1 values)
         #   multiple:        = [Image.open('image1.jpg'), Image.open('image2.jpg'), ...]  # list of images
+        # raw=True skips the Detections wrapper and returns the per-image NMS tensors (n,6) [xyxy, conf, cls],
+        # sorted by confidence and scaled to original image pixels
 
         dt = (Profile(), Profile(), Profile())
         with dt[0]:
@@ -1447,28 +1449,61 @@ class AutoShape(nn.Module):
                 for i in range(n):
                     scale_boxes(shape1, y[i][:, :4], shape0[i])
 
+            if raw:
+                return y
             return Detections(ims, y, files, dt, self.names, x.shape)
 
+    def topk(self, ims, k=1, size=640):
+        # Top-k detections per image as plain dicts, straight from the NMS output (no Detections/pandas)
+        return [_topk_rows(pred, self.names, k) for pred in self.forward(ims, size=size, raw=True)]
+
+
+def _topk_rows(pred, names, k=1):
+    # NMS output is already sorted by descending confidence
+    rows = pred[:k].tolist() if k else pred.tolist()
+    return [{
+        'xyxy': r[:4],
+        'confidence': r[4],
+        'class': int(r[5]),
+        'name': names[int(r[5])]} for r in rows]
+
 
 class Detections:
     # YOLOv5 detections class for inference results
     def __init__(self, ims, pred, files, times=(0, 0, 0), names=None, shape=None):
         super().__init__()
-        d = pred[0].device  # device
-        gn = [torch.tensor([*(im.shape[i] for i in [1, 0, 1, 0]), 1, 1], device=d) for im in ims]  # normalizations
         self.ims = ims  # list of images as numpy arrays
         self.pred = pred  # list of tensors pred[0] = (xyxy, conf, cls)
         self.names = names  # class names
         self.files = files  # image filenames
         self.times = times  # profiling times
         self.xyxy = pred  # xyxy pixels
-        self.xywh = [xyxy2xywh(x) for x in pred]  # xywh pixels
-        self.xyxyn = [x / g for x, g in zip(self.xyxy, gn)]  # xyxy normalized
-        self.xywhn = [x / g for x, g in zip(self.xywh, gn)]  # xywh normalized
         self.n = len(self.pred)  # number of images (batch size)
         self.t = tuple(x.t / self.n * 1E3 for x in times)  # timestamps (ms)
         self.s = tuple(shape)  # inference BCHW shape
 
+    # Derived box formats are computed lazily on first access
+    @cached_property
+    def gn(self):
+        d = self.pred[0].device  # device
+        return [torch.tensor([*(im.shape[i] for i in [1, 0, 1, 0]), 1, 1], device=d) for im in self.ims]  # normalizations
+
+    @cached_property
+    def xywh(self):
+        return [xyxy2xywh(x) for x in self.pred]  # xywh pixels
+
+    @cached_property
+    def xyxyn(self):
+        return [x / g for x, g in zip(self.xyxy, self.gn)]  # xyxy normalized
+
+    @cached_property
+    def xywhn(self):
+        return [x / g for x, g in zip(self.xywh, self.gn)]  # xywh normalized
+
+    def topk(self, k=1):
+        # Top-k detections per image as plain dicts, without building DataFrames
+        return [_topk_rows(pred, self.names, k) for pred in self.pred]
+
     def _run(self, pprint=False, show=False, save=False, crop=False, render=False, labels=True, save_dir=Path('')):
         s, crops = '', []
         for i, (im, pred) in enumerate(zip(self.ims, self.pred)):
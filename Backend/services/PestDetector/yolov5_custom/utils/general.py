@@ -870,6 +870,7 @@ def non_max_suppression(
         labels=(),
         max_det=300,
         nm=0,  # number of masks
+        batched=True,  # one batched_nms over the whole batch; False = per-image loop (reference path)
 ):
     """Non-Maximum Suppression (NMS) on inference results to reject overlapping detections
 
@@ -903,6 +904,15 @@ def non_max_suppression(
 
     t = time.time()
     mi = 5 + nc  # mask start index
+    if batched and not labels and not merge:  # autolabelling and merge-NMS use the per-image path
+        output = _batched_nms(prediction, xc, conf_thres, iou_thres, classes, agnostic, multi_label, max_det, nm,
+                              max_nms)
+        dt = time.time() - t
+        if dt > time_limit:
+            LOGGER.warning(f'WARNING ⚠️ NMS time limit {time_limit:.3f}s exceeded '
+                           f'({dt:.3f}s for batch of {bs}, {dt / bs * 1E3:.1f}ms/img)')
+        return [x.to(device) for x in output] if mps else output
+
     output = [torch.zeros((0, 6 + nm), device=prediction.device)] * bs
     for xi, x in enumerate(prediction):  # image index, image inference
         # Apply constraints
@@ -978,6 +988,61 @@ def non_max_suppression(
     return output
 
 
+def _batched_nms(prediction, xc, conf_thres, iou_thres, classes, agnostic, multi_label, max_det, nm, max_nms):
+    # Vectorized non_max_suppression(): candidates from every image are flattened, grouped by (image, class) and
+    # suppressed with a single torchvision.ops.batched_nms call, then split back per image in confidence order
+    bs = prediction.shape[0]  # batch size
+    mi = prediction.shape[2] - nm  # mask start index
+    bi, ai = xc.nonzero(as_tuple=True)  # image index, anchor index of candidates
+    x = prediction[bi, ai]  # (n, 5+nc+nm) copy, safe to modify
+    if not x.shape[0]:
+        return [torch.zeros((0, 6 + nm), device=prediction.device) for _ in range(bs)]
+
+    # Compute conf
+    x[:, 5:mi] *= x[:, 4:5]  # conf = obj_conf * cls_conf
+
+    # Box/Mask
+    box = xywh2xyxy(x[:, :4])  # center_x, center_y, width, height) to (x1, y1, x2, y2)
+    mask = x[:, mi:]  # zero columns if no masks
+
+    # Detections matrix nx6 (xyxy, conf, cls)
+    if multi_label:
+        i, j = (x[:, 5:mi] > conf_thres).nonzero(as_tuple=False).T
+        x, bi = torch.cat((box[i], x[i, 5 + j, None], j[:, None].float(), mask[i]), 1), bi[i]
+    else:  # best class only
+        conf, j = x[:, 5:mi].max(1, keepdim=True)
+        keep = conf.view(-1) > conf_thres
+        x, bi = torch.cat((box, conf, j.float(), mask), 1)[keep], bi[keep]
+
+    # Filter by class
+    if classes is not None:
+        keep = (x[:, 5:6] == torch.tensor(classes, device=x.device)).any(1)
+        x, bi = x[keep], bi[keep]
+
+    # Sort by confidence within each image and keep at most max_nms boxes per image
+    x, bi = _group_by_image(x, bi, bs, max_nms)
+    if not x.shape[0]:
+        return [torch.zeros((0, 6 + nm), device=prediction.device) for _ in range(bs)]
+
+    # Batched NMS: boxes only compete within the same image (and class unless agnostic)
+    idxs = bi if agnostic else bi * (mi - 5) + x[:, 5].long()
+    i = torchvision.ops.batched_nms(x[:, :4], x[:, 4], idxs, iou_thres)  # sorted by decreasing score
+    x, bi = _group_by_image(x[i], bi[i], bs, max_det)
+    return list(x.split(torch.bincount(bi, minlength=bs).tolist()))
+
+
+def _group_by_image(x, bi, bs, limit):
+    # Order rows by (image, descending confidence) and keep the first `limit` rows of each image
+    order = x[:, 4].argsort(descending=True)
+    x, bi = x[order], bi[order]
+    bi, order = torch.sort(bi, stable=True)  # stable: keeps confidence order within an image
+    x = x[order]
+    counts = torch.bincount(bi, minlength=bs)
+    rank = torch.arange(len(bi), device=bi.device) - (counts.cumsum(0) - counts)[bi]  # position within image
+    keep = rank < limit
+    return x[keep], bi[keep]
+
+
 def strip_optimizer(f='best.pt', s=''):  # from utils.general import *; strip_optimizer()
     # Strip optimizer from 'f' to finalize training, optionally save as 's'
     x = torch.load(f, map_location=torch.device('cpu'))
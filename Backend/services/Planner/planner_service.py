@@ -1,8 +1,8 @@
-import os
 import json
 import firebase_admin
 from firebase_admin import firestore
-from langchain_ollama import ChatOllama
+from services.Shared.llm_registry import get_llm
+from services.Shared.roadmap_stream import ROADMAP_HEADERS, stream_roadmap_events
 import re
 
 def get_db():
@@ -14,11 +14,7 @@ def get_db():
 
 class CropPlannerGenerator:
     def __init__(self):
-        self.llm = ChatOllama(
-            model=os.getenv("OLLAMA_MODEL", "llama3.2"),
-            temperature=0.5, # Increased for better structured output
-            base_url=os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
-        )
+        self.llm = get_llm("long-form", temperature=0.5) # Increased for better structured output
 
     def get_farmer_profile(self, user_id):
         try:
@@ -35,7 +31,8 @@ class CropPlannerGenerator:
             print(f"Error fetching farmer profile: {e}")
             return None
 
-    def generate_crop_roadmap(self, user_id, crop_name, language='en'):
+    def _build_crop_prompt(self, user_id, crop_name, language):
+        """Returns (prompt, context, lang_upper) for the blocking and streaming generators."""
         # 1. Fetch Data
         profile = self.get_farmer_profile(user_id)
         if not profile:
@@ -160,6 +157,11 @@ Structure (Use these exact Headers in {context['language_name']}):
 DISCLAIMER: This roadmap is an AI-generated simulation based on provided data and regional averages. Actual results may vary due to climate conditions and management.
 """
         
+        return prompt, context, lang_upper
+
+    def generate_crop_roadmap(self, user_id, crop_name, language='en'):
+        prompt, context, lang_upper = self._build_crop_prompt(user_id, crop_name, language)
+
         print(f"[CROP-ROADMAP] Generating for {crop_name} in {lang_upper}...")
         try:
             response = self.llm.invoke(prompt)
@@ -170,6 +172,25 @@ DISCLAIMER: This roadmap is an AI-generated simulation based on provided data an
             print(f"[CROP-ROADMAP ERROR] {e}")
             return {"title": f"Crop Lifecycle Planner for {crop_name} (Error)", "overview": str(e), "years": [], "verdict": "Error"}
 
+    def stream_crop_roadmap(self, user_id, crop_name, language='en'):
+        """
+        Streaming variant of generate_crop_roadmap: yields token events, then each section /
+        phase as soon as it is complete, and finally {"type": "done", "roadmap": ...}.
+        """
+        prompt, context, lang_upper = self._build_crop_prompt(user_id, crop_name, language)
+        print(f"[CROP-ROADMAP] Streaming for {crop_name} in {lang_upper}...")
+        yield {"type": "meta", "title": f"Crop Lifecycle Planner for {context['crop_name']}"}
+        try:
+            yield from stream_roadmap_events(
+                self.llm,
+                prompt,
+                lambda text: self.parse_markdown_roadmap(text, context['crop_name'], lang_upper),
+            )
+        except Exception as e:
+            print(f"[CROP-ROADMAP ERROR] {e}")
+            yield {"type": "error", "error": str(e)}
+            yield {"type": "done", "roadmap": {"title": f"Crop Lifecycle Planner for {crop_name} (Error)", "overview": str(e), "years": [], "verdict": "Error"}}
+
     def parse_markdown_roadmap(self, text, crop_name, language='EN'):
         import re
         
@@ -185,15 +206,7 @@ DISCLAIMER: This roadmap is an AI-generated simulation based on provided data an
             "disclaimer": ""
         }
 
-        # Multi-language header mapping for the parser
-        HEADERS = {
-            "overview": r'# (?:Overview|अवलोकन|आढावा|Crop Overview|फसल अवलोकन|पीक आढावा)',
-            "planner": r'# (?:1\. 10-Year Growth & Profit Planner|1\. 10-वर्षीय विकास और लाभ योजनाकार|1\. 10-वर्षांचे विकास आणि नफा नियोजक|1\. Crop Lifecycle Planner|1\. फसल जीवनचक्र योजनाकार|1\. पीक जीवनचक्र नियोजक)',
-            "labor": r'# (?:2\. Labor & Aging Analysis|2\. श्रम और उम्र बढ़ने का विश्लेषण|2\. श्रम आणि वृद्धत्व विश्लेषण|2\. Resource & Labor Management|2\. संसाधन और श्रम प्रबंधन|2\. संसाधन आणि श्रम व्यवस्थापन)',
-            "sustainability": r'# (?:3\. Sustainability & Succession|3\. स्थिरता और उत्तराधिकार|3\. शाश्वतता आणि उत्तराधिकार|3\. Quality & Harvest Sustainability|3\. गुणवत्ता और फसल स्थिरता|3\. गुणवत्ता आणि पीक शाश्वतता)',
-            "resilience": r'# (?:4\. Financial Resilience|4\. वित्तीय लचीलापन|4\. आर्थिक लवचिकता|4\. Market & Risk Management|4\. बाजार और जोखिम प्रबंधन|4\. बाजार आणि जोखीम व्यवस्थापन)',
-            "verdict": r'# (?:5\. Final Verdict|5\. अंतिम निर्णय|5\. अंतिम निकाल|5\. Final Harvest Verdict|5\. अंतिम फसल निर्णय|5\. अंतिम पीक निकाल)'
-        }
+        HEADERS = ROADMAP_HEADERS
 
         def extract_between(start_regex, end_regex=None):
             if end_regex:
@@ -0,0 +1,96 @@
+"""
+Shared asyncio runtime for the Flask backend.
+
+Flask route handlers are synchronous, but the weather, news and notification
+services are async. Instead of spinning up a fresh event loop with
+`asyncio.run(...)` on every request, a single long-lived loop runs in a
+daemon thread and sync code submits coroutines to it with `run_async(...)`.
+Keeping one loop alive also lets the services hold on to their pooled
+keep-alive HTTP clients between requests.
+"""
+
+import asyncio
+import atexit
+import threading
+
+_loop = None
+_thread = None
+_lock = threading.Lock()
+_shutdown_hooks = []
+
+
+def _run_loop(loop):
+    asyncio.set_event_loop(loop)
+    loop.run_forever()
+
+
+def get_loop():
+    """Return the background event loop, starting it on first use."""
+    global _loop, _thread
+    if _loop is not None and _loop.is_running():
+        return _loop
+
+    with _lock:
+        if _loop is None or _loop.is_closed():
+            _loop = asyncio.new_event_loop()
+            _thread = threading.Thread(
+                target=_run_loop,
+                args=(_loop,),
+                name="krishi-async-loop",
+                daemon=True,
+            )
+            _thread.start()
+            print("[ASYNC] Background event loop started")
+    return _loop
+
+
+def run_async(coro, timeout=None):
+    """
+    Run a coroutine on the background loop and block until it finishes.
+
+    Safe to call from any Flask worker thread or APScheduler job. Must not be
+    called from a coroutine already running on the background loop.
+    """
+    loop = get_loop()
+    if threading.current_thread() is _thread:
+        raise RuntimeError("run_async() cannot be called from the background event loop thread")
+    future = asyncio.run_coroutine_threadsafe(coro, loop)
+    try:
+        return future.result(timeout)
+    except TimeoutError:
+        future.cancel()
+        raise
+
+
+def submit_async(coro):
+    """Schedule a coroutine on the background loop without waiting for it."""
+    return asyncio.run_coroutine_threadsafe(coro, get_loop())
+
+
+def on_shutdown(coro_fn):
+    """Register an async cleanup callback (e.g. closing HTTP clients) for process exit."""
+    _shutdown_hooks.append(coro_fn)
+    return coro_fn
+
+
+def shutdown(timeout=5.0):
+    """Run shutdown hooks and stop the background loop."""
+    global _loop, _thread
+    if _loop is None or not _loop.is_running():
+        return
+
+    for hook in _shutdown_hooks:
+        try:
+            asyncio.run_coroutine_threadsafe(hook(), _loop).result(timeout)
+        except Exception as e:
+            print(f"[ASYNC] Shutdown hook error: {e}")
+
+    _loop.call_soon_threadsafe(_loop.stop)
+    if _thread is not None:
+        _thread.join(timeout)
+    _loop.close()
+    _loop = None
+    _thread = None
+
+
+atexit.register(shutdown)
@@ -0,0 +1,256 @@
+"""
+Content-addressed cache for deterministic LLM generations.
+
+Recommendations, waste analysis and farm health analysis produce the same
+multi-kilobyte JSON for the same inputs, so results are cached under a hash of
+
+    (namespace, prompt template, model settings, canonicalized inputs)
+
+The prompt template is the actual prompt text sent to the model (e.g. the
+constants from a service's prompts.py), so editing a prompt changes every key
+and stale generations are never served. Two tiers:
+
+- memory : per-process LRU of serialized results (fast path)
+- disk   : shared SQLite file, survives restarts and is shared by workers
+
+Both tiers honour the TTL; the disk tier is bounded by total size and evicts
+least recently used entries first. Only successful generations are stored.
+
+Configuration (environment):
+    GENERATION_CACHE            on | off                    (default: on)
+    GENERATION_CACHE_DB         SQLite file path            (default: Backend/generation_cache.db)
+    GENERATION_CACHE_TTL        seconds an entry stays valid (default: 604800, 7 days)
+    GENERATION_CACHE_MAX        max entries in memory per worker (default: 256)
+    GENERATION_CACHE_MAX_MB     max size of the disk tier    (default: 64)
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Optional
+
+
+def _canonical(value: Any) -> Any:
+    """Normalize inputs so trivially different requests share a key."""
+    if isinstance(value, str):
+        return " ".join(unicodedata.normalize("NFC", value).split()).casefold()
+    if isinstance(value, dict):
+        return {str(k): _canonical(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_canonical(v) for v in value]
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+def _model_settings(llm) -> dict:
+    return {name: getattr(llm, name, None) for name in ("model", "temperature", "num_predict", "num_ctx", "format")}
+
+
+def generation_key(namespace: str, template: str, llm, inputs: dict) -> str:
+    payload = {
+        "ns": namespace,
+        "template": hashlib.sha256(template.encode("utf-8")).hexdigest(),
+        "model": _model_settings(llm),
+        "inputs": _canonical(inputs),
+    }
+    blob = json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+class _DiskTier:
+    def __init__(self, path: str, ttl: int, max_bytes: int):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS generations ("
+            " key TEXT PRIMARY KEY,"
+            " namespace TEXT NOT NULL,"
+            " value TEXT NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " created REAL NOT NULL,"
+            " last_access REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_generations_last_access ON generations(last_access)")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Optional[str]:
+        conn = self._conn()
+        row = conn.execute("SELECT value, created FROM generations WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        now = time.time()
+        if now - row[1] > self.ttl:
+            conn.execute("DELETE FROM generations WHERE key = ?", (key,))
+            return None
+        conn.execute("UPDATE generations SET last_access = ? WHERE key = ?", (now, key))
+        return row[0]
+
+    def set(self, key: str, namespace: str, value: str):
+        conn = self._conn()
+        now = time.time()
+        conn.execute(
+            "INSERT OR REPLACE INTO generations (key, namespace, value, size, created, last_access) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (key, namespace, value, len(value.encode("utf-8")), now, now),
+        )
+        self._evict(conn, now)
+
+    def _evict(self, conn: sqlite3.Connection, now: float):
+        conn.execute("DELETE FROM generations WHERE created < ?", (now - self.ttl,))
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM generations").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # Drop least recently used entries until back under the bound
+        excess = total - self.max_bytes
+        freed = 0
+        doomed = []
+        for key, size in conn.execute("SELECT key, size FROM generations ORDER BY last_access ASC"):
+            doomed.append((key,))
+            freed += size
+            if freed >= excess:
+                break
+        conn.executemany("DELETE FROM generations WHERE key = ?", doomed)
+
+    def stats(self) -> dict:
+        count, size = self._conn().execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM generations").fetchone()
+        return {"entries": count, "bytes": size}
+
+
+class GenerationCache:
+    def __init__(self, ttl: int, max_entries: int, disk: Optional[_DiskTier] = None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.disk = disk
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (created, serialized value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and now - entry[0] <= self.ttl:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return json.loads(entry[1])  # fresh copy, callers may mutate it
+            self._memory.pop(key, None)
+
+        if self.disk is not None:
+            try:
+                value = self.disk.get(key)
+            except sqlite3.Error as e:
+                print(f"[GEN-CACHE] Disk read failed: {e}")
+                value = None
+            if value is not None:
+                self._remember(key, value, now)
+                with self._lock:
+                    self.disk_hits += 1
+                return json.loads(value)
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, key: str, namespace: str, value: Any):
+        serialized = json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+        self._remember(key, serialized, time.time())
+        if self.disk is not None:
+            try:
+                self.disk.set(key, namespace, serialized)
+            except sqlite3.Error as e:
+                print(f"[GEN-CACHE] Disk write failed: {e}")
+
+    def _remember(self, key: str, serialized: str, created: float):
+        with self._lock:
+            self._memory[key] = (created, serialized)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def cached(self, namespace: str, template: str, llm, inputs: dict,
+               generate: Callable[[], Any], is_cacheable: Callable[[Any], bool] = lambda result: True) -> Any:
+        """Return the cached generation for these inputs, generating and storing it on a miss."""
+        key = generation_key(namespace, template, llm, inputs)
+        result = self.get(key)
+        if result is not None:
+            print(f"[GEN-CACHE] Hit for {namespace}")
+            return result
+
+        result = generate()
+        if result is not None and is_cacheable(result):
+            self.set(key, namespace, result)
+        return result
+
+    def stats(self) -> dict:
+        with self._lock:
+            data = {
+                "memory_entries": len(self._memory),
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+            }
+        if self.disk is not None:
+            try:
+                data["disk"] = self.disk.stats()
+            except sqlite3.Error as e:
+                data["disk"] = {"error": str(e)}
+        return data
+
+
+class _DisabledCache(GenerationCache):
+    def __init__(self):
+        super().__init__(ttl=0, max_entries=0)
+
+    def cached(self, namespace, template, llm, inputs, generate, is_cacheable=lambda result: True):
+        return generate()
+
+
+_cache: Optional[GenerationCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_generation_cache() -> GenerationCache:
+    """Process-wide cache configured by the GENERATION_CACHE_* environment variables"""
+    global _cache
+    if _cache is not None:
+        return _cache
+
+    with _cache_lock:
+        if _cache is None:
+            if os.getenv("GENERATION_CACHE", "on").lower() in {"0", "off", "false"}:
+                _cache = _DisabledCache()
+                return _cache
+
+            ttl = int(os.getenv("GENERATION_CACHE_TTL", str(7 * 24 * 3600)))
+            disk = None
+            try:
+                default_db = Path(__file__).resolve().parents[2] / "generation_cache.db"
+                disk = _DiskTier(
+                    os.getenv("GENERATION_CACHE_DB", str(default_db)),
+                    ttl,
+                    int(float(os.getenv("GENERATION_CACHE_MAX_MB", "64")) * 1024 * 1024),
+                )
+            except (sqlite3.Error, OSError) as e:
+                print(f"[GEN-CACHE] Disk tier unavailable ({e}), using memory only")
+            _cache = GenerationCache(ttl, int(os.getenv("GENERATION_CACHE_MAX", "256")), disk)
+    return _cache
@@ -0,0 +1,277 @@
+"""
+Leader lease: exactly one process runs the scheduled jobs.
+
+Every gunicorn worker imports app.py and starts APScheduler, so without
+coordination each interval job runs once per worker. Each process instead
+competes for a named lease:
+
+    holder       "<host>:<pid>:<random>" of the process that owns it
+    expires_at   the lease is free once this passes
+    acquired_at  when the current holder took it over
+
+A background thread tries to acquire or renew the lease every TTL/3 seconds.
+The holder keeps renewing; every other process finds it held and waits. If
+the holder dies, its lease expires after at most SCHEDULER_LEASE_TTL seconds
+and the next attempt by another process takes it over (failover). A process
+that exits cleanly releases the lease so takeover is immediate. A holder that
+cannot reach the backend steps down before its lease could have expired, so
+two leaders never overlap by more than clock skew between hosts.
+
+Backends:
+- sqlite    : SQLite file shared by all workers on one host (default)
+- firestore : Firestore document shared by all hosts (production)
+- off       : no coordination, every process is leader (previous behaviour)
+
+Configuration (environment):
+    SCHEDULER_LEASE_BACKEND      sqlite | firestore | off (default: sqlite)
+    SCHEDULER_LEASE_DB           SQLite file path          (default: Backend/scheduler_lease.db)
+    SCHEDULER_LEASE_COLLECTION   Firestore collection      (default: scheduler_leases)
+    SCHEDULER_LEASE_TTL          lease duration in seconds (default: 60)
+"""
+
+import atexit
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Tuple
+
+Lease = Dict[str, Any]
+
+
+class AlwaysLeaderBackend:
+    """No coordination: every process holds the lease."""
+
+    def acquire(self, name: str, holder: str, ttl: float) -> Tuple[bool, Lease]:
+        now = time.time()
+        return True, {"holder": holder, "expires_at": now + ttl, "acquired_at": now, "renewed_at": now}
+
+    def release(self, name: str, holder: str):
+        pass
+
+
+class SQLiteLeaseBackend:
+    """Lease row in a SQLite file; serializes competing workers on one host."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=5.0, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS leases ("
+            " name TEXT PRIMARY KEY,"
+            " holder TEXT NOT NULL,"
+            " expires_at REAL NOT NULL,"
+            " acquired_at REAL NOT NULL,"
+            " renewed_at REAL NOT NULL)"
+        )
+
+    def acquire(self, name: str, holder: str, ttl: float) -> Tuple[bool, Lease]:
+        with self._lock:
+            conn = self._conn
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                now = time.time()
+                row = conn.execute(
+                    "SELECT holder, expires_at, acquired_at, renewed_at FROM leases WHERE name = ?", (name,)
+                ).fetchone()
+                if row is not None and row[0] != holder and row[1] > now:
+                    conn.execute("COMMIT")
+                    return False, {"holder": row[0], "expires_at": row[1], "acquired_at": row[2], "renewed_at": row[3]}
+                acquired_at = row[2] if row is not None and row[0] == holder else now
+                conn.execute(
+                    "INSERT OR REPLACE INTO leases (name, holder, expires_at, acquired_at, renewed_at) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (name, holder, now + ttl, acquired_at, now),
+                )
+                conn.execute("COMMIT")
+                return True, {"holder": holder, "expires_at": now + ttl, "acquired_at": acquired_at, "renewed_at": now}
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def release(self, name: str, holder: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM leases WHERE name = ? AND holder = ?", (name, holder))
+
+
+class FirestoreLeaseBackend:
+    """Lease document updated in a Firestore transaction; works across hosts."""
+
+    def __init__(self, get_db: Callable[[], Any], collection: str):
+        self._get_db = get_db
+        self.collection = collection
+
+    def acquire(self, name: str, holder: str, ttl: float) -> Tuple[bool, Lease]:
+        from firebase_admin import firestore
+
+        db = self._get_db()
+        ref = db.collection(self.collection).document(name)
+
+        @firestore.transactional
+        def attempt(transaction):
+            snapshot = ref.get(transaction=transaction)
+            current = snapshot.to_dict() if snapshot.exists else None
+            now = time.time()
+            if current and current.get("holder") != holder and current.get("expires_at", 0) > now:
+                return False, current
+            acquired_at = current.get("acquired_at", now) if current and current.get("holder") == holder else now
+            lease = {"holder": holder, "expires_at": now + ttl, "acquired_at": acquired_at, "renewed_at": now}
+            transaction.set(ref, lease)
+            return True, lease
+
+        return attempt(db.transaction())
+
+    def release(self, name: str, holder: str):
+        from firebase_admin import firestore
+
+        db = self._get_db()
+        ref = db.collection(self.collection).document(name)
+
+        @firestore.transactional
+        def attempt(transaction):
+            snapshot = ref.get(transaction=transaction)
+            if snapshot.exists and (snapshot.to_dict() or {}).get("holder") == holder:
+                transaction.delete(ref)
+
+        attempt(db.transaction())
+
+
+class LeaderLease:
+    def __init__(self, name: str, backend, ttl: float = 60.0,
+                 on_acquire: Optional[Callable[[], None]] = None,
+                 on_lose: Optional[Callable[[], None]] = None):
+        self.name = name
+        self.backend = backend
+        self.ttl = ttl
+        self.renew_interval = max(1.0, ttl / 3)
+        self.holder_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.on_acquire = on_acquire
+        self.on_lose = on_lose
+        self._lock = threading.Lock()
+        self._leader = False
+        self._expires_at = 0.0
+        self._current: Optional[Lease] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._stats = {"acquired": 0, "lost": 0, "renewals": 0, "errors": 0}
+        self._last_error: Optional[str] = None
+
+    @property
+    def is_leader(self) -> bool:
+        with self._lock:
+            # Never act on a lease that may already have expired
+            return self._leader and time.time() < self._expires_at
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name=f"lease-{self.name}", daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.attempt()
+            self._stop.wait(self.renew_interval)
+
+    def attempt(self) -> bool:
+        """Acquire or renew the lease once; returns whether this process is now the leader"""
+        try:
+            acquired, lease = self.backend.acquire(self.name, self.holder_id, self.ttl)
+        except Exception as e:
+            with self._lock:
+                self._stats["errors"] += 1
+                self._last_error = str(e)
+                # Step down while the lease is still ours on paper, so a new leader never overlaps
+                expiring = self._leader and time.time() > self._expires_at - self.renew_interval
+            print(f"[LEASE] {self.name}: backend error: {e}")
+            if expiring:
+                self._set_leader(False)
+            return self.is_leader
+
+        with self._lock:
+            self._current = lease
+            self._last_error = None
+            if acquired:
+                self._expires_at = lease["expires_at"]
+                if self._leader:
+                    self._stats["renewals"] += 1
+        self._set_leader(acquired)
+        return acquired
+
+    def _set_leader(self, leader: bool):
+        with self._lock:
+            changed = leader != self._leader
+            self._leader = leader
+            if changed:
+                self._stats["acquired" if leader else "lost"] += 1
+        if not changed:
+            return
+        if leader:
+            print(f"[LEASE] {self.name}: {self.holder_id} is now the leader")
+        else:
+            print(f"[LEASE] {self.name}: {self.holder_id} is no longer the leader")
+        callback = self.on_acquire if leader else self.on_lose
+        if callback is not None:
+            try:
+                callback()
+            except Exception as e:
+                print(f"[LEASE] {self.name}: leadership callback failed: {e}")
+
+    def stop(self):
+        """Stop renewing and release the lease so another process takes over immediately"""
+        self._stop.set()
+        with self._lock:
+            was_leader = self._leader
+        if was_leader:
+            try:
+                self.backend.release(self.name, self.holder_id)
+            except Exception as e:
+                print(f"[LEASE] {self.name}: release failed: {e}")
+            self._set_leader(False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            current = dict(self._current) if self._current else None
+            data = {
+                **self._stats,
+                "name": self.name,
+                "backend": type(self.backend).__name__,
+                "this_worker": self.holder_id,
+                "is_leader": self._leader and time.time() < self._expires_at,
+                "holder": current.get("holder") if current else None,
+                "last_error": self._last_error,
+            }
+        if current:
+            now = time.time()
+            data["held_for_s"] = round(now - current.get("acquired_at", now), 1)
+            data["expires_in_s"] = round(current.get("expires_at", now) - now, 1)
+        return data
+
+
+def create_leader_lease(name: str, get_db: Callable[[], Any] = None, **callbacks) -> LeaderLease:
+    """Build the lease configured by the SCHEDULER_LEASE_* environment variables"""
+    kind = os.getenv("SCHEDULER_LEASE_BACKEND", "sqlite").lower()
+    ttl = float(os.getenv("SCHEDULER_LEASE_TTL", "60"))
+
+    backend = None
+    try:
+        if kind == "firestore":
+            if get_db is None:
+                raise ValueError("no Firestore client")
+            backend = FirestoreLeaseBackend(get_db, os.getenv("SCHEDULER_LEASE_COLLECTION", "scheduler_leases"))
+        elif kind == "sqlite":
+            default_db = Path(__file__).resolve().parents[2] / "scheduler_lease.db"
+            backend = SQLiteLeaseBackend(os.getenv("SCHEDULER_LEASE_DB", str(default_db)))
+    except Exception as e:
+        print(f"[LEASE] Backend '{kind}' unavailable ({e}), every process will run scheduled jobs")
+        backend = None
+
+    if backend is None:
+        backend = AlwaysLeaderBackend()
+    return LeaderLease(name, backend, ttl, **callbacks)
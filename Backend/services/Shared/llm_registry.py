@@ -0,0 +1,254 @@
+"""
+Shared Ollama client registry.
+
+Every Ollama-backed service asks for a client by role instead of building its
+own `ChatOllama`:
+
+    chat       conversational replies and streaming
+    json       structured output (format="json")
+    long-form  multi-section documents such as roadmaps and plans
+
+Clients are built once per (role, settings) and reused by every caller, so
+creating an advisor session or a service engine no longer constructs LLM
+clients. All clients talk to Ollama through one pooled keep-alive HTTP
+transport (sync and async), and each role has a concurrency cap shared by
+every service using it so one slow feature cannot occupy every Ollama slot.
+
+Per-role caps are configured with LLM_MAX_CONCURRENCY_CHAT,
+LLM_MAX_CONCURRENCY_JSON and LLM_MAX_CONCURRENCY_LONG_FORM.
+
+Prompt-cache friendliness: Ollama reuses the KV cache of a loaded model for
+a request whose prompt starts with the same tokens, but it reloads the model
+(discarding the cache) whenever load-time options such as `num_ctx` differ
+between requests. Every client therefore uses the same `num_ctx`
+(OLLAMA_NUM_CTX) and the same `keep_alive` (OLLAMA_KEEP_ALIVE), and callers
+put their static text (rules, profile) first so it stays byte-identical.
+Streaming calls record time-to-first-token and Ollama's prompt_eval_count
+per role (see get_llm_stats()).
+"""
+
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+
+from langchain_ollama import ChatOllama
+
+OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "llama3.2")
+OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
+OLLAMA_NUM_CTX = int(os.getenv("OLLAMA_NUM_CTX", "4096"))
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+
+# Load-time options shared by every client; differing values make Ollama reload the model
+SHARED_OPTIONS = {"num_ctx": OLLAMA_NUM_CTX, "keep_alive": OLLAMA_KEEP_ALIVE}
+
+# Defaults per role; callers may override individual settings
+ROLE_DEFAULTS = {
+    "chat": {"temperature": 0.4, "num_predict": 1200},
+    "json": {"temperature": 0.1, "format": "json", "num_predict": 1500},
+    "long-form": {"temperature": 0.5},
+}
+
+DEFAULT_CONCURRENCY = {"chat": 4, "json": 2, "long-form": 2}
+
+
+def _concurrency_for(role: str) -> int:
+    env_name = f"LLM_MAX_CONCURRENCY_{role.upper().replace('-', '_')}"
+    return max(1, int(os.getenv(env_name, DEFAULT_CONCURRENCY[role])))
+
+
+class LatencyStats:
+    """Time-to-first-token and prompt evaluation figures for one role's streaming calls."""
+
+    def __init__(self, window: int = 200):
+        self._lock = threading.Lock()
+        self._ttft_ms = deque(maxlen=window)
+        self._prompt_eval = deque(maxlen=window)  # (prompt_eval_count, prompt_eval_ms)
+
+    def record_ttft(self, seconds: float):
+        with self._lock:
+            self._ttft_ms.append(seconds * 1000)
+
+    def record_generation(self, info: dict):
+        count = info.get("prompt_eval_count")
+        if count is None:
+            return
+        with self._lock:
+            self._prompt_eval.append((count, (info.get("prompt_eval_duration") or 0) / 1e6))
+
+    def stats(self) -> dict:
+        with self._lock:
+            ttft = sorted(self._ttft_ms)
+            evals = list(self._prompt_eval)
+        data = {"samples": len(ttft)}
+        if ttft:
+            data["ttft_ms_p50"] = round(ttft[len(ttft) // 2], 1)
+            data["ttft_ms_p95"] = round(ttft[min(len(ttft) - 1, int(len(ttft) * 0.95))], 1)
+        if evals:
+            # Ollama only counts tokens it had to evaluate, so a reused prefix shows up as a low count
+            data["prompt_eval_count_avg"] = round(sum(c for c, _ in evals) / len(evals), 1)
+            data["prompt_eval_ms_avg"] = round(sum(ms for _, ms in evals) / len(evals), 1)
+        return data
+
+
+class RoleLimiter:
+    """Concurrency cap for one role, usable from worker threads and from coroutines."""
+
+    def __init__(self, role: str, limit: int):
+        self.role = role
+        self.limit = limit
+        self._sem = threading.BoundedSemaphore(limit)
+        self._stats_lock = threading.Lock()
+        self.in_flight = 0
+        self.waiting = 0
+        self.completed = 0
+        self.total_wait_s = 0.0
+        self.latency = LatencyStats()
+
+    def _enter(self, waited: float):
+        with self._stats_lock:
+            self.waiting -= 1
+            self.in_flight += 1
+            self.total_wait_s += waited
+
+    def _exit(self):
+        with self._stats_lock:
+            self.in_flight -= 1
+            self.completed += 1
+        self._sem.release()
+
+    def _queue(self):
+        with self._stats_lock:
+            self.waiting += 1
+
+    @contextmanager
+    def slot(self):
+        self._queue()
+        start = time.monotonic()
+        self._sem.acquire()
+        self._enter(time.monotonic() - start)
+        try:
+            yield
+        finally:
+            self._exit()
+
+    @asynccontextmanager
+    async def aslot(self):
+        # Poll instead of blocking the event loop; cancellation while waiting never leaks a slot
+        self._queue()
+        start = time.monotonic()
+        try:
+            while not self._sem.acquire(blocking=False):
+                await asyncio.sleep(0.05)
+        except BaseException:
+            with self._stats_lock:
+                self.waiting -= 1
+            raise
+        self._enter(time.monotonic() - start)
+        try:
+            yield
+        finally:
+            self._exit()
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            return {
+                "limit": self.limit,
+                "in_flight": self.in_flight,
+                "waiting": self.waiting,
+                "completed": self.completed,
+                "avg_wait_ms": round(self.total_wait_s / self.completed * 1000, 1) if self.completed else 0.0,
+                "latency": self.latency.stats(),
+            }
+
+
+_limiters = {role: RoleLimiter(role, _concurrency_for(role)) for role in ROLE_DEFAULTS}
+
+
+class RoleChatOllama(ChatOllama):
+    """ChatOllama that holds its role's concurrency slot for the whole call or stream."""
+
+    role: str = "chat"
+
+    def _generate(self, *args, **kwargs):
+        with _limiters[self.role].slot():
+            return super()._generate(*args, **kwargs)
+
+    def _stream(self, *args, **kwargs):
+        limiter = _limiters[self.role]
+        with limiter.slot():
+            start = time.monotonic()
+            first = True
+            for chunk in super()._stream(*args, **kwargs):
+                if first and chunk.text:
+                    limiter.latency.record_ttft(time.monotonic() - start)
+                    first = False
+                if chunk.generation_info:
+                    limiter.latency.record_generation(chunk.generation_info)
+                yield chunk
+
+    async def _agenerate(self, *args, **kwargs):
+        async with _limiters[self.role].aslot():
+            return await super()._agenerate(*args, **kwargs)
+
+    async def _astream(self, *args, **kwargs):
+        limiter = _limiters[self.role]
+        async with limiter.aslot():
+            start = time.monotonic()
+            first = True
+            async for chunk in super()._astream(*args, **kwargs):
+                if first and chunk.text:
+                    limiter.latency.record_ttft(time.monotonic() - start)
+                    first = False
+                if chunk.generation_info:
+                    limiter.latency.record_generation(chunk.generation_info)
+                yield chunk
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+_transport = {}
+
+
+def _share_transport(llm: ChatOllama):
+    """
+    Point the client at the first client's ollama.Client / AsyncClient so every
+    role reuses the same keep-alive connection pool to the Ollama server.
+    """
+    for attr in ("_client", "_async_client"):
+        client = getattr(llm, attr, None)
+        if client is None:
+            continue
+        shared = _transport.setdefault(attr, client)
+        if shared is not client:
+            setattr(llm, attr, shared)
+
+
+def get_llm(role: str, **overrides) -> ChatOllama:
+    """Return the shared client for `role` with optional per-service overrides."""
+    if role not in ROLE_DEFAULTS:
+        raise ValueError(f"Unknown LLM role: {role}")
+
+    settings = {**ROLE_DEFAULTS[role], **overrides, **SHARED_OPTIONS}
+    key = (role, tuple(sorted(settings.items())))
+    llm = _clients.get(key)
+    if llm is not None:
+        return llm
+
+    with _clients_lock:
+        llm = _clients.get(key)
+        if llm is None:
+            llm = RoleChatOllama(model=OLLAMA_MODEL, base_url=OLLAMA_BASE_URL, role=role, **settings)
+            _share_transport(llm)
+            _clients[key] = llm
+            print(f"[LLM] Created {role} client {settings}")
+    return llm
+
+
+def get_llm_stats() -> dict:
+    return {
+        "clients": len(_clients),
+        "roles": {role: limiter.stats() for role, limiter in _limiters.items()},
+    }
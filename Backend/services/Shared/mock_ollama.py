@@ -0,0 +1,192 @@
+"""
+Minimal stand-in for the Ollama HTTP API, for checking request shapes and
+prompt-prefix reuse without a GPU or a pulled model.
+
+    cd Backend
+    python -m services.Shared.mock_ollama --port 11435
+    OLLAMA_BASE_URL=http://localhost:11435 python app.py
+
+It serves /api/chat, /api/generate (streaming NDJSON or single JSON),
+/api/tags and /api/show. Like the real server it keeps one cache per loaded
+model: a request whose rendered prompt starts with the previous prompt (plus
+the previous reply) only "evaluates" the new tokens, and a change of a
+load-time option such as num_ctx reloads the model and drops the cache.
+The reported prompt_eval_count and the simulated prompt evaluation delay
+follow from that, so time-to-first-token in get_llm_stats() shows the effect
+of a stable prompt prefix.
+
+Every request is logged as one line: model, options, keep_alive, message
+roles, prompt tokens, reused prefix tokens and whether the model was reloaded.
+"""
+
+import argparse
+import json
+import re
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+_TOKEN = re.compile(r"\w+|[^\w\s]|\s+")
+
+# Load-time options: a change makes the real server reload the model
+LOAD_OPTIONS = ("num_ctx", "num_gpu", "num_thread", "use_mmap")
+
+REPLY = "This is a mock reply from the local test server."
+
+
+def _tokens(text: str) -> list:
+    return _TOKEN.findall(text)
+
+
+def _render(body: dict) -> str:
+    if "messages" in body:
+        return "".join(f"<|{m.get('role')}|>{m.get('content', '')}<|end|>" for m in body["messages"]) + "<|assistant|>"
+    return f"{body.get('system', '')}<|user|>{body.get('prompt', '')}<|assistant|>"
+
+
+class _ModelSlot:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.load_key = None
+        self.cached = []  # tokens of the last prompt + reply
+
+
+class MockOllama:
+    def __init__(self, eval_ms_per_token: float, load_ms: float):
+        self.eval_ms_per_token = eval_ms_per_token
+        self.load_ms = load_ms
+        self._slots = {}
+        self._slots_lock = threading.Lock()
+
+    def _slot(self, model: str) -> _ModelSlot:
+        with self._slots_lock:
+            return self._slots.setdefault(model, _ModelSlot())
+
+    def evaluate(self, body: dict) -> dict:
+        """Simulate prompt evaluation; returns the timing fields of the final response"""
+        model = body.get("model", "")
+        options = body.get("options") or {}
+        load_key = tuple(options.get(name) for name in LOAD_OPTIONS)
+        prompt = _tokens(_render(body))
+
+        slot = self._slot(model)
+        with slot.lock:
+            reloaded = slot.load_key != load_key
+            load_s = 0.0
+            if reloaded:
+                slot.load_key = load_key
+                slot.cached = []
+                load_s = self.load_ms / 1000
+                time.sleep(load_s)
+
+            reused = 0
+            for a, b in zip(slot.cached, prompt):
+                if a != b:
+                    break
+                reused += 1
+            if reused == len(prompt):
+                reused -= 1  # the last prompt token is always evaluated
+            evaluated = len(prompt) - reused
+            eval_s = evaluated * self.eval_ms_per_token / 1000
+            time.sleep(eval_s)
+            slot.cached = prompt + _tokens(REPLY)
+
+        roles = ",".join(m.get("role", "?") for m in body.get("messages", [])) or "prompt"
+        print(
+            f"[MOCK-OLLAMA] model={model} options={json.dumps(options, sort_keys=True)} "
+            f"keep_alive={body.get('keep_alive')} format={body.get('format')} roles=[{roles}] "
+            f"prompt_tokens={len(prompt)} reused={reused} reloaded={reloaded}",
+            flush=True,
+        )
+        return {
+            "load_duration": int(load_s * 1e9),
+            "prompt_eval_count": evaluated,
+            "prompt_eval_duration": int(eval_s * 1e9),
+        }
+
+
+def _make_handler(server_state: MockOllama):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send_json(self, payload: dict, status: int = 200):
+            data = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path.rstrip("/") == "/api/tags":
+                self._send_json({"models": [{"name": "llama3.2:latest", "model": "llama3.2:latest"}]})
+            else:
+                self._send_json({"error": "not found"}, 404)
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            body = json.loads(self.rfile.read(length) or b"{}")
+            path = self.path.rstrip("/")
+            if path == "/api/show":
+                self._send_json({"modelfile": "", "parameters": "", "template": "", "details": {}})
+                return
+            if path not in ("/api/chat", "/api/generate"):
+                self._send_json({"error": "not found"}, 404)
+                return
+
+            start = time.monotonic()
+            timings = server_state.evaluate(body)
+            is_chat = path == "/api/chat"
+            reply = '{"mock": true}' if body.get("format") == "json" else REPLY
+
+            def frame(text: str, done: bool) -> dict:
+                payload = {"model": body.get("model"), "created_at": datetime.now(timezone.utc).isoformat(), "done": done}
+                if is_chat:
+                    payload["message"] = {"role": "assistant", "content": text}
+                else:
+                    payload["response"] = text
+                if done:
+                    payload.update(timings, done_reason="stop", eval_count=len(_tokens(reply)),
+                                 eval_duration=0, total_duration=int((time.monotonic() - start) * 1e9))
+                return payload
+
+            if body.get("stream", True) is False:
+                self._send_json(frame(reply, True))
+                return
+
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for text in [piece for piece in re.split(r"(\s+)", reply) if piece] + [None]:
+                line = json.dumps(frame(text or "", text is None)).encode("utf-8") + b"\n"
+                self.wfile.write(f"{len(line):x}\r\n".encode() + line + b"\r\n")
+                self.wfile.flush()
+            self.wfile.write(b"0\r\n\r\n")
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock Ollama server for request-shape and prompt-cache checks")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--eval-ms-per-token", type=float, default=0.5, help="simulated prompt evaluation cost")
+    parser.add_argument("--load-ms", type=float, default=1500, help="simulated model (re)load time")
+    args = parser.parse_args()
+
+    state = MockOllama(args.eval_ms_per_token, args.load_ms)
+    httpd = ThreadingHTTPServer((args.host, args.port), _make_handler(state))
+    print(f"[MOCK-OLLAMA] Listening on http://{args.host}:{args.port}", flush=True)
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""
+Incremental parsing of streamed roadmap markdown.
+
+The business roadmap (FiveToTenYear) and the crop plan (Planner) are long
+markdown documents with a fixed layout:
+
+    # Overview
+    # 1. <planner>          followed by "## Year N: ..." / "## Phase N: ..." blocks
+    # 2. <labor>
+    # 3. <sustainability>
+    # 4. <resilience>
+    # 5. <verdict>           followed by an optional DISCLAIMER
+
+`IncrementalRoadmapParser` is fed model tokens as they arrive, works line by
+line, and reports each section as soon as the header that closes it has been
+seen. Field values come from the service's own `parse_markdown_roadmap`, run
+on the text received so far, so every streamed section equals the matching
+field of the final dict, and the final dict is exactly what the blocking
+endpoint returns for the same text.
+"""
+
+import re
+from typing import Callable, Dict, Iterable, Iterator, List
+
+# Multi-language header mapping shared by both roadmap parsers.
+# We look for ANY of these patterns to demarcate sections
+ROADMAP_HEADERS = {
+    "overview": r'# (?:Overview|अवलोकन|आढावा|Crop Overview|फसल अवलोकन|पीक आढावा)',
+    "planner": r'# (?:1\. 10-Year Growth & Profit Planner|1\. 10-वर्षीय विकास और लाभ योजनाकार|1\. 10-वर्षांचे विकास आणि नफा नियोजक|1\. Crop Lifecycle Planner|1\. फसल जीवनचक्र योजनाकार|1\. पीक जीवनचक्र नियोजक)',
+    "labor": r'# (?:2\. Labor & Aging Analysis|2\. श्रम और उम्र बढ़ने का विश्लेषण|2\. श्रम आणि वृद्धत्व विश्लेषण|2\. Resource & Labor Management|2\. संसाधन और श्रम प्रबंधन|2\. संसाधन आणि श्रम व्यवस्थापन)',
+    "sustainability": r'# (?:3\. Sustainability & Succession|3\. स्थिरता और उत्तराधिकार|3\. शाश्वतता आणि उत्तराधिकार|3\. Quality & Harvest Sustainability|3\. गुणवत्ता और फसल स्थिरता|3\. गुणवत्ता आणि पीक शाश्वतता)',
+    "resilience": r'# (?:4\. Financial Resilience|4\. वित्तीय लचीलापन|4\. आर्थिक लवचिकता|4\. Market & Risk Management|4\. बाजार और जोखिम प्रबंधन|4\. बाजार आणि जोखीम व्यवस्थापन)',
+    "verdict": r'# (?:5\. Final Verdict|5\. अंतिम निर्णय|5\. अंतिम निकाल|5\. Final Harvest Verdict|5\. अंतिम फसल निर्णय|5\. अंतिम पीक निकाल)'
+}
+
+YEAR_HEADER = re.compile(r'## (?:Year|वर्ष|Phase) \d+:', re.IGNORECASE)
+
+# A header closes the text section that precedes it (same boundaries as parse_markdown_roadmap)
+_CLOSES = {
+    "planner": "overview",
+    "sustainability": "labor_analysis",
+    "resilience": "sustainability_plan",
+    "verdict": "resilience_strategy",
+}
+
+_HEADER_RES = {name: re.compile(pattern, re.IGNORECASE) for name, pattern in ROADMAP_HEADERS.items()}
+
+
+class IncrementalRoadmapParser:
+    """
+    Feed streamed text with `feed()`, then call `finish()`. Both return a list
+    of events:
+
+        {"type": "section", "section": "<field>", "content": "..."}
+        {"type": "year", "index": i, "year": {...}}
+        {"type": "done", "roadmap": {...}}       (finish() only, always last)
+    """
+
+    def __init__(self, parse: Callable[[str], Dict]):
+        self._parse = parse
+        self._text: List[str] = []   # complete lines received so far
+        self._partial = ""
+        self._year_open = False      # last "## Year N" block has not been closed yet
+        self._emitted_sections = set()
+        self._emitted_years = 0
+
+    def feed(self, chunk: str) -> List[Dict]:
+        events = []
+        self._partial += chunk
+        while "\n" in self._partial:
+            line, self._partial = self._partial.split("\n", 1)
+            self._text.append(line + "\n")
+            events.extend(self._on_line(line))
+        return events
+
+    def _on_line(self, line: str) -> List[Dict]:
+        stripped = line.strip()
+        if YEAR_HEADER.match(stripped):
+            was_open, self._year_open = self._year_open, True
+            # A new year header closes the previous year block
+            return self._emit(include_open_year=False) if was_open else []
+
+        header = next((name for name, regex in _HEADER_RES.items() if regex.match(stripped)), None)
+        if header is None:
+            return []
+        # Any top-level header also closes the planner's last year block
+        self._year_open = False
+        closes = _CLOSES.get(header)
+        return self._emit(include_open_year=True, sections=[closes] if closes else [])
+
+    def _emit(self, include_open_year: bool, sections: Iterable[str] = ()) -> List[Dict]:
+        roadmap = self._parse("".join(self._text).strip())
+        events = []
+        for field in sections:
+            if field not in self._emitted_sections:
+                self._emitted_sections.add(field)
+                events.append({"type": "section", "section": field, "content": roadmap.get(field, "")})
+
+        years = roadmap.get("years", [])
+        closed = len(years) if include_open_year else len(years) - 1
+        while self._emitted_years < closed:
+            events.append({"type": "year", "index": self._emitted_years, "year": years[self._emitted_years]})
+            self._emitted_years += 1
+        return events
+
+    def finish(self) -> List[Dict]:
+        if self._partial:
+            self._text.append(self._partial)
+            self._partial = ""
+        roadmap = self._parse("".join(self._text).strip())
+
+        events = []
+        for field in ("overview", "labor_analysis", "sustainability_plan", "resilience_strategy", "verdict", "disclaimer"):
+            if field not in self._emitted_sections and roadmap.get(field):
+                self._emitted_sections.add(field)
+                events.append({"type": "section", "section": field, "content": roadmap[field]})
+        years = roadmap.get("years", [])
+        while self._emitted_years < len(years):
+            events.append({"type": "year", "index": self._emitted_years, "year": years[self._emitted_years]})
+            self._emitted_years += 1
+
+        events.append({"type": "done", "roadmap": roadmap})
+        return events
+
+
+def stream_roadmap_events(llm, prompt: str, parse: Callable[[str], Dict]) -> Iterator[Dict]:
+    """Stream `prompt` through `llm`, yielding token events and parsed section events."""
+    parser = IncrementalRoadmapParser(parse)
+    stream = llm.stream(prompt)
+    try:
+        for message_chunk in stream:
+            token = message_chunk.content
+            if not token:
+                continue
+            yield {"type": "token", "chunk": token}
+            yield from parser.feed(token)
+    finally:
+        # Also runs when the client disconnects, stopping generation on the Ollama side
+        stream.close()
+    yield from parser.finish()
@@ -0,0 +1,68 @@
+"""
+Single-flight request coalescing.
+
+`SingleFlight.do(key, fn)` runs `fn` once per key at a time: the first caller
+(the leader) runs it, and callers arriving with the same key while it is in
+flight wait for that run and receive the same result, or the same exception.
+Nothing is remembered after the run completes; caching results is the job of
+the generation cache.
+"""
+
+import threading
+from typing import Any, Callable, Dict, Hashable
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: BaseException = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self.coalesced += 1
+                leader = False
+            else:
+                call = self._calls[key] = _Call()
+                self.leaders += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            if call.waiters:
+                print(f"[{self.name}] Shared one generation with {call.waiters} waiting request(s)")
+            call.done.set()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "in_flight_keys": len(self._calls),
+                "leaders": self.leaders,
+                "coalesced": self.coalesced,
+            }
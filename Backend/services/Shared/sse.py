@@ -0,0 +1,379 @@
+"""
+Server-Sent Events plumbing shared by the streaming routes.
+
+Every streaming route hands `sse_response` an iterator of JSON-serializable
+events and gets back a Flask `Response`.
+
+Resumable streams: the events are produced by a background thread into a
+short-lived, per-stream buffer, and the HTTP response only reads from that
+buffer. Each frame carries an SSE id of the form `<stream id>:<sequence>`:
+
+    id: 3f2a...:17
+    data: {"chunk": "..."}
+
+When a mobile connection drops, the client re-sends the same request with a
+`Last-Event-ID` header. If the stream is still buffered (and belongs to the
+same user), the response resumes after that frame while the original
+generation keeps running; nothing is regenerated. An id that cannot be
+resumed (expired buffer, restarted process, or a reconnect that reached
+another worker) is answered with 410 and `{"type": "restart"}` instead of
+quietly starting a second generation: the client already shows part of an
+answer, and a service such as the advisor would also record the question in
+its history twice. The client decides whether to discard the partial answer
+and ask again.
+
+Cancellation: if no client is attached for SSE_RESUME_GRACE seconds, the
+producer closes the event iterator. That raises `GeneratorExit` through the
+services and the LangChain stream and closes the HTTP stream to Ollama, so
+generation stops instead of running on to `num_predict`. Services should
+forward model streams with `yield from` (or close them in a `finally`) so
+the close reaches the HTTP stream.
+
+Frame coalescing: the first event is written as soon as it exists, so the
+time to first token is unchanged. After that, consecutive token events are
+merged into one frame per write, held for at most SSE_COALESCE_MS or until
+SSE_COALESCE_BYTES of text are pending. One JSON encode and one
+write/flush then carries many tokens instead of one. The frame id is that
+of its last event, so resuming still works. An idle stream sends a
+`: keep-alive` comment every SSE_HEARTBEAT seconds, which keeps proxies from
+timing out and also detects a client that has gone away while the model is
+still evaluating the prompt.
+
+Configuration (environment):
+    SSE_RESUME_GRACE     seconds a generation keeps running with no client attached (default: 20)
+    SSE_BUFFER_TTL       seconds a finished stream stays resumable (default: 120)
+    SSE_COALESCE_MS      longest a token is held back to share a frame (default: 40)
+    SSE_COALESCE_BYTES   pending text that flushes a frame early (default: 1024)
+    SSE_HEARTBEAT        seconds between keep-alive comments on an idle stream (default: 15)
+
+Long-lived subscriptions (e.g. the notification stream) are not
+generations and are not buffered: they format their own frames with
+`sse_frame` and are returned with `push_response`.
+
+Per-route counters (streams started, completed, cancelled, failed, resumed,
+tokens generated before a cancel, token budget left unspent, events and
+frames written) are reported by `get_stream_stats()`.
+"""
+
+import json
+import os
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from flask import Response, request
+
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no",
+    "Connection": "keep-alive",
+}
+
+RESUME_GRACE = float(os.getenv("SSE_RESUME_GRACE", "20"))
+BUFFER_TTL = float(os.getenv("SSE_BUFFER_TTL", "120"))
+COALESCE_WINDOW = float(os.getenv("SSE_COALESCE_MS", "40")) / 1000
+COALESCE_BYTES = int(os.getenv("SSE_COALESCE_BYTES", "1024"))
+HEARTBEAT_INTERVAL = float(os.getenv("SSE_HEARTBEAT", "15"))
+
+
+class StreamStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = 0
+        self.completed = 0
+        self.cancelled = 0
+        self.failed = 0
+        self.resumed = 0
+        self.unresumable = 0
+        self.cancelled_tokens = 0      # tokens generated for streams the client abandoned
+        self.tokens_saved_estimate = 0  # num_predict budget left unspent by cancelling
+        self.events_sent = 0
+        self.frames_sent = 0
+
+    def record(self, outcome: str, tokens: int = 0, budget: Optional[int] = None):
+        with self._lock:
+            if outcome == "started":
+                self.started += 1
+            elif outcome == "completed":
+                self.completed += 1
+            elif outcome == "failed":
+                self.failed += 1
+            elif outcome == "resumed":
+                self.resumed += 1
+            elif outcome == "unresumable":
+                self.unresumable += 1
+            elif outcome == "cancelled":
+                self.cancelled += 1
+                self.cancelled_tokens += tokens
+                if budget:
+                    self.tokens_saved_estimate += max(0, budget - tokens)
+
+    def record_frames(self, events: int, frames: int):
+        with self._lock:
+            self.events_sent += events
+            self.frames_sent += frames
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "started": self.started,
+                "completed": self.completed,
+                "cancelled": self.cancelled,
+                "failed": self.failed,
+                "resumed": self.resumed,
+                "unresumable": self.unresumable,
+                "cancelled_tokens": self.cancelled_tokens,
+                "tokens_saved_estimate": self.tokens_saved_estimate,
+                "events_sent": self.events_sent,
+                "frames_sent": self.frames_sent,
+            }
+
+
+_stats: Dict[str, StreamStats] = {}
+_stats_lock = threading.Lock()
+
+
+def _stats_for(name: str) -> StreamStats:
+    with _stats_lock:
+        return _stats.setdefault(name, StreamStats())
+
+
+def _close(iterator):
+    close = getattr(iterator, "close", None)
+    if close is not None:
+        close()
+
+
+def token_events(chunks: Iterable[str]) -> Iterator[Dict[str, Any]]:
+    """`{"chunk": ...}` events for a stream of text chunks, closing the stream when closed"""
+    stream = iter(chunks)
+    try:
+        for chunk in stream:
+            yield {"chunk": chunk}
+    finally:
+        _close(stream)
+
+
+def _default_error(e: Exception) -> dict:
+    return {"error": str(e)}
+
+
+def _is_token(event: Dict[str, Any]) -> bool:
+    # {"chunk": ...} from token_events, {"type": "token", "chunk": ...} from the roadmap streams
+    return "chunk" in event and (len(event) == 1 or (len(event) == 2 and event.get("type") == "token"))
+
+
+class StreamBuffer:
+    """Events of one generation, produced on a background thread and readable from any offset."""
+
+    def __init__(self, name: str, owner: Optional[str], stats: StreamStats):
+        self.id = uuid.uuid4().hex
+        self.name = name
+        self.owner = owner
+        self.stats = stats
+        self.events: List[Dict[str, Any]] = []
+        self.done = False
+        self.finished_at: Optional[float] = None
+        self.readers = 0
+        self.detached_at = time.monotonic()
+        self._cond = threading.Condition()
+
+    def start(self, events: Iterable[Dict[str, Any]], token_budget: Optional[int],
+              on_close: Optional[Callable[[], None]], error_event: Callable[[Exception], dict]):
+        thread = threading.Thread(
+            target=self._produce,
+            args=(events, token_budget, on_close, error_event),
+            name=f"sse-{self.name}-{self.id[:8]}",
+            daemon=True,
+        )
+        thread.start()
+
+    def _abandoned(self) -> bool:
+        with self._cond:
+            return self.readers == 0 and time.monotonic() - self.detached_at > RESUME_GRACE
+
+    def _append(self, event: Dict[str, Any]):
+        with self._cond:
+            self.events.append(event)
+            self._cond.notify_all()
+
+    def _produce(self, events, token_budget, on_close, error_event):
+        self.stats.record("started")
+        stream = iter(events)
+        tokens = 0
+        outcome = "completed"
+        try:
+            for event in stream:
+                if "chunk" in event:
+                    tokens += 1
+                self._append(event)
+                if self._abandoned():
+                    outcome = "cancelled"
+                    break
+        except Exception as e:
+            outcome = "failed"
+            print(f"[SSE] {self.name} stream error: {e}")
+            self._append(error_event(e))
+        finally:
+            # On a cancel this aborts the upstream model stream immediately
+            _close(stream)
+            self.stats.record(outcome, tokens, token_budget)
+            if outcome == "cancelled":
+                print(f"[SSE] {self.name} client gone for {RESUME_GRACE:g}s after {tokens} tokens, generation stopped")
+            if on_close is not None:
+                try:
+                    on_close()
+                except Exception as e:
+                    print(f"[SSE] {self.name} on_close failed: {e}")
+            with self._cond:
+                self.done = True
+                self.finished_at = time.monotonic()
+                self._cond.notify_all()
+
+    def _pending_text(self, seq: int) -> int:
+        # Caller holds the lock
+        return sum(len(event.get("chunk") or "") for event in self.events[seq:])
+
+    def _frames(self, batch: List[Dict[str, Any]], seq: int) -> Tuple[str, int]:
+        """Encode events starting at `seq`, merging runs of token events; returns (text, frame count)"""
+        frames = []
+        i = 0
+        while i < len(batch):
+            event = batch[i]
+            j = i + 1
+            if _is_token(event):
+                while j < len(batch) and _is_token(batch[j]) and batch[j].get("type") == event.get("type"):
+                    j += 1
+                if j - i > 1:
+                    event = {**event, "chunk": "".join(e["chunk"] for e in batch[i:j])}
+            frames.append(f"id: {self.id}:{seq + j - 1}\ndata: {json.dumps(event)}\n\n")
+            i = j
+        return "".join(frames), len(frames)
+
+    def read(self, start: int) -> Iterator[str]:
+        """SSE frames from sequence number `start` until the generation ends or the client leaves"""
+        with self._cond:
+            self.readers += 1
+        try:
+            seq = start
+            last_write = None
+            while True:
+                with self._cond:
+                    idle_since = time.monotonic()
+                    while seq >= len(self.events) and not self.done:
+                        remaining = idle_since + HEARTBEAT_INTERVAL - time.monotonic()
+                        if remaining <= 0:
+                            break
+                        self._cond.wait(timeout=remaining)
+                    # Hold tokens back briefly so several share one frame; never the first one
+                    while last_write is not None and not self.done and seq < len(self.events):
+                        remaining = last_write + COALESCE_WINDOW - time.monotonic()
+                        if remaining <= 0 or self._pending_text(seq) >= COALESCE_BYTES:
+                            break
+                        self._cond.wait(timeout=remaining)
+                    batch = self.events[seq:]
+                    finished = self.done
+
+                if batch:
+                    text, frames = self._frames(batch, seq)
+                    self.stats.record_frames(len(batch), frames)
+                    yield text
+                    seq += len(batch)
+                    last_write = time.monotonic()
+                elif not finished:
+                    yield ": keep-alive\n\n"
+                if finished and seq >= len(self.events):
+                    return
+        finally:
+            with self._cond:
+                self.readers -= 1
+                self.detached_at = time.monotonic()
+
+    def expired(self, now: float) -> bool:
+        return self.done and now - self.finished_at > BUFFER_TTL
+
+
+_buffers: Dict[str, StreamBuffer] = {}
+_buffers_lock = threading.Lock()
+
+
+def _register(buffer: StreamBuffer):
+    now = time.monotonic()
+    with _buffers_lock:
+        for stream_id in [sid for sid, b in _buffers.items() if b.expired(now)]:
+            del _buffers[stream_id]
+        _buffers[buffer.id] = buffer
+
+
+def _resume_point(owner: Optional[str]):
+    """(buffer, next sequence) for a resumable Last-Event-ID header, else None"""
+    last_event_id = request.headers.get("Last-Event-ID", "")
+    stream_id, _, seq = last_event_id.partition(":")
+    if not stream_id or not seq.isdigit():
+        return None
+    with _buffers_lock:
+        buffer = _buffers.get(stream_id)
+    if buffer is None or buffer.owner != owner or buffer.expired(time.monotonic()):
+        return None
+    return buffer, int(seq) + 1
+
+
+def _restart_response(events) -> Response:
+    _close(events)  # never started
+    body = json.dumps({"type": "restart", "error": "Stream can no longer be resumed"})
+    return Response(body, status=410, mimetype="application/json")
+
+
+def sse_frame(event: Dict[str, Any]) -> str:
+    return f"data: {json.dumps(event)}\n\n"
+
+
+def push_response(frames: Iterable[str], on_close: Optional[Callable[[], None]] = None) -> Response:
+    """
+    Stream pre-formatted frames of a long-lived subscription as they are produced.
+    `on_close` runs when the server closes the response, even if the client went
+    away before the body was read and `frames` never started.
+    """
+    response = Response(frames, mimetype="text/event-stream", headers=SSE_HEADERS)
+    if on_close is not None:
+        response.call_on_close(on_close)
+    return response
+
+
+def get_stream_stats() -> dict:
+    with _stats_lock:
+        names = list(_stats)
+    with _buffers_lock:
+        buffered = len(_buffers)
+    return {"buffered_streams": buffered, "routes": {name: _stats[name].stats() for name in names}}
+
+
+def sse_response(name: str, events: Iterable[Dict[str, Any]],
+                 token_budget: Optional[int] = None,
+                 on_close: Optional[Callable[[], None]] = None,
+                 error_event: Callable[[Exception], dict] = _default_error) -> Response:
+    """
+    Stream `events` as resumable `data:` frames. `on_close` runs once the
+    generation has finished, failed or been cancelled, after the event
+    iterator is closed (e.g. to persist a session that may hold a partial answer).
+    """
+    stats = _stats_for(name)
+    owner = (getattr(request, "user", None) or {}).get("uid")
+
+    resume = _resume_point(owner)
+    if resume is None and request.headers.get("Last-Event-ID"):
+        stats.record("unresumable")
+        print(f"[SSE] {name} cannot resume {request.headers.get('Last-Event-ID')[:12]}..., asking client to restart")
+        return _restart_response(events)
+    if resume is not None:
+        buffer, start = resume
+        _close(events)  # never started, so nothing is generated twice
+        stats.record("resumed")
+        print(f"[SSE] {name} resuming stream {buffer.id[:8]} at event {start}")
+    else:
+        buffer, start = StreamBuffer(name, owner, stats), 0
+        _register(buffer)
+        buffer.start(events, token_budget, on_close, error_event)
+
+    return Response(buffer.read(start), mimetype="text/event-stream", headers=SSE_HEADERS)
@@ -0,0 +1,154 @@
+"""
+Compare the waste chat prompt built from the whole analysis (json.dumps(indent=2),
+the previous behaviour) with the retrieved sections from context_index.
+
+    cd Backend/services/WasteToValue/src
+    python benchmark_chat_context.py                      # built-in sample analysis
+    python benchmark_chat_context.py --context result.json
+    python benchmark_chat_context.py --ollama             # also time real requests
+
+Without --ollama it reports prompt size (characters and estimated tokens) and
+retrieval time per question. With --ollama it sends both variants to the
+Ollama server (OLLAMA_BASE_URL / OLLAMA_MODEL) and reports the server's
+prompt_eval_count, time to first token and total time.
+"""
+
+import argparse
+import json
+import os
+import time
+import urllib.request
+
+from context_index import get_context_index
+from prompts import WASTE_CHAT_SYSTEM_PROMPT
+
+QUESTIONS = [
+    "What equipment do I need to make vermicompost?",
+    "How much money can I earn from selling the leaves to a paper mill?",
+    "Which option is best for a small farmer?",
+    "How urgent is it to act on the banana stem fibre option?",
+    "Can I do the fibre extraction myself at home?",
+]
+
+SECTION_TITLES = [
+    "Plant Part", "Pathway Type", "Technical Basis", "Manufacturing Option (DIY)", "3rd-Party Selling Option",
+    "Average Recovery Value", "Value Recovery Percentage", "Equipment Needed", "Action Urgency",
+]
+
+
+def _sample_analysis() -> dict:
+    """A banana waste analysis in the legacy schema returned by analyze_waste"""
+    def option(idx, title, subtitle, words):
+        return {
+            "id": f"opt{idx}",
+            "title": title,
+            "subtitle": subtitle,
+            "fullDetails": {
+                "title": title,
+                "basicIdea": [f"Turn banana {words[0]} into {words[1]}", f"Sell locally or to {words[2]}"],
+                "sections": [
+                    {"title": name, "content": [f"{name} for {title}: {' '.join(words)} details, step {n}" for n in range(3)]}
+                    for name in SECTION_TITLES
+                ],
+            },
+        }
+
+    return {
+        "crop": "Banana",
+        "conclusion": {
+            "title": "Final Recommendation",
+            "highlight": "Banana Stem Fibre",
+            "explanation": "Fibre extraction gives the highest value per acre with a small decorticator; start after harvest.",
+        },
+        "options": [
+            option(1, "Banana Stem Fibre", "Extract fibre for ropes and handicrafts", ["stem", "fibre", "handicraft units", "decorticator"]),
+            option(2, "Vermicompost", "Compost leaves and pseudostem with earthworms", ["leaves", "vermicompost", "nurseries", "pits"]),
+            option(3, "Paper Pulp", "Sell leaves and sheaths to paper mills", ["sheaths", "pulp", "paper mill", "baling"]),
+        ],
+    }
+
+
+def _estimate_tokens(text: str) -> int:
+    return len(text) // 4
+
+
+def _ollama_chat(system: str, question: str) -> dict:
+    base_url = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434").rstrip("/")
+    body = {
+        "model": os.getenv("OLLAMA_MODEL", "llama3.2"),
+        "messages": [{"role": "system", "content": system}, {"role": "user", "content": question}],
+        "stream": True,
+        "options": {"num_ctx": int(os.getenv("OLLAMA_NUM_CTX", "4096")), "num_predict": 64},
+        "keep_alive": os.getenv("OLLAMA_KEEP_ALIVE", "30m"),
+    }
+    request = urllib.request.Request(
+        f"{base_url}/api/chat", data=json.dumps(body).encode("utf-8"), headers={"Content-Type": "application/json"}
+    )
+    start = time.monotonic()
+    ttft = None
+    final = {}
+    with urllib.request.urlopen(request, timeout=300) as response:
+        for line in response:
+            frame = json.loads(line)
+            if ttft is None and frame.get("message", {}).get("content"):
+                ttft = time.monotonic() - start
+            if frame.get("done"):
+                final = frame
+    return {
+        "prompt_eval_count": final.get("prompt_eval_count"),
+        "ttft_ms": round((ttft or 0) * 1000),
+        "total_ms": round((time.monotonic() - start) * 1000),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--context", help="JSON file with an analyze_waste result")
+    parser.add_argument("--ollama", action="store_true", help="send both prompt variants to Ollama")
+    args = parser.parse_args()
+
+    if args.context:
+        with open(args.context, encoding="utf-8") as f:
+            context = json.load(f)
+    else:
+        context = _sample_analysis()
+    context_str = json.dumps(context)  # what the frontend sends
+
+    start = time.perf_counter()
+    index = get_context_index(context_str)
+    build_ms = (time.perf_counter() - start) * 1000
+    print(f"Indexed {len(index.chunks)} chunks in {build_ms:.2f} ms")
+
+    full_context = json.dumps(context, indent=2)
+    full_prompt = WASTE_CHAT_SYSTEM_PROMPT.format(context=full_context, language="English")
+    rows = []
+    for question in QUESTIONS:
+        start = time.perf_counter()
+        retrieved = get_context_index(context_str).prompt_context(question)
+        search_ms = (time.perf_counter() - start) * 1000
+        prompt = WASTE_CHAT_SYSTEM_PROMPT.format(context=retrieved, language="English")
+        row = {
+            "question": question,
+            "full_tokens": _estimate_tokens(full_prompt),
+            "retrieved_tokens": _estimate_tokens(prompt),
+            "retrieval_ms": round(search_ms, 3),
+        }
+        if args.ollama:
+            row["full"] = _ollama_chat(full_prompt, question)
+            row["retrieved"] = _ollama_chat(prompt, question)
+        rows.append(row)
+
+    for row in rows:
+        reduction = 100 * (1 - row["retrieved_tokens"] / row["full_tokens"])
+        print(f"\n{row['question']}")
+        print(f"  est. prompt tokens: full {row['full_tokens']}  retrieved {row['retrieved_tokens']}  "
+              f"(-{reduction:.0f}%), retrieval {row['retrieval_ms']} ms")
+        if args.ollama:
+            for variant in ("full", "retrieved"):
+                r = row[variant]
+                print(f"  {variant:>9}: prompt_eval_count {r['prompt_eval_count']}, "
+                      f"first token {r['ttft_ms']} ms, total {r['total_ms']} ms")
+
+
+if __name__ == "__main__":
+    main()
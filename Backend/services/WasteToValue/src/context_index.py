@@ -0,0 +1,171 @@
+"""
+Section-level retrieval over a waste analysis for follow-up chat questions.
+
+A waste analysis (the `analyze_waste` result the frontend sends back as chat
+context) has up to N options with nine sections each. Instead of pasting all
+of it into every prompt, the analysis is split once into small chunks:
+
+    - one overview chunk per option (title, subtitle, basic idea)
+    - one chunk per option section ("Equipment Needed", "Average Recovery Value", ...)
+    - the conclusion, which is always sent
+
+and indexed with Okapi BM25. Each question is answered with the conclusion
+plus the top-scoring chunks. Every chunk carries its option title, so "what
+machine do I need for biochar?" matches that option's equipment section.
+Questions that match nothing (e.g. "which is best?") get the option
+overviews instead.
+
+Indexes are cached per context hash, so follow-up questions on the same
+analysis reuse it.
+"""
+
+import hashlib
+import json
+import math
+import re
+import threading
+import unicodedata
+from collections import Counter, OrderedDict
+from typing import List, Tuple, Union
+
+# `\w` alone does not match Devanagari vowel signs and viramas, which would split
+# "क्या" into "क", "य"; the block range keeps Hindi/Marathi words whole
+_WORD = re.compile(r"[\w\u0900-\u097F]+", re.UNICODE)
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+TOP_K = 4
+INDEX_CACHE_SIZE = 128
+
+# Frequent question words that say nothing about which section is relevant
+_STOPWORDS = {
+    "a", "an", "the", "is", "are", "do", "does", "i", "me", "my", "we", "you", "it", "this", "that",
+    "what", "which", "how", "can", "should", "for", "of", "to", "in", "on", "and", "or", "with",
+    "क्या", "है", "हैं", "मैं", "के", "की", "का", "में", "को", "कैसे", "से", "हूँ", "मुझे", "कौन", "सा",
+    "काय", "आहे", "मी", "कसे", "ला", "मला", "आणि", "कोणता", "कोणते", "चा", "ची", "चे",
+}
+
+
+def _tokenize(text: str) -> List[str]:
+    text = unicodedata.normalize("NFC", text.casefold())
+    return [t for t in _WORD.findall(text) if t not in _STOPWORDS]
+
+
+def _text(value) -> str:
+    if isinstance(value, (list, tuple)):
+        return "; ".join(_text(v) for v in value if v)
+    if isinstance(value, dict):
+        return "; ".join(f"{k}: {_text(v)}" for k, v in value.items() if v)
+    return " ".join(str(value).split())
+
+
+def split_analysis(context: dict) -> Tuple[List[str], str]:
+    """Return (chunks, conclusion) for a waste analysis in the legacy or flat schema"""
+    chunks = []
+    for option in context.get("options") or []:
+        if not isinstance(option, dict):
+            chunks.append(_text(option))
+            continue
+        details = option.get("fullDetails") or {}
+        title = _text(option.get("title") or details.get("title") or "")
+        overview = f"Option: {title}"
+        if option.get("subtitle"):
+            overview += f" - {_text(option['subtitle'])}"
+        basic_idea = details.get("basicIdea") or option.get("basicIdea")
+        if basic_idea:
+            overview += f"\nIdea: {_text(basic_idea)}"
+        chunks.append(overview)
+
+        sections = details.get("sections")
+        if sections is None:
+            # Flat schema: section titles are keys of the option itself
+            skip = {"id", "title", "subtitle", "basicIdea", "fullDetails"}
+            sections = [{"title": k, "content": v} for k, v in option.items() if k not in skip]
+        for section in sections:
+            content = _text(section.get("content", ""))
+            if content and content != "N/A":
+                chunks.append(f"[{title}] {section.get('title', '')}: {content}")
+
+    conclusion_text = _text(context.get("conclusion") or "")
+    if context.get("crop"):
+        conclusion_text = f"Crop: {_text(context['crop'])}\n{conclusion_text}"
+    return chunks, conclusion_text
+
+
+class ContextIndex:
+    """BM25 index over the chunks of one analysis."""
+
+    def __init__(self, chunks: List[str], conclusion: str, overviews: List[int]):
+        self.chunks = chunks
+        self.conclusion = conclusion
+        self.overviews = overviews
+        self._tf = [Counter(_tokenize(chunk)) for chunk in chunks]
+        self._lengths = [sum(tf.values()) for tf in self._tf]
+        self._avg_length = (sum(self._lengths) / len(self._lengths)) if self._lengths else 0.0
+        df = Counter(term for tf in self._tf for term in tf)
+        n = len(chunks)
+        self._idf = {term: math.log(1 + (n - freq + 0.5) / (freq + 0.5)) for term, freq in df.items()}
+
+    def _score(self, i: int, terms: List[str]) -> float:
+        tf = self._tf[i]
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * self._lengths[i] / (self._avg_length or 1))
+        score = 0.0
+        for term in terms:
+            freq = tf.get(term)
+            if freq:
+                score += self._idf[term] * freq * (BM25_K1 + 1) / (freq + norm)
+        return score
+
+    def search(self, question: str, k: int = TOP_K) -> List[str]:
+        """Top-k chunks for the question, in document order"""
+        terms = _tokenize(question)
+        scored = [(self._score(i, terms), i) for i in range(len(self.chunks))]
+        hits = sorted((item for item in scored if item[0] > 0), reverse=True)[:k]
+        picked = sorted(i for _, i in hits) if hits else self.overviews
+        return [self.chunks[i] for i in picked]
+
+    def _with_conclusion(self, chunks: List[str]) -> str:
+        return "\n".join(chunks + [f"Conclusion: {self.conclusion}"] if self.conclusion else chunks)
+
+    def prompt_context(self, question: str, k: int = TOP_K) -> str:
+        return self._with_conclusion(self.search(question, k))
+
+    def full_text(self) -> str:
+        return self._with_conclusion(self.chunks)
+
+
+_indexes: "OrderedDict[str, ContextIndex]" = OrderedDict()
+_indexes_lock = threading.Lock()
+
+
+def _build(context: Union[dict, str]) -> ContextIndex:
+    if isinstance(context, str):
+        try:
+            context = json.loads(context)
+        except ValueError:
+            # Not an analysis: index paragraphs of the raw text
+            paragraphs = [p.strip() for p in re.split(r"\n\s*\n", context) if p.strip()]
+            return ContextIndex(paragraphs, "", list(range(min(len(paragraphs), TOP_K))))
+    if not isinstance(context, dict):
+        context = {"options": context if isinstance(context, list) else [context]}
+    chunks, conclusion = split_analysis(context)
+    overviews = [i for i, chunk in enumerate(chunks) if chunk.startswith("Option: ")]
+    return ContextIndex(chunks, conclusion, overviews)
+
+
+def get_context_index(context: Union[dict, str]) -> ContextIndex:
+    """Index for this analysis, built on first use and cached by content hash"""
+    raw = context if isinstance(context, str) else json.dumps(context, sort_keys=True, ensure_ascii=False)
+    key = hashlib.sha256(raw.encode("utf-8")).hexdigest()
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is not None:
+            _indexes.move_to_end(key)
+            return index
+
+    index = _build(context)
+    with _indexes_lock:
+        _indexes[key] = index
+        while len(_indexes) > INDEX_CACHE_SIZE:
+            _indexes.popitem(last=False)
+    return index
@@ -9,6 +9,7 @@ import json
 current_dir = os.path.dirname(os.path.abspath(__file__))
 sys.path.append(current_dir)
 sys.path.append(os.path.abspath(os.path.join(current_dir, "../../")))
+sys.path.append(os.path.abspath(os.path.join(current_dir, "../../../")))  # Backend/, for services.Shared
 
 from langchain_core.messages import HumanMessage, AIMessage
 
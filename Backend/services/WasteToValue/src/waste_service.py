@@ -1,36 +1,47 @@
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_ollama import ChatOllama
-from langchain_core.output_parsers import JsonOutputParser
-from prompts import WASTE_TO_VALUE_SYSTEM_PROMPT, GUARDRAIL_PROMPT
-import json
-
-import os
+from services.Shared.llm_registry import get_llm
+from services.Shared.generation_cache import get_generation_cache
+from langchain_core.output_parsers import JsonOutputParser, StrOutputParser
+from prompts import WASTE_TO_VALUE_SYSTEM_PROMPT, GUARDRAIL_PROMPT, WASTE_CHAT_SYSTEM_PROMPT
+from context_index import get_context_index
 
 class WasteToValueEngine:
     def __init__(self):
-        model_name = os.getenv("OLLAMA_MODEL", "llama3.2")
-        base_url = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
-        
-        self.json_llm = ChatOllama(
-            model=model_name,
+        self.json_llm = get_llm(
+            "json",
             temperature=0.2,
-            format="json",
-            base_url=base_url,
             num_predict=3072
         )
         
         # LLM for chat (No JSON enforcement)
-        self.chat_llm = ChatOllama(
-            model=model_name,
+        self.chat_llm = get_llm(
+            "chat",
             temperature=0.4,
-            base_url=base_url,
             num_predict=1200 # Balanced num_predict for streaming
         )
 
+        # Built once; rules come before the retrieved context so the prompt prefix is stable
+        chat_prompt = ChatPromptTemplate.from_messages([
+            ("system", WASTE_CHAT_SYSTEM_PROMPT),
+            ("human", "{question}"),
+        ])
+        self.chat_chain = chat_prompt | self.chat_llm | StrOutputParser()
+
     def analyze_waste(self, crop_name: str, language: str = "English") -> dict:
         """
         Analyzes the crop waste and returns structured JSON recommendations.
+        Results are cached per (prompt, model, crop, language); failures are not cached.
         """
+        return get_generation_cache().cached(
+            "waste_analysis",
+            WASTE_TO_VALUE_SYSTEM_PROMPT + GUARDRAIL_PROMPT,
+            self.json_llm,
+            {"crop": crop_name, "language": language},
+            lambda: self._analyze_waste(crop_name, language),
+            is_cacheable=lambda result: "error" not in result,
+        )
+
+    def _analyze_waste(self, crop_name: str, language: str) -> dict:
         prompt = ChatPromptTemplate.from_messages([
             ("system", WASTE_TO_VALUE_SYSTEM_PROMPT + "\n" + GUARDRAIL_PROMPT),
             ("human", "{input}"),
@@ -131,49 +142,18 @@ class WasteToValueEngine:
         if len(options) < 1:
             raise ValueError("Generated 0 options; LLM failed to provide valid recommendations.")
 
-    def chat_waste(self, context: dict, user_question: str, language: str = "English") -> str:
+    def chat_waste(self, context, user_question: str, language: str = "English") -> str:
         """
         Answers user questions based on the detailed waste analysis context (Synchronous).
+        Only the sections relevant to the question (plus the conclusion) are sent.
         """
-        chat_prompt = ChatPromptTemplate.from_messages([
-            ("system", """You are a helpful agricultural expert assistant.
-            The user has just received an analysis for converting specific crop waste into value.
-            
-            CONTEXT (The analysis results):
-            {{context_str}}
-            
-            YOUR GOAL:
-            Answer the user's question specifically based on the options provided in the context.
-            Respond in the specified LANGUAGE: {language}.
-            
-            FORMATTING RULES:
-            - Use **Bold** for key numbers, machine names, and prices.
-            - Use bullet points (•) for lists to make them readable.
-            - **ALWAYS use double newlines** between paragraphs.
-            - Keep responses concise but well-structured.
-            - Be encouraging and practical (Indian context).
-            
-            Do not hallucinate new options not in the context unless asked for alternatives.
-            """),
-            ("human", "{question}"),
-        ])
-        
-        # We use a string output parser for chat, not JSON
-        from langchain_core.output_parsers import StrOutputParser
-        
-        # Use the non-JSON chat LLM
-        chat_chain = chat_prompt.partial(language=language) | self.chat_llm | StrOutputParser()
-        
         try:
-            # Convert context dict to a readable string
-            context_str = json.dumps(context, indent=2)
-            
-            response = chat_chain.invoke({
-                "context_str": context_str, 
+            response = self.chat_chain.invoke({
+                "context": get_context_index(context).prompt_context(user_question),
+                "language": language,
                 "question": user_question
             })
             
-            
             return response
         except Exception as e:
             print(f"Error in Waste Chat: {e}")
@@ -181,43 +161,17 @@ class WasteToValueEngine:
             traceback.print_exc()
             return "I apologize, but I'm having trouble connecting to the knowledge base right now. Please try again."
 
-    def stream_chat_waste(self, context: dict, user_question: str, language: str = "English"):
+    def stream_chat_waste(self, context, user_question: str, language: str = "English"):
         """
         Answers user questions based on the detailed waste analysis context (Streaming).
         """
-        chat_prompt = ChatPromptTemplate.from_messages([
-            ("system", """You are a helpful agricultural expert assistant.
-            The user has just received an analysis for converting specific crop waste into value.
-            
-            CONTEXT (The analysis results):
-            {{context_str}}
-            
-            YOUR GOAL:
-            Answer the user's question specifically based on the options provided in the context.
-            Respond in the specified LANGUAGE: {language}.
-            
-            FORMATTING RULES:
-            - Use **Bold** for key numbers, machine names, and prices.
-            - Use bullet points (•) for lists to make them readable.
-            - **ALWAYS use double newlines** between paragraphs.
-            - Keep responses concise but well-structured.
-            - Be encouraging and practical (Indian context).
-            
-            Do not hallucinate new options not in the context unless asked for alternatives.
-            """),
-            ("human", "{question}"),
-        ])
-        
-        from langchain_core.output_parsers import StrOutputParser
-        chat_chain = chat_prompt.partial(language=language) | self.chat_llm | StrOutputParser()
-        
         try:
-            context_str = json.dumps(context, indent=2)
-            for chunk in chat_chain.stream({
-                "context_str": context_str, 
+            # yield from: closing this generator (client disconnect) closes the Ollama stream
+            yield from self.chat_chain.stream({
+                "context": get_context_index(context).prompt_context(user_question),
+                "language": language,
                 "question": user_question
-            }):
-                yield chunk
+            })
         except Exception as e:
             print(f"Error in Waste Stream Chat: {e}")
             yield "I apologize, but I'm having trouble connecting to the knowledge base right now. Please try again."
@@ -0,0 +1,29 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from context_index import _tokenize, get_context_index  # noqa: E402
+
+
+def test_hindi_words_stay_whole_and_stopwords_are_dropped():
+    tokens = _tokenize("क्या मैं केले के तने से रेशा बना सकता हूँ?")
+    assert tokens == ["केले", "तने", "रेशा", "बना", "सकता"]
+
+
+def test_marathi_stopwords_are_dropped():
+    assert _tokenize("मला गांडूळ खत कसे बनवायचे आहे?") == ["गांडूळ", "खत", "बनवायचे"]
+
+
+def test_hindi_question_retrieves_matching_section():
+    context = {
+        "crop": "केला",
+        "options": [
+            {"title": "केले का रेशा", "fullDetails": {"sections": [
+                {"title": "आवश्यक उपकरण", "content": ["रेशा निकालने की मशीन"]}]}},
+            {"title": "वर्मीकम्पोस्ट", "fullDetails": {"sections": [
+                {"title": "आवश्यक उपकरण", "content": ["गड्ढा और केंचुए"]}]}},
+        ],
+    }
+    hits = get_context_index(context).search("रेशा निकालने के लिए क्या मशीन चाहिए?", k=1)
+    assert hits == ["[केले का रेशा] आवश्यक उपकरण: रेशा निकालने की मशीन"]
@@ -9,6 +9,32 @@ class NewsService:
         if not self.api_key:
              print("Warning: GNEWS_API_KEY not found in environment variables.")
 
+        # Pooled keep-alive client, bound to the event loop it was created on
+        self._client = None
+        self._client_loop = None
+
+    def _get_client(self) -> httpx.AsyncClient:
+        """
+        Returns the shared AsyncClient, creating it on first use.
+        A new client is created if we are running on a different event loop
+        (httpx connections cannot be shared across loops).
+        """
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client.is_closed or self._client_loop is not loop:
+            self._client = httpx.AsyncClient(
+                timeout=10.0,
+                limits=httpx.Limits(max_connections=20, max_keepalive_connections=10, keepalive_expiry=60.0)
+            )
+            self._client_loop = loop
+        return self._client
+
+    async def aclose(self):
+        """Closes the pooled HTTP client."""
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+        self._client = None
+        self._client_loop = None
+
     async def get_personalized_news(self, crops: list, location: str = "India"):
         """
         Fetches personalized news based on crops and location.
@@ -28,21 +54,7 @@ class NewsService:
             "apikey": self.api_key
         }
         
-        async with httpx.AsyncClient() as client:
-            try:
-                response = await client.get(url, params=params, timeout=10.0)
-                response.raise_for_status()
-                data = response.json()
-                return self.preprocess_news(data)
-            except httpx.RequestError as e:
-                print(f"News API Request Error: {e}")
-                return {"error": f"Failed to connect to News API: {str(e)}"}
-            except httpx.HTTPStatusError as e:
-                print(f"News API Status Error: {e}")
-                return {"error": f"News API returned error: {e.response.status_code}"}
-            except Exception as e:
-                 print(f"News Service Error: {e}")
-                 return {"error": f"An unexpected error occurred: {str(e)}"}
+        return await self._fetch(url, params)
 
     async def get_general_news(self):
         """
@@ -62,21 +74,24 @@ class NewsService:
             "apikey": self.api_key
         }
         
-        async with httpx.AsyncClient() as client:
-            try:
-                response = await client.get(url, params=params, timeout=10.0)
-                response.raise_for_status()
-                data = response.json()
-                return self.preprocess_news(data)
-            except httpx.RequestError as e:
-                print(f"News API Request Error: {e}")
-                return {"error": f"Failed to connect to News API: {str(e)}"}
-            except httpx.HTTPStatusError as e:
-                print(f"News API Status Error: {e}")
-                return {"error": f"News API returned error: {e.response.status_code}"}
-            except Exception as e:
-                 print(f"News Service Error: {e}")
-                 return {"error": f"An unexpected error occurred: {str(e)}"}
+        return await self._fetch(url, params)
+
+    async def _fetch(self, url, params):
+        client = self._get_client()
+        try:
+            response = await client.get(url, params=params, timeout=10.0)
+            response.raise_for_status()
+            data = response.json()
+            return self.preprocess_news(data)
+        except httpx.RequestError as e:
+            print(f"News API Request Error: {e}")
+            return {"error": f"Failed to connect to News API: {str(e)}"}
+        except httpx.HTTPStatusError as e:
+            print(f"News API Status Error: {e}")
+            return {"error": f"News API returned error: {e.response.status_code}"}
+        except Exception as e:
+             print(f"News Service Error: {e}")
+             return {"error": f"An unexpected error occurred: {str(e)}"}
 
     def _generate_news_query(self, crops, location, personalized=True):
         """
@@ -77,13 +77,12 @@ const NotificationBell: React.FC = () => {
         ];
     }
 
-    // Fetch notifications on mount
+    // Subscribe on mount: the server pushes the list whenever it changes (no polling)
     useEffect(() => {
-        fetchNotifications();
-
-        // Poll every 5 minutes (300000ms) to keep updated without refresh
-        const interval = setInterval(fetchNotifications, 300000);
-        return () => clearInterval(interval);
+        const unsubscribe = api.subscribeNotifications((list: Notification[]) => {
+            setNotifications(list?.length ? list : getFallbackNotifications());
+        });
+        return unsubscribe;
     }, []);
 
     const fetchNotifications = async () => {
@@ -113,8 +112,16 @@ const NotificationBell: React.FC = () => {
         return () => document.removeEventListener('mousedown', handleClickOutside);
     }, []);
 
-    const markAllRead = () => {
+    // Optimistic: update the badge now, persist on the server, restore the list if that fails
+    const markAllRead = async () => {
+        const previous = notifications;
         setNotifications(prev => prev.map(n => ({ ...n, read: true })));
+        try {
+            await api.markNotificationsRead();
+        } catch (e) {
+            console.error(e);
+            setNotifications(previous);
+        }
     };
 
     const handleTriggerUpdate = async () => {
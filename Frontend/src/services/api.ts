@@ -65,40 +65,79 @@ export const api = {
         return res.json();
     },
 
-    stream: async (endpoint: string, body: any, onChunk: (text: string) => void, onError: (err: any) => void) => {
-        try {
-            const headers = await getHeaders();
-            const res = await fetch(`${BASE_URL}${endpoint}`, {
-                method: 'POST',
-                headers,
-                body: JSON.stringify(body)
-            });
-
-            if (res.status === 401) throw new Error("Unauthorized");
-            if (!res.ok) {
-                const errData = await res.json().catch(() => ({}));
-                throw new Error(errData.error || `HTTP Error ${res.status}`);
-            }
-            if (!res.body) throw new Error("No response body");
+    // Streams SSE token frames. Frames carry an id ("<stream id>:<seq>"); if the connection
+    // drops mid-answer, the request is re-sent with Last-Event-ID and the server resumes
+    // the same generation from the next frame instead of starting over.
+    // If the stream can no longer be resumed (410), or the server answers with a different
+    // stream, the partial answer must not be kept: onReset (if given) is called so the caller
+    // can clear it, otherwise the stream ends with an error instead of appending a second answer.
+    stream: async (endpoint: string, body: any, onChunk: (text: string) => void, onError: (err: any) => void,
+                   onReset?: () => void) => {
+        const MAX_RESUMES = 3;
+        let lastEventId = '';
+        let resumes = 0;
+        const streamIdOf = (eventId: string) => eventId.split(':')[0];
+
+        while (true) {
+            try {
+                const headers = await getHeaders();
+                if (lastEventId) headers['Last-Event-ID'] = lastEventId;
+                const res = await fetch(`${BASE_URL}${endpoint}`, {
+                    method: 'POST',
+                    headers,
+                    body: JSON.stringify(body)
+                });
 
-            const reader = res.body.getReader();
-            const decoder = new TextDecoder();
-            let buffer = '';
+                if (res.status === 401) throw new Error("Unauthorized");
+                if (res.status === 410 && lastEventId) {
+                    // Resuming is impossible (expired, restarted, or another worker): never regenerate silently
+                    if (onReset) onReset();
+                    throw new Error("The answer was interrupted and could not be resumed. Please ask again.");
+                }
+                if (!res.ok) {
+                    const errData = await res.json().catch(() => ({}));
+                    throw new Error(errData.error || `HTTP Error ${res.status}`);
+                }
+                if (!res.body) throw new Error("No response body");
 
-            while (true) {
-                const { done, value } = await reader.read();
-                if (done) break;
+                const reader = res.body.getReader();
+                const decoder = new TextDecoder();
+                let buffer = '';
+                const resumingFrom = lastEventId;
+                let checkedResume = !resumingFrom;
 
-                buffer += decoder.decode(value, { stream: true });
-                const lines = buffer.split('\n\n');
-                buffer = lines.pop() || ''; // Keep the last incomplete chunk in buffer
+                while (true) {
+                    const { done, value } = await reader.read();
+                    if (done) break;
 
-                for (const line of lines) {
-                    if (line.startsWith('data: ')) {
-                        try {
-                            const jsonStr = line.slice(6); // Remove 'data: '
-                            if (jsonStr.trim() === '[DONE]') continue;
+                    buffer += decoder.decode(value, { stream: true });
+                    const frames = buffer.split('\n\n');
+                    buffer = frames.pop() || ''; // Keep the last incomplete frame in buffer
+
+                    for (const frame of frames) {
+                        let jsonStr = '';
+                        let frameId = '';
+                        for (const line of frame.split('\n')) {
+                            if (line.startsWith('id: ')) frameId = line.slice(4);
+                            else if (line.startsWith('data: ')) jsonStr = line.slice(6);
+                        }
+                        if (frameId) {
+                            if (!checkedResume) {
+                                checkedResume = true;
+                                if (streamIdOf(frameId) !== streamIdOf(resumingFrom)) {
+                                    // The server started a different generation: its text replaces, not extends, ours
+                                    if (!onReset) {
+                                        await reader.cancel();
+                                        throw new Error("The answer was interrupted and could not be resumed. Please ask again.");
+                                    }
+                                    onReset();
+                                }
+                            }
+                            lastEventId = frameId;
+                        }
+                        if (!jsonStr || jsonStr.trim() === '[DONE]') continue;
 
+                        try {
                             const data = JSON.parse(jsonStr);
                             if (data.chunk) {
                                 onChunk(data.chunk);
@@ -106,13 +145,22 @@ export const api = {
                                 throw new Error(data.error);
                             }
                         } catch (e) {
-                            console.warn("Failed to parse SSE chunk:", line);
+                            console.warn("Failed to parse SSE chunk:", frame);
                         }
                     }
                 }
+                return;
+            } catch (error: any) {
+                // Network drop after some frames arrived: resume the same generation
+                const networkError = error instanceof TypeError;
+                if (networkError && lastEventId && resumes < MAX_RESUMES) {
+                    resumes += 1;
+                    await new Promise(resolve => setTimeout(resolve, 1000 * resumes));
+                    continue;
+                }
+                onError(error);
+                return;
             }
-        } catch (error) {
-            onError(error);
         }
     },
 
@@ -194,6 +242,81 @@ export const api = {
         }
     },
 
+    // Subscribes to /notifications/stream and calls onUpdate with the full list whenever it
+    // changes. Reconnects when the server rotates the connection or the network drops; if the
+    // stream is unavailable (503) it polls getNotifications until the Retry-After delay passes,
+    // and a tab whose stream was replaced by newer tabs of the same user keeps polling.
+    // Returns a function that closes the subscription.
+    subscribeNotifications: (onUpdate: (notifications: any[]) => void) => {
+        const controller = new AbortController();
+        const sleep = (ms: number) => new Promise(resolve => setTimeout(resolve, ms));
+
+        const run = async () => {
+            let failures = 0;
+            let pollOnly = false;
+            while (!controller.signal.aborted) {
+                if (pollOnly) {
+                    const data = await api.getNotifications();
+                    if (data.success && !controller.signal.aborted) onUpdate(data.notifications);
+                    await sleep(60000);
+                    continue;
+                }
+                try {
+                    const headers = await getHeaders();
+                    const res = await fetch(`${BASE_URL}/notifications/stream`, { headers, signal: controller.signal });
+                    if (res.status === 401) return;
+                    if (res.status === 503 || !res.ok || !res.body) {
+                        const retryAfter = Number(res.headers.get('Retry-After')) || 60;
+                        const data = await api.getNotifications();
+                        if (data.success) onUpdate(data.notifications);
+                        await sleep(retryAfter * 1000);
+                        continue;
+                    }
+
+                    failures = 0;
+                    const reader = res.body.getReader();
+                    const decoder = new TextDecoder();
+                    let buffer = '';
+                    while (true) {
+                        const { done, value } = await reader.read();
+                        if (done) break;
+                        buffer += decoder.decode(value, { stream: true });
+                        const frames = buffer.split('\n\n');
+                        buffer = frames.pop() || '';
+                        for (const frame of frames) {
+                            if (!frame.startsWith('data: ')) continue; // keep-alive comments
+                            try {
+                                const data = JSON.parse(frame.slice(6));
+                                if (data.type === 'notifications') onUpdate(data.notifications);
+                                else if (data.type === 'reconnect' && data.reason === 'replaced') pollOnly = true;
+                            } catch (e) {
+                                console.warn("Failed to parse notification frame:", frame);
+                            }
+                        }
+                    }
+                } catch (error: any) {
+                    if (controller.signal.aborted) return;
+                    failures += 1;
+                    await sleep(Math.min(30000, 1000 * 2 ** failures));
+                }
+            }
+        };
+
+        run();
+        return () => controller.abort();
+    },
+
+    markNotificationsRead: async (ids?: string[], read: boolean = true) => {
+        const headers = await getHeaders();
+        const res = await fetch(`${BASE_URL}/notifications/read`, {
+            method: 'POST',
+            headers,
+            body: JSON.stringify(ids ? { ids, read } : { read })
+        });
+        if (!res.ok) throw new Error("Failed to update notifications");
+        return res.json();
+    },
+
     getMandiPrices: async (crop: string, district: string) => {
         const headers = await getHeaders();
         const res = await fetch(`${BASE_URL}/mandi/prices?crop=${encodeURIComponent(crop)}&district=${encodeURIComponent(district)}`, { headers });